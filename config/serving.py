@@ -0,0 +1,103 @@
+"""
+Perfil de produção: ligações à base de dados e dimensionamento dos workers.
+
+Usado pelo gunicorn.conf.py (workers/threads) e pelas settings, para as
+opções de ligação do PostgreSQL:
+
+    from config.serving import database_pooling
+    DATABASES['default'].update(database_pooling())
+
+Tudo é configurável por variáveis de ambiente (ver README, secção 4).
+"""
+
+import importlib.util
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+POOL_PERSISTENT = 'persistent'  # Ligações persistentes por thread, com health check
+POOL_PSYCOPG = 'psycopg'        # Pool do psycopg 3 (Django >= 5.1), partilhado pelas threads do worker
+POOL_OFF = 'off'                # Uma ligação nova por pedido (comportamento antigo)
+
+# Secções que a API async do Dashboard Geral corre em simultâneo, cada uma com
+# a sua ligação (dados_dashboard_geral_async em dashboard/services.py)
+SECOES_ASYNC = 5
+
+
+def _int(env, name, default):
+    try:
+        return int(env.get(name, default))
+    except (TypeError, ValueError):
+        raise ImproperlyConfigured(f"{name} tem de ser um número inteiro.")
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
+
+
+def workers_threads(env=os.environ):
+    """
+    (workers, threads) do gunicorn. Com threads (gthread), menos processos:
+    CPUs + 1 workers com 4 threads cada; com workers síncronos, 2 x CPUs + 1.
+    """
+    worker_class = env.get('GUNICORN_WORKER_CLASS', 'gthread')
+    cpus = cpu_count()
+    if worker_class == 'gthread':
+        default_workers, default_threads = cpus + 1, 4
+    else:
+        default_workers, default_threads = 2 * cpus + 1, 1
+    return (
+        _int(env, 'WEB_CONCURRENCY', default_workers),
+        _int(env, 'GUNICORN_THREADS', default_threads),
+    )
+
+
+def ligacoes_por_worker(env=os.environ):
+    """
+    Ligações em simultâneo de um processo. WSGI: uma por thread (+ 2 de
+    folga). ASGI (uvicorn): cada pedido à API async usa SECOES_ASYNC, para
+    DB_ASGI_REQUESTS pedidos em simultâneo, mais 2 (a thread partilhada do
+    sync_to_async, que calcula a ETag e os filtros, e folga).
+    """
+    if env.get('GUNICORN_WORKER_CLASS', 'gthread').startswith('uvicorn'):
+        return _int(env, 'DB_ASGI_REQUESTS', 4) * SECOES_ASYNC + 2
+    _, threads = workers_threads(env)
+    return threads + 2
+
+
+def database_pooling(env=os.environ):
+    """
+    Chaves a juntar a DATABASES['default'] conforme DB_POOL_MODE:
+    - 'persistent' (defeito): CONN_MAX_AGE (DB_CONN_MAX_AGE, 60s) com
+      CONN_HEALTH_CHECKS, para não reutilizar ligações mortas;
+    - 'psycopg': pool do psycopg 3 (requer 'psycopg[binary,pool]'), com
+      DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE ligações por worker (por defeito,
+      ligacoes_por_worker());
+    - 'off': uma ligação por pedido.
+    """
+    mode = env.get('DB_POOL_MODE', POOL_PERSISTENT)
+    if mode == POOL_PERSISTENT:
+        return {
+            'CONN_MAX_AGE': _int(env, 'DB_CONN_MAX_AGE', 60),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    if mode == POOL_PSYCOPG:
+        if importlib.util.find_spec('psycopg_pool') is None:
+            raise ImproperlyConfigured("DB_POOL_MODE=psycopg requer 'pip install psycopg[binary,pool]'.")
+        return {
+            # Com pool, o Django exige CONN_MAX_AGE = 0 (a pool gere o tempo de vida)
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': _int(env, 'DB_POOL_MIN_SIZE', 2),
+                    'max_size': _int(env, 'DB_POOL_MAX_SIZE', ligacoes_por_worker(env)),
+                    'timeout': _int(env, 'DB_POOL_TIMEOUT', 10),
+                },
+            },
+        }
+    if mode == POOL_OFF:
+        return {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}
+    raise ImproperlyConfigured(f"DB_POOL_MODE inválido: '{mode}' (use persistent, psycopg ou off).")
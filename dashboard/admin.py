@@ -38,7 +38,7 @@ class ClientAdmin(admin.ModelAdmin):
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
     list_display = ('date', 'source', 'client', 'consultant', 'revenue_net')
-    list_filter = ('source', 'consultant', 'manager')
+    list_filter = ('source_ref', 'consultant', 'manager')
     search_fields = ('raw_client_name', 'raw_client_cnpj', 'client__client_name')
     date_hierarchy = 'date'
     raw_id_fields = ('client', 'consultant', 'manager')
@@ -63,5 +63,6 @@ class AuditLogAdmin(admin.ModelAdmin):
 # ---
 @admin.register(CommissionRule)
 class CommissionRuleAdmin(admin.ModelAdmin):
-    list_display = ('rule_name', 'source', 'percentage')
+    list_display = ('rule_name', 'source', 'percentage', 'valid_from', 'valid_to', 'min_revenue', 'max_revenue')
+    list_filter = ('source',)
     search_fields = ('rule_name', 'source')
\ No newline at end of file
@@ -0,0 +1,346 @@
+from datetime import date, datetime
+import json
+import os
+import shutil
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .categorias import cache_de
+from .models import PaymentType, Product, ProductDetail, Sale, SaleSource, SaleStatus
+
+try:
+    import duckdb
+except ImportError:  # Está em requirements.txt; sem ela a análise histórica fica indisponível
+    duckdb = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:  # Está em requirements.txt; sem ela não há exportação para Parquet
+    pyarrow = pq = None
+
+# ---
+# Análise histórica (Parquet + DuckDB)
+# ---
+# As tendências de vários anos e os cortes por produto/tipo de pagamento
+# seriam um full scan de dashboard_sale no PostgreSQL. Em vez disso:
+#   - o comando exportar_vendas_parquet copia as vendas para ficheiros
+#     Parquet, um por mês: <pasta>/year=AAAA/month=M/sales.parquet;
+#   - as APIs de análise leem esses ficheiros com o DuckDB (embebido, em
+#     memória), sem tocar no PostgreSQL além da sessão e do âmbito.
+#
+# A exportação é incremental. Cada mês tem uma impressão digital lida do
+# PostgreSQL (número de vendas e soma dos xmin, que mudam em qualquer
+# INSERT/UPDATE/DELETE, incluindo a reatribuição de consultores) e só os
+# meses cuja impressão mudou são reescritos. Cada ficheiro é escrito ao
+# lado e trocado com os.replace (quem está a ler nunca vê meio ficheiro);
+# o manifest.json é gravado no fim.
+#
+# Os meses são os do fuso horário das settings, como no resto do dashboard;
+# a coluna 'day' é a data local da venda e 'date' o instante em UTC.
+#
+# Usa o duckdb e o pyarrow (em requirements.txt) e a pasta em
+# settings.ANALYTICS_PARQUET_DIR (por defeito <BASE_DIR>/analytics/sales).
+
+MANIFESTO = 'manifest.json'
+FICHEIRO_MES = 'sales.parquet'
+EXPORT_BATCH_SIZE = 50_000
+DUCKDB_THREADS = 2
+DUCKDB_MEMORY_LIMIT = '512MB'
+
+# Categorias exportadas como texto (o Parquet guarda-as em dicionário)
+CATEGORIAS = (
+    ('source', SaleSource),
+    ('product_name', Product),
+    ('product_detail', ProductDetail),
+    ('payment_type', PaymentType),
+    ('status', SaleStatus),
+)
+# Dimensões aceites nas APIs (filtros e decomposição)
+DIMENSOES = tuple(campo for campo, _ in CATEGORIAS)
+GRANULARIDADES = ('month', 'quarter', 'year')
+
+COLUNAS_DB = (
+    'id', 'raw_id', 'date', 'day', 'consultant_id', 'manager_id', 'client_id', 'raw_client_cnpj',
+    'raw_client_name', 'revenue_gross', 'revenue_net', 'volume',
+) + tuple(f'{campo}_ref_id' for campo in DIMENSOES)
+
+
+class AnaliseIndisponivel(Exception):
+    """Sem DuckDB/pyarrow instalados ou sem exportação feita."""
+
+
+def pasta_parquet():
+    return getattr(settings, 'ANALYTICS_PARQUET_DIR', None) or os.path.join(settings.BASE_DIR, 'analytics', 'sales')
+
+
+def _esquema():
+    decimal = pyarrow.decimal128
+    return pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('raw_id', pyarrow.string()),
+        ('date', pyarrow.timestamp('us', tz='UTC')),
+        ('day', pyarrow.date32()),
+        *[(campo, pyarrow.string()) for campo in DIMENSOES],
+        ('consultant_id', pyarrow.int64()),
+        ('manager_id', pyarrow.int64()),
+        ('client_id', pyarrow.int64()),
+        ('raw_client_cnpj', pyarrow.int64()),
+        ('raw_client_name', pyarrow.string()),
+        ('revenue_gross', decimal(12, 2)),
+        ('revenue_net', decimal(12, 2)),
+        ('volume', decimal(12, 3)),
+    ])
+
+
+# --- Manifesto ---
+
+def ler_manifesto(directory=None):
+    """{'exported_at': ..., 'months': {'AAAA-MM': {...}}}, ou None se nunca houve exportação."""
+    try:
+        with open(os.path.join(directory or pasta_parquet(), MANIFESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _gravar_manifesto(directory, manifesto):
+    caminho = os.path.join(directory, MANIFESTO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(caminho + '.tmp', caminho)
+
+
+# --- Exportação ---
+
+def _inicio_mes(ano, mes):
+    return timezone.make_aware(datetime(ano, mes, 1))
+
+
+def _intervalo_mes(chave):
+    ano, mes = map(int, chave.split('-'))
+    seguinte = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return _inicio_mes(ano, mes), _inicio_mes(*seguinte)
+
+
+def _pasta_mes(directory, chave):
+    ano, mes = map(int, chave.split('-'))
+    return os.path.join(directory, f'year={ano}', f'month={mes}')
+
+
+def impressoes_mensais(using='default'):
+    """{'AAAA-MM': 'vendas:soma dos xmin'} de todos os meses com vendas (uma query)."""
+    linhas = (
+        Sale.objects.using(using)
+        .annotate(mes=TruncMonth('date'))
+        .values('mes')
+        .annotate(vendas=Count('id'), versao=Sum(RawSQL('"dashboard_sale"."xmin"::text::bigint', [])))
+        .values_list('mes', 'vendas', 'versao')
+    )
+    return {f"{timezone.localtime(mes):%Y-%m}": f"{vendas}:{versao}" for mes, vendas, versao in linhas}
+
+
+def _lote_para_tabela(linhas, esquema):
+    colunas = dict(zip(COLUNAS_DB, zip(*linhas)))
+    dados = {nome: colunas[nome] for nome in esquema.names if nome in colunas}
+    for campo, model in CATEGORIAS:
+        nomes = cache_de(model)
+        dados[campo] = [nomes.nome(id_) or None for id_ in colunas[f'{campo}_ref_id']]
+    return pyarrow.Table.from_pydict(dados, schema=esquema)
+
+
+def _exportar_mes(directory, chave, using, batch_size):
+    """Reescreve o ficheiro de um mês. Devolve o número de vendas escritas."""
+    inicio, fim = _intervalo_mes(chave)
+    vendas = (
+        Sale.objects.using(using)
+        .filter(date__gte=inicio, date__lt=fim)
+        .annotate(day=TruncDate('date'))
+        .order_by('date', 'id')
+        .values_list(*COLUNAS_DB)
+        .iterator(chunk_size=batch_size)
+    )
+    esquema = _esquema()
+    pasta = _pasta_mes(directory, chave)
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, FICHEIRO_MES)
+    total = 0
+    lote = []
+    with pq.ParquetWriter(caminho + '.tmp', esquema, compression='zstd') as writer:
+        for linha in vendas:
+            lote.append(linha)
+            if len(lote) >= batch_size:
+                writer.write_table(_lote_para_tabela(lote, esquema))
+                total += len(lote)
+                lote = []
+        if lote or not total:
+            writer.write_table(_lote_para_tabela(lote, esquema) if lote else esquema.empty_table())
+            total += len(lote)
+    os.replace(caminho + '.tmp', caminho)
+    return total
+
+
+def exportar_vendas_parquet(directory=None, full=False, using='default', batch_size=EXPORT_BATCH_SIZE, log=None):
+    """
+    Exporta para Parquet os meses novos ou alterados desde a última
+    exportação (todos com full=True) e apaga os meses que deixaram de ter
+    vendas. Devolve {'exported': {mês: vendas}, 'removed': [meses], 'unchanged': n}.
+    """
+    if pq is None:
+        raise AnaliseIndisponivel("A exportação para Parquet requer o pyarrow (pip install pyarrow).")
+    directory = directory or pasta_parquet()
+    os.makedirs(directory, exist_ok=True)
+    anterior = {} if full else (ler_manifesto(directory) or {}).get('months', {})
+    impressoes = impressoes_mensais(using)
+
+    meses = {}
+    resultado = {'exported': {}, 'removed': [], 'unchanged': 0}
+    for chave, impressao in sorted(impressoes.items()):
+        if anterior.get(chave, {}).get('fingerprint') == impressao:
+            meses[chave] = anterior[chave]
+            resultado['unchanged'] += 1
+            continue
+        vendas = _exportar_mes(directory, chave, using, batch_size)
+        meses[chave] = {'fingerprint': impressao, 'rows': vendas, 'exported_at': timezone.now().isoformat()}
+        resultado['exported'][chave] = vendas
+        if log:
+            log(f"  {chave}: {vendas} vendas")
+
+    # Meses que já não têm vendas (ou restos de uma exportação com --full)
+    existentes = {
+        chave for chave in _meses_no_disco(directory) | set(anterior)
+        if chave not in impressoes
+    }
+    for chave in sorted(existentes):
+        shutil.rmtree(_pasta_mes(directory, chave), ignore_errors=True)
+        resultado['removed'].append(chave)
+
+    _gravar_manifesto(directory, {'exported_at': timezone.now().isoformat(), 'months': meses})
+    return resultado
+
+
+def _meses_no_disco(directory):
+    meses = set()
+    for ano in os.listdir(directory):
+        if not ano.startswith('year=') or not os.path.isdir(os.path.join(directory, ano)):
+            continue
+        for mes in os.listdir(os.path.join(directory, ano)):
+            if mes.startswith('month='):
+                meses.add(f"{int(ano[5:]):04d}-{int(mes[6:]):02d}")
+    return meses
+
+
+# --- Consultas (DuckDB) ---
+
+def _ligacao():
+    """Ligação DuckDB em memória, limitada para não competir com o servidor web."""
+    return duckdb.connect(config={
+        'threads': getattr(settings, 'ANALYTICS_DUCKDB_THREADS', DUCKDB_THREADS),
+        'memory_limit': getattr(settings, 'ANALYTICS_DUCKDB_MEMORY_LIMIT', DUCKDB_MEMORY_LIMIT),
+    })
+
+
+def _origem():
+    """(manifesto, glob dos ficheiros); AnaliseIndisponivel se não houver como consultar."""
+    if duckdb is None:
+        raise AnaliseIndisponivel("A análise histórica requer o DuckDB (pip install duckdb).")
+    directory = pasta_parquet()
+    manifesto = ler_manifesto(directory)
+    if not manifesto or not manifesto.get('months'):
+        raise AnaliseIndisponivel("Ainda não há vendas exportadas (python manage.py exportar_vendas_parquet).")
+    return manifesto, os.path.join(directory, 'year=*', 'month=*', FICHEIRO_MES)
+
+
+def _filtros(scope, start, end, consultants=None, filtros=None):
+    """(WHERE, parâmetros): período, âmbito do utilizador e filtros das dimensões."""
+    # 'year' é a coluna da partição: os anos fora do período nem são abertos
+    condicoes = ["year BETWEEN ? AND ?", "day BETWEEN ? AND ?"]
+    params = [start.year, end.year, start, end]
+    ids = scope.member_ids
+    if ids is not None:
+        condicoes.append("list_contains(?, consultant_id)")
+        params.append(sorted(ids))
+    if consultants:
+        condicoes.append("list_contains(?, consultant_id)")
+        params.append([int(c) for c in consultants])
+    for campo, valores in (filtros or {}).items():
+        if campo in DIMENSOES and valores:
+            condicoes.append(f"list_contains(?, {campo})")
+            params.append(list(valores))
+    return " AND ".join(condicoes), params
+
+
+_METRICAS = (
+    "SUM(revenue_net) AS revenue_net, SUM(revenue_gross) AS revenue_gross, "
+    "SUM(volume) AS volume, COUNT(*) AS sales"
+)
+CAMPOS_METRICAS = [('revenue_net', 'number'), ('revenue_gross', 'number'), ('volume', 'number'), ('sales', 'integer')]
+
+
+def _periodo(granularidade):
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade inválida: {granularidade}")
+    return f"CAST(date_trunc('{granularidade}', day) AS DATE)"
+
+
+def tendencia_historica(scope, start, end, granularidade='month', consultants=None, filtros=None):
+    """
+    Receita, volume e número de vendas por período (mês, trimestre ou ano)
+    entre start e end. Devolve (linhas, manifesto).
+    """
+    manifesto, ficheiros = _origem()
+    where, params = _filtros(scope, start, end, consultants, filtros)
+    sql = (
+        f"SELECT {_periodo(granularidade)} AS period, {_METRICAS} "
+        f"FROM read_parquet(?, hive_partitioning = true) WHERE {where} GROUP BY 1 ORDER BY 1"
+    )
+    with _ligacao() as con:
+        return con.execute(sql, [ficheiros, *params]).fetchall(), manifesto
+
+
+def decomposicao_historica(scope, start, end, dimensao, granularidade=None, limite=50, consultants=None, filtros=None):
+    """
+    Receita, volume e número de vendas por valor de uma dimensão (os
+    'limite' valores com mais receita líquida), no total do período ou
+    por período com 'granularidade'. Devolve (linhas, manifesto).
+    """
+    if dimensao not in DIMENSOES:
+        raise ValueError(f"Dimensão inválida: {dimensao}")
+    manifesto, ficheiros = _origem()
+    where, params = _filtros(scope, start, end, consultants, filtros)
+    base = (
+        f"SELECT COALESCE({dimensao}, '') AS chave, * "
+        f"FROM read_parquet(?, hive_partitioning = true) WHERE {where}"
+    )
+    if granularidade is None:
+        sql = (
+            f"SELECT chave, {_METRICAS} FROM ({base}) "
+            "GROUP BY chave ORDER BY revenue_net DESC NULLS LAST, chave LIMIT ?"
+        )
+    else:
+        sql = (
+            f"WITH base AS ({base}), "
+            "topo AS (SELECT chave FROM base GROUP BY chave ORDER BY SUM(revenue_net) DESC NULLS LAST, chave LIMIT ?) "
+            f"SELECT {_periodo(granularidade)} AS period, chave, {_METRICAS} "
+            "FROM base JOIN topo USING (chave) GROUP BY 1, 2 ORDER BY 1, 2"
+        )
+    with _ligacao() as con:
+        return con.execute(sql, [ficheiros, *params, limite]).fetchall(), manifesto
+
+
+def periodo_historico(request, anos=5):
+    """(início, fim) de ?start_date/?end_date; por defeito os últimos 'anos' anos civis até hoje."""
+    today = timezone.localdate()
+    try:
+        start = date.fromisoformat(request.GET['start_date'])
+    except (KeyError, ValueError):
+        start = date(today.year - anos + 1, 1, 1)
+    try:
+        end = date.fromisoformat(request.GET['end_date'])
+    except (KeyError, ValueError):
+        end = today
+    return start, end
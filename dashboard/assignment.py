@@ -0,0 +1,251 @@
+import csv
+import io
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .facts import agendar_atualizacao_factos
+from .generations import bump_data_generation
+from .jobs import enqueue_job
+from .audit import registar_auditoria
+from .cleaning import clean_cnpj, formatar_cnpj
+from .models import Client, Sale, User
+from .redenormalization import agendar_redenormalizacao
+from .scope import DataScope
+
+# Acima deste número de vendas órfãs afetadas, a atribuição corre em segundo plano
+DEFAULT_ASYNC_THRESHOLD = 20000
+
+# Linhas por instrução UPDATE ... FROM (VALUES ...) (3 parâmetros por linha,
+# bem abaixo do limite de parâmetros do PostgreSQL)
+VALUES_BATCH_SIZE = 5000
+
+CSV_CNPJ_COLUMNS = ('cnpj',)
+CSV_CONSULTANT_COLUMNS = ('consultor', 'consultor_id', 'consultant', 'email')
+CSV_NAME_COLUMNS = ('nome', 'cliente', 'client_name')
+
+
+class AssignmentError(Exception):
+    """Erro de leitura ou validação de um lote de atribuições."""
+
+
+def ler_csv(uploaded_file):
+    """
+    Lê um CSV carregado (UTF-8 ou Latin-1, separador ';' ou ',') e devolve
+    as linhas como dicts com os nomes das colunas em minúsculas.
+    Devolve None se o ficheiro não tiver cabeçalho.
+    """
+    raw = uploaded_file.read()
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = raw.decode('latin-1')
+
+    first_line = text.split('\n', 1)[0]
+    delimiter = ';' if first_line.count(';') >= first_line.count(',') else ','
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    if not reader.fieldnames:
+        return None
+
+    reader.fieldnames = [(name or '').strip().lower() for name in reader.fieldnames]
+    return list(reader)
+
+
+def coluna_csv(linhas, options):
+    """Primeira das colunas alternativas presente no CSV (ou None)."""
+    columns = linhas[0].keys() if linhas else ()
+    return next((c for c in options if c in columns), None)
+
+
+def ler_csv_atribuicoes(uploaded_file):
+    """
+    Lê um CSV de mapeamento com as colunas 'cnpj' e 'consultor' (ID ou e-mail)
+    e, opcionalmente, 'nome'. Aceita ';' ou ',' como separador.
+    """
+    linhas = ler_csv(uploaded_file)
+    if not linhas:
+        raise AssignmentError("O ficheiro CSV está vazio.")
+
+    cnpj_col = coluna_csv(linhas, CSV_CNPJ_COLUMNS)
+    consultant_col = coluna_csv(linhas, CSV_CONSULTANT_COLUMNS)
+    name_col = coluna_csv(linhas, CSV_NAME_COLUMNS)
+    if not cnpj_col or not consultant_col:
+        raise AssignmentError("O CSV precisa das colunas 'cnpj' e 'consultor' (ID ou e-mail).")
+
+    return [
+        {
+            'cnpj': row.get(cnpj_col),
+            'consultor': row.get(consultant_col),
+            'client_name': row.get(name_col) if name_col else '',
+        }
+        for row in linhas
+    ]
+
+
+def resolver_consultores(user, refs):
+    """Mapeia cada referência (ID ou e-mail, em minúsculas) para o consultor permitido."""
+    ids = [r for r in refs if r.isdigit()]
+    emails = [r for r in refs if not r.isdigit()]
+
+    consultores = User.objects.filter(role=User.Role.CONSULTANT)
+    if user is not None:
+        consultores = DataScope(user).filter_users(consultores)
+    consultores = consultores.annotate(email_lower=Lower('email')).filter(
+        Q(id__in=ids) | Q(email_lower__in=emails)
+    ).only('id', 'email', 'manager_id')
+
+    found = {}
+    for consultor in consultores:
+        found[str(consultor.id)] = consultor
+        found[consultor.email_lower] = consultor
+    return found
+
+
+def atribuir_clientes_em_lote(user, atribuicoes):
+    """
+    Valida um lote de atribuições (dicts com 'cnpj', 'consultor' e,
+    opcionalmente, 'client_name') e aplica-o.
+
+    Se o número de vendas órfãs afetadas ultrapassar o limite
+    (settings.BULK_ASSIGN_ASYNC_THRESHOLD) o lote é enviado para uma tarefa
+    em segundo plano. Devolve um dict com 'errors', 'result' e 'job'.
+    """
+    errors = []
+    pedidos = {}
+    for linha, item in enumerate(atribuicoes, start=1):
+        # Mesma limpeza dos importadores (CNPJ como inteiro)
+        cnpj = clean_cnpj(item.get('cnpj'))
+        ref = str(item.get('consultor') or '').strip().lower()
+        if not cnpj:
+            errors.append(f"Linha {linha}: CNPJ inválido ('{item.get('cnpj')}').")
+            continue
+        if not ref:
+            errors.append(f"Linha {linha}: consultor em falta para o CNPJ {formatar_cnpj(cnpj)}.")
+            continue
+        # Se o mesmo CNPJ aparecer várias vezes, prevalece a última linha
+        pedidos[cnpj] = (ref, (item.get('client_name') or '').strip())
+
+    consultores = resolver_consultores(user, {ref for ref, _ in pedidos.values()})
+
+    linhas = []
+    for cnpj, (ref, client_name) in pedidos.items():
+        consultor = consultores.get(ref)
+        if consultor is None:
+            errors.append(f"CNPJ {formatar_cnpj(cnpj)}: consultor '{ref}' não encontrado ou fora da sua equipa.")
+            continue
+        linhas.append([cnpj, consultor.id, consultor.manager_id, client_name])
+
+    if not linhas:
+        return {'errors': errors, 'result': None, 'job': None}
+
+    vendas_afetadas = Sale.objects.filter(
+        raw_client_cnpj__in=[l[0] for l in linhas], consultant__isnull=True
+    ).count()
+
+    limite = getattr(settings, 'BULK_ASSIGN_ASYNC_THRESHOLD', DEFAULT_ASYNC_THRESHOLD)
+    if vendas_afetadas > limite:
+        job = enqueue_job(
+            'atribuicao_clientes', 'atribuir_clientes_lote', user=user,
+            details={'atribuicoes': linhas}, progress_total=vendas_afetadas,
+        )
+        return {'errors': errors, 'result': None, 'job': job}
+
+    result = aplicar_atribuicoes(linhas, user=user)
+    return {'errors': errors, 'result': result, 'job': None}
+
+
+def aplicar_atribuicoes(linhas, user=None, job=None):
+    """
+    Aplica linhas já validadas [cnpj, consultant_id, manager_id, client_name]:
+    upsert dos clientes e reatribuição das vendas órfãs com uma única
+    UPDATE ... FROM (VALUES ...) por lote. Incrementa a geração dos dados
+    uma única vez no fim e agenda a re-denormalização dos clientes que
+    mudaram de consultor.
+    """
+    cnpjs = [l[0] for l in linhas]
+    existentes = {
+        cnpj: (client_name, consultant_id, manager_id)
+        for cnpj, client_name, consultant_id, manager_id in Client.objects.filter(cnpj__in=cnpjs)
+        .values_list('cnpj', 'client_name', 'consultant_id', 'manager_id')
+    }
+    nomes_clientes = {cnpj: dados[0] for cnpj, dados in existentes.items()}
+    # Clientes que já tinham carteira e mudam de dono: as vendas não-órfãs
+    # deles são atualizadas depois, pela re-denormalização
+    movidos = [
+        cnpj for cnpj, consultant_id, manager_id, _ in linhas
+        if cnpj in existentes and existentes[cnpj][1:] != (consultant_id, manager_id)
+    ]
+
+    sem_nome = [l[0] for l in linhas if not l[3] and l[0] not in nomes_clientes]
+    nomes_vendas = {}
+    if sem_nome:
+        nomes_vendas = dict(
+            Sale.objects.filter(raw_client_cnpj__in=sem_nome)
+            .values('raw_client_cnpj')
+            .annotate(nome=Max('raw_client_name'))
+            .values_list('raw_client_cnpj', 'nome')
+        )
+
+    now = timezone.now()
+    clientes = [
+        Client(
+            cnpj=cnpj,
+            client_name=client_name or nomes_clientes.get(cnpj) or nomes_vendas.get(cnpj) or formatar_cnpj(cnpj),
+            consultant_id=consultant_id,
+            manager_id=manager_id,
+            updated_at=now,
+        )
+        for cnpj, consultant_id, manager_id, client_name in linhas
+    ]
+
+    vendas_atualizadas = 0
+    with transaction.atomic():
+        Client.objects.bulk_create(
+            clientes, batch_size=1000,
+            unique_fields=['cnpj'],
+            update_conflicts=True,
+            update_fields=['client_name', 'consultant', 'manager', 'updated_at'],
+        )
+        for start in range(0, len(linhas), VALUES_BATCH_SIZE):
+            vendas_atualizadas += _reatribuir_vendas_orfas(linhas[start:start + VALUES_BATCH_SIZE])
+            if job is not None:
+                job.set_progress(vendas_atualizadas)
+
+    bump_data_generation()
+    if vendas_atualizadas:
+        # Vendas órfãs passaram a contar para estes consultores
+        agendar_atualizacao_factos(consultant_ids={l[1] for l in linhas}, user=user)
+    if movidos:
+        agendar_redenormalizacao(client_cnpjs=movidos, user=user)
+
+    result = {'clients_saved': len(clientes), 'sales_updated': vendas_atualizadas}
+    registar_auditoria(
+        user=user,
+        action="atribuicao_clientes_lote",
+        details={**result, "background": job is not None},
+    )
+    return result
+
+
+def _reatribuir_vendas_orfas(lote):
+    """Uma única UPDATE para todas as vendas órfãs dos CNPJs do lote."""
+    values_sql = ", ".join(["(%s::bigint, %s::bigint, %s::bigint)"] * len(lote))
+    params = []
+    for cnpj, consultant_id, manager_id, _ in lote:
+        params.extend([cnpj, consultant_id, manager_id])
+
+    sql = f"""
+        UPDATE {connection.ops.quote_name(Sale._meta.db_table)} AS s
+           SET consultant_id = v.consultant_id,
+               manager_id = v.manager_id,
+               client_id = v.cnpj
+          FROM (VALUES {values_sql}) AS v (cnpj, consultant_id, manager_id)
+         WHERE s.raw_client_cnpj = v.cnpj
+           AND s.consultant_id IS NULL
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
@@ -0,0 +1,268 @@
+import atexit
+from datetime import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import request_finished
+from django.db.models import Q
+from django.db import connections, router, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Registo de auditoria com escrita em lote
+# ---
+# registar_auditoria() não grava logo: junta as entradas num buffer do
+# processo (partilhado pelas threads do worker) e grava-as com um único
+# bulk_create quando:
+#   - o buffer chega a AUDIT_LOG_BUFFER_SIZE entradas;
+#   - a entrada mais antiga tem mais de AUDIT_LOG_FLUSH_SECONDS;
+#   - o pedido HTTP termina (request_finished, já depois de a resposta
+#     ser enviada) ou o processo termina (fim dos comandos de gestão).
+# Assim um pico de logins não acrescenta um INSERT ao tempo de resposta
+# de cada pedido, e os pedidos simultâneos partilham o mesmo INSERT.
+#
+# Uma entrada registada dentro de uma transação (atomic) só entra no
+# buffer depois do commit: se houver rollback, desaparece com o resto,
+# tal como quando era gravada diretamente.
+#
+# Com settings.AUDIT_LOG_SYNC = True cada entrada é gravada no momento
+# (comportamento antigo, útil para depuração).
+
+DEFAULT_BUFFER_SIZE = 100
+DEFAULT_FLUSH_SECONDS = 5
+
+
+def _buffer_size():
+    return getattr(settings, 'AUDIT_LOG_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+
+
+def _flush_seconds():
+    return getattr(settings, 'AUDIT_LOG_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+
+
+class AuditBuffer:
+    """Buffer de AuditLog por processo, seguro entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entry):
+        with self._lock:
+            if not self._entries:
+                self._oldest = time.monotonic()
+            self._entries.append(entry)
+        if self._due():
+            self.flush()
+
+    def _due(self):
+        return bool(self._entries) and (
+            len(self._entries) >= _buffer_size()
+            or time.monotonic() - self._oldest >= _flush_seconds()
+        )
+
+    def flush(self):
+        """Grava as entradas pendentes num único INSERT. Devolve quantas foram gravadas."""
+        with self._lock:
+            entries, self._entries, self._oldest = self._entries, [], None
+        if not entries:
+            return 0
+        from .models import AuditLog
+        try:
+            AuditLog.objects.bulk_create(entries, batch_size=_buffer_size())
+        except Exception:
+            # A auditoria nunca pode fazer falhar o pedido que a originou
+            logger.exception("Erro ao gravar %d entradas de auditoria", len(entries))
+            return 0
+        return len(entries)
+
+
+_buffer = AuditBuffer()
+
+
+def registar_auditoria(user, action, details=None):
+    """
+    Regista uma entrada de AuditLog (em lote, ver acima). O timestamp é o
+    do momento do registo, não o da gravação.
+    """
+    from .models import AuditLog
+    entry = AuditLog(
+        user_id=getattr(user, 'pk', None),
+        timestamp=timezone.now(),
+        action=action,
+        # Cópia: quem regista pode continuar a alterar o dicionário
+        details=dict(details) if isinstance(details, dict) else details,
+    )
+    if getattr(settings, 'AUDIT_LOG_SYNC', False):
+        entry.save()
+        return entry
+    transaction.on_commit(lambda: _buffer.add(entry))
+    return entry
+
+
+def flush_auditoria():
+    """Grava já as entradas pendentes deste processo."""
+    return _buffer.flush()
+
+
+@receiver(request_finished, dispatch_uid='dashboard_audit_flush')
+def _flush_no_fim_do_pedido(sender, **kwargs):
+    # O close_old_connections do Django corre antes deste receiver. Se já
+    # fechou a ligação, o flush abre outra, que tem de ser fechada aqui:
+    # senão fica presa à thread (ou a um lugar da pool) até ao próximo pedido.
+    from .models import AuditLog
+    connection = connections[router.db_for_write(AuditLog)]
+    aberta = connection.connection is not None
+    try:
+        flush_auditoria()
+    finally:
+        if not aberta:
+            connection.close()
+
+
+# Comandos de gestão (importadores, tarefas em segundo plano) e workers
+# que terminam normalmente
+atexit.register(flush_auditoria)
+
+
+# ---
+# Consulta (keyset) e retenção
+# ---
+# O visualizador de auditoria pagina por (timestamp, id) decrescentes:
+# cada página continua a partir da última linha da anterior, usando os
+# índices (action, timestamp, id) e (timestamp, id), sem OFFSET, por
+# isso a página 1000 custa o mesmo que a primeira. Os filtros por
+# file_type/api_type/status usam o índice GIN de 'details' (@>).
+#
+# Os registos com mais de AUDIT_LOG_RETENTION_DAYS (365) dias saem da
+# tabela para ficheiros JSON Lines comprimidos, um por mês
+# (comando arquivar_auditoria, para correr diariamente no cron).
+
+AUDIT_PAGE_SIZE = 50
+DEFAULT_RETENTION_DAYS = 365
+ARCHIVE_BATCH_SIZE = 5000
+
+ACOES_CARGA = [
+    "inicio_carga_api", "fim_carga_api", "inicio_carga_csv",
+    "fim_carga_csv", "falha_carga_api", "falha_carga_csv",
+]
+ACOES = [
+    ("login_success", "Login"),
+    ("logout", "Logout"),
+    ("inicio_carga_csv", "Início de carga CSV"),
+    ("fim_carga_csv", "Fim de carga CSV"),
+    ("falha_carga_csv", "Falha de carga CSV"),
+    ("inicio_carga_api", "Início de carga API"),
+    ("fim_carga_api", "Fim de carga API"),
+    ("falha_carga_api", "Falha de carga API"),
+    ("atribuicao_clientes_lote", "Atribuição de clientes"),
+    ("metas_lote", "Metas"),
+    ("create_commission_rule", "Regra de comissão criada"),
+    ("update_commission_rule", "Regra de comissão editada"),
+    ("delete_commission_rule", "Regra de comissão eliminada"),
+    ("redenormalizacao_vendas", "Reatribuição de vendas"),
+    ("exportacao", "Exportação"),
+    ("arquivo_auditoria", "Arquivo de auditoria"),
+]
+# Chaves de 'details' pesquisáveis no visualizador
+FILTROS_DETALHES = ("file_type", "api_type", "status")
+
+
+def filtrar_auditoria(queryset, action=None, user_id=None, start=None, end=None, details=None):
+    """Aplica os filtros do visualizador (todos opcionais)."""
+    if action:
+        queryset = queryset.filter(action=action)
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    if start:
+        queryset = queryset.filter(timestamp__date__gte=start)
+    if end:
+        queryset = queryset.filter(timestamp__date__lte=end)
+    details = {k: v for k, v in (details or {}).items() if k in FILTROS_DETALHES and v}
+    if details:
+        queryset = queryset.filter(details__contains=details)
+    return queryset
+
+
+def _cursor(entry):
+    return f"{entry.timestamp.isoformat()}|{entry.pk}"
+
+
+def _ler_cursor(cursor):
+    """(timestamp, id) de um cursor, ou None se for inválido."""
+    try:
+        timestamp, pk = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def pagina_auditoria(queryset, cursor=None, page_size=AUDIT_PAGE_SIZE):
+    """
+    Uma página de registos, do mais recente para o mais antigo, a seguir
+    ao cursor. Devolve (registos, cursor da página seguinte ou None).
+    """
+    queryset = queryset.order_by('-timestamp', '-id')
+    posicao = _ler_cursor(cursor) if cursor else None
+    if posicao:
+        timestamp, pk = posicao
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    entries = list(queryset[:page_size + 1])
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        return entries, _cursor(entries[-1])
+    return entries, None
+
+
+def _linha_arquivo(entry):
+    return json.dumps({
+        'id': entry['id'],
+        'timestamp': entry['timestamp'],
+        'user_id': entry['user_id'],
+        'user': entry['user__email'],
+        'action': entry['action'],
+        'details': entry['details'],
+    }, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def arquivar_auditoria(before, directory, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move os registos anteriores a 'before' para ficheiros
+    auditlog-AAAA-MM.jsonl.gz em 'directory' (acrescenta aos existentes)
+    e apaga-os da tabela, em lotes. Cada lote só é apagado depois de
+    escrito no disco. Devolve o número de registos arquivados.
+    """
+    from .models import AuditLog
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+    while True:
+        lote = list(
+            AuditLog.objects.filter(timestamp__lt=before)
+            .order_by('id')
+            .values('id', 'timestamp', 'user_id', 'user__email', 'action', 'details')[:batch_size]
+        )
+        if not lote:
+            return total
+        por_mes = {}
+        for entry in lote:
+            mes = timezone.localtime(entry['timestamp']).strftime('%Y-%m')
+            por_mes.setdefault(mes, []).append(_linha_arquivo(entry))
+        for mes, linhas in por_mes.items():
+            # gzip em modo 'a' acrescenta um novo membro; zcat lê o ficheiro inteiro
+            with gzip.open(os.path.join(directory, f"auditlog-{mes}.jsonl.gz"), 'at', encoding='utf-8') as f:
+                f.writelines(linhas)
+        AuditLog.objects.filter(id__in=[entry['id'] for entry in lote]).delete()
+        total += len(lote)
@@ -0,0 +1,153 @@
+from datetime import timedelta
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.test import Client as TestClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Sale, User
+
+# ---
+# Benchmark das views (em processo, com o test client do Django)
+# ---
+# Cada view é pedida 'runs' vezes (depois de um pedido de aquecimento)
+# pelo utilizador típico dessa página: o admin, o consultor com a maior
+# carteira, o gestor com a maior equipa e o cliente com mais vendas.
+# O relatório JSON tem sempre as mesmas chaves, para comparar execuções
+# (antes/depois de uma otimização, ou entre tamanhos de dados).
+#
+# A cache de snapshots fica desligada durante as medições: mede-se o
+# cálculo, não a cache.
+
+
+def _percentil(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _host():
+    """Um Host aceite por ALLOWED_HOSTS (o test client usa 'testserver')."""
+    hosts = [h for h in settings.ALLOWED_HOSTS if h != '*']
+    if not hosts or '*' in settings.ALLOWED_HOSTS:
+        return 'localhost'
+    return f'bench{hosts[0]}' if hosts[0].startswith('.') else hosts[0]
+
+
+def utilizadores_tipicos():
+    """Utilizadores e cliente usados nas medições (None se não existirem)."""
+    consultor = (
+        User.objects.filter(role=User.Role.CONSULTANT, is_active=True)
+        .annotate(n=Count('clients')).order_by('-n', 'id').first()
+    )
+    gestor = (
+        User.objects.filter(role=User.Role.MANAGER, is_active=True)
+        .annotate(n=Count('descendant_links')).order_by('-n', 'id').first()
+    )
+    cliente = (
+        Sale.objects.filter(client__isnull=False).values('client')
+        .annotate(n=Count('id')).order_by('-n', 'client').values_list('client', flat=True).first()
+    )
+    return {
+        'admin': User.objects.filter(role=User.Role.ADMIN, is_active=True).order_by('id').first(),
+        'consultant': consultor,
+        'manager': gestor,
+        'client': cliente,
+    }
+
+
+def casos(tipicos, today=None):
+    """(nome, utilizador, url, parâmetros) de cada medição."""
+    today = today or timezone.localdate()
+    ano = {'start_date': (today - timedelta(days=365)).isoformat(), 'end_date': today.isoformat()}
+    admin, consultor, gestor, cliente = (tipicos[k] for k in ('admin', 'consultant', 'manager', 'client'))
+    lista = [
+        ('api_dashboard_geral_data', admin, reverse('api_dashboard_geral_data'), {}),
+        ('api_dashboard_geral_data_12m', admin, reverse('api_dashboard_geral_data'), ano),
+        ('minha_carteira_consultant', consultor, reverse('minha_carteira'), {}),
+        ('minha_carteira_manager', gestor, reverse('minha_carteira'), {}),
+        ('client_detail', admin, reverse('client_detail', args=[cliente]) if cliente else None, {}),
+        ('atribuir_clientes', admin, reverse('atribuir_clientes'), {}),
+    ]
+    return [caso for caso in lista if caso[1] is not None and caso[2] is not None]
+
+
+def medir_view(client, url, params, runs):
+    """Tempos (ms), queries e bytes de uma view; o primeiro pedido só aquece."""
+    response = client.get(url, params)
+    if response.status_code != 200:
+        return {'error': f'HTTP {response.status_code}'}
+    timings = []
+    for _ in range(runs):
+        with CaptureQueriesContext(connection) as queries:
+            inicio = time.perf_counter()
+            response = client.get(url, params)
+            timings.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'runs': runs,
+        'min_ms': round(min(timings), 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(_percentil(timings, 95), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'queries': len(queries.captured_queries),
+        'db_ms': round(sum(float(q['time']) for q in queries.captured_queries) * 1000, 2),
+        'bytes': len(response.content),
+    }
+
+
+def medir_views(runs=5, only=None):
+    """Mede todos os casos com os dados atuais. Devolve {nome: resultado}."""
+    tipicos = utilizadores_tipicos()
+    resultados = {}
+    with override_settings(DASHBOARD_SNAPSHOT_CACHE=None):
+        for nome, user, url, params in casos(tipicos):
+            if only and nome not in only:
+                continue
+            client = TestClient(HTTP_HOST=_host())
+            client.force_login(user)
+            resultados[nome] = medir_view(client, url, params, runs)
+    return resultados
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def cabecalho_relatorio(runs):
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'postgresql': connection.pg_version if connection.vendor == 'postgresql' else None,
+        'runs': runs,
+        'results': [],
+    }
+
+
+def comparar(atual, anterior):
+    """Linhas (tamanho, view, mediana anterior, atual, razão) entre dois relatórios."""
+    antes = {
+        (r['sales'], nome): dados.get('median_ms')
+        for r in anterior.get('results', []) for nome, dados in r['views'].items()
+    }
+    linhas = []
+    for r in atual['results']:
+        for nome, dados in r['views'].items():
+            anterior_ms = antes.get((r['sales'], nome))
+            if anterior_ms and dados.get('median_ms'):
+                linhas.append((r['sales'], nome, anterior_ms, dados['median_ms'], dados['median_ms'] / anterior_ms))
+    return linhas
@@ -0,0 +1,170 @@
+import threading
+
+from django.db import connections, router, transaction
+
+# ---
+# Categorias das vendas (tabelas de lookup)
+# ---
+# Fonte, estado, tipo de pagamento, produto e detalhe do produto eram texto
+# repetido em cada venda. Cada venda guarda agora apenas o id (smallint) de
+# uma linha numa tabela pequena, e esta cache em memória (por processo)
+# converte nomes em ids e ids em nomes:
+#   - os importadores e o gerador sintético resolvem os nomes sem ir à base
+#     de dados (só os nomes novos custam uma query);
+#   - as páginas mostram os nomes sem JOIN (Sale.source, Sale.status, ...).
+#
+# As linhas destas tabelas nunca são alteradas nem apagadas, por isso uma
+# entrada na cache nunca fica errada. Os nomes novos são inseridos na
+# ligação de quem os pede, dentro da sua transação: uma importação revertida
+# não deixa categorias para trás. Até ao commit, os ids novos só são vistos
+# pela thread que os criou; o on_commit passa-os para a cache partilhada e,
+# se a transação (ou o savepoint) for revertida, o Django descarta esse
+# on_commit e os ids deixam de contar.
+# A cache é esvaziada no post_migrate (p.ex. depois de um flush).
+
+
+class CacheCategorias:
+    """Nomes <-> ids de uma tabela de categorias."""
+
+    def __init__(self, model):
+        self.model = model
+        self._ids = {}
+        self._nomes = {}
+        self._lock = threading.Lock()
+        # [(on_commit, {nome: id})] criados por transações em curso, por thread
+        self._local = threading.local()
+
+    def _alias(self):
+        # Sempre na base de dados principal: uma réplica atrasada não teria os nomes acabados de criar
+        return router.db_for_write(self.model)
+
+    def _guardar(self, linhas):
+        with self._lock:
+            for id_, nome in linhas:
+                self._ids[nome] = id_
+                self._nomes[id_] = nome
+
+    def _pendentes(self):
+        """{nome: id} criados nesta thread por transações ainda não gravadas."""
+        criados = getattr(self._local, 'criados', None)
+        if not criados:
+            return {}
+        # Um rollback (da transação ou do savepoint) descarta o on_commit dos nomes que criou
+        registados = [func for _, func, _ in connections[self._alias()].run_on_commit]
+        self._local.criados = criados = [
+            (confirmar, nomes) for confirmar, nomes in criados
+            if any(func is confirmar for func in registados)
+        ]
+        return {nome: id_ for _, nomes in criados for nome, id_ in nomes.items()}
+
+    def carregar(self):
+        """Lê a tabela toda (são poucas linhas), sem os nomes ainda por gravar."""
+        pendentes = self._pendentes()
+        linhas = list(self.model.objects.using(self._alias()).values_list('id', 'name'))
+        self._guardar((id_, nome) for id_, nome in linhas if nome not in pendentes)
+
+    def _criar(self, nomes):
+        alias = self._alias()
+        ligacao = connections[alias]
+        with ligacao.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {ligacao.ops.quote_name(self.model._meta.db_table)} (name) "
+                "SELECT unnest(%s::varchar[]) ON CONFLICT (name) DO NOTHING RETURNING name, id",
+                [sorted(nomes)],
+            )
+            criados = dict(cursor.fetchall())
+        if criados and ligacao.in_atomic_block:
+            def confirmar():
+                # Só depois de um commit real (não, p.ex., no captureOnCommitCallbacks dos testes)
+                if not connections[alias].in_atomic_block:
+                    self._guardar((id_, nome) for nome, id_ in criados.items())
+            transaction.on_commit(confirmar, using=alias)
+            self._local.criados = [*getattr(self._local, 'criados', []), (confirmar, criados)]
+
+    def nome(self, id_):
+        """Nome de um id ('' para None)."""
+        if id_ is None:
+            return ''
+        try:
+            return self._nomes[id_]
+        except KeyError:
+            pass
+        for nome, pendente in self._pendentes().items():
+            if pendente == id_:
+                return nome
+        self.carregar()
+        return self._nomes.get(id_, '')
+
+    def id(self, nome):
+        """Id de um nome, criado se ainda não existir (None para '')."""
+        if not nome:
+            return None
+        try:
+            return self._ids[nome]
+        except KeyError:
+            return self.ids([nome])[nome]
+
+    def ids(self, nomes):
+        """{nome: id} de vários nomes, criando os que faltarem numa só query."""
+        nomes = {nome for nome in nomes if nome}
+        pendentes = {}
+        if nomes - self._ids.keys():
+            pendentes = self._pendentes()
+            if nomes - self._ids.keys() - pendentes.keys():
+                self.carregar()
+                faltam = nomes - self._ids.keys() - pendentes.keys()
+                if faltam:
+                    self._criar(faltam)
+                    self.carregar()
+                    pendentes = self._pendentes()
+        return {nome: self._ids[nome] if nome in self._ids else pendentes[nome] for nome in nomes}
+
+    def existentes(self, nomes):
+        """Ids dos nomes que existem (para filtros: nunca cria)."""
+        nomes = {nome for nome in nomes if nome}
+        pendentes = {}
+        if nomes - self._ids.keys():
+            pendentes = self._pendentes()
+            if nomes - self._ids.keys() - pendentes.keys():
+                self.carregar()
+        return [self._ids[nome] if nome in self._ids else pendentes[nome]
+                for nome in nomes if nome in self._ids or nome in pendentes]
+
+    def limpar(self):
+        with self._lock:
+            self._ids.clear()
+            self._nomes.clear()
+        self._local.criados = []
+
+
+_caches = {}
+
+
+def cache_de(model):
+    """A cache (única no processo) de uma tabela de categorias."""
+    try:
+        return _caches[model._meta.label]
+    except KeyError:
+        return _caches.setdefault(model._meta.label, CacheCategorias(model))
+
+
+def limpar_caches():
+    for cache in _caches.values():
+        cache.limpar()
+
+
+def campo_categoria(campo, model):
+    """
+    Propriedade com o nome (texto) de uma categoria guardada como id em
+    '<campo>_ref'. Aceita texto na atribuição e no construtor, p.ex.
+    Sale(source='ELIQ', status='confirmada'), como antes da conversão.
+    """
+    atributo = f'{campo}_ref_id'
+
+    def get(self):
+        return cache_de(model).nome(getattr(self, atributo))
+
+    def set(self, valor):
+        setattr(self, atributo, cache_de(model).id(str(valor) if valor else None))
+
+    return property(get, set, doc=f"Nome de {model.__name__} (ver {campo}_ref).")
@@ -0,0 +1,69 @@
+from decimal import Decimal
+import math
+
+# ---
+# Limpeza partilhada dos dados importados
+# ---
+# Usada pelos importadores (Bionio, Rovema Pay, ELIQ) e pela atribuição de
+# clientes, para que um CNPJ tenha sempre a mesma chave venha de onde vier.
+#
+# Um CNPJ é guardado como inteiro (bigint): os 14 dígitos, sem pontuação
+# e sem os zeros à esquerda. É uma chave de largura fixa (8 bytes) nos
+# índices, nos joins Client <-> Sale e nos agrupamentos por cliente. A
+# pontuação e os zeros só voltam na apresentação: formatar_cnpj() e o
+# filtro de template |cnpj (templatetags/formatos.py).
+
+CNPJ_DIGITOS = 14
+
+
+def _vazio(value):
+    """None, NaN (pandas/numpy) ou texto vazio."""
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return math.isnan(value)
+    return isinstance(value, str) and not value.strip()
+
+
+def clean_value(value_str):
+    """Valor monetário ('R$ 1.234,56', número ou vazio) em Decimal."""
+    if _vazio(value_str): return Decimal('0.0')
+    if isinstance(value_str, (int, float, Decimal)): return Decimal(value_str)
+    value_str = str(value_str).strip().replace("R$", "").replace("%", "")
+    value_str = value_str.replace(".", "").replace(",", ".")
+    try: return Decimal(value_str)
+    except Exception: return Decimal('0.0')
+
+
+def clean_cnpj(cnpj_str):
+    """
+    CNPJ como inteiro, ou None se não for válido. Aceita pontuação, zeros
+    à esquerda em falta e notação científica (como o Excel exporta).
+    """
+    if _vazio(cnpj_str):
+        return None
+    if isinstance(cnpj_str, int):
+        return cnpj_str if 0 < cnpj_str < 10 ** CNPJ_DIGITOS else None
+    cnpj_str = str(cnpj_str).strip()
+    if 'E' in cnpj_str.upper():
+        try: cnpj_str = "{:.0f}".format(float(cnpj_str.replace(',', '.')))
+        except ValueError: pass
+    digits = "".join(filter(str.isdigit, cnpj_str))
+    if not digits or len(digits) > CNPJ_DIGITOS:
+        return None
+    return int(digits) or None
+
+
+def cnpj_digitos(cnpj):
+    """Os 14 dígitos de um CNPJ (inteiro ou texto), com os zeros à esquerda."""
+    if cnpj is None or cnpj == '':
+        return ''
+    return f"{int(cnpj):0{CNPJ_DIGITOS}d}"
+
+
+def formatar_cnpj(cnpj):
+    """CNPJ para apresentação: 12.345.678/0001-90."""
+    d = cnpj_digitos(cnpj)
+    if not d:
+        return ''
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
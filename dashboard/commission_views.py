@@ -4,12 +4,31 @@ from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
+from decimal import Decimal
+from datetime import date
 import json
 
-from .models import User, CommissionRule, AuditLog
+from .audit import registar_auditoria
+from .models import User, CommissionRule
 from .forms import CommissionRuleForm
+from .facts import agendar_atualizacao_factos, meses_da_vigencia
 from .user_management_views import RoleRequiredMixin # Reutiliza o Mixin de segurança
 
+
+def _json_safe(value):
+    """Converte Decimals e datas para tipos compatíveis com o JSON do AuditLog."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _recalcular_factos(user, *periodos):
+    """Agenda o recálculo dos factos de desempenho dos meses cobertos pelas vigências."""
+    agendar_atualizacao_factos(meses_da_vigencia(*periodos), user=user)
+
+
 class CommissionRuleListView(LoginRequiredMixin, RoleRequiredMixin, ListView):
     """(Read) - Lista todas as regras de comissão."""
     model = CommissionRule
@@ -34,16 +53,22 @@ class CommissionRuleCreateView(LoginRequiredMixin, RoleRequiredMixin, CreateView
         messages.success(self.request, "Regra de comissão criada com sucesso.")
         
         # Log de auditoria
-        AuditLog.objects.create(
+        registar_auditoria(
             user=self.request.user,
             action="create_commission_rule",
             details={
                 "rule_name": form.cleaned_data['rule_name'],
                 "source": form.cleaned_data['source'],
-                "percentage": float(form.cleaned_data['percentage']) # Converte Decimal para float para JSON
+                "percentage": float(form.cleaned_data['percentage']), # Converte Decimal para float para JSON
+                "valid_from": _json_safe(form.cleaned_data.get('valid_from')),
+                "valid_to": _json_safe(form.cleaned_data.get('valid_to')),
+                "min_revenue": _json_safe(form.cleaned_data.get('min_revenue')),
+                "max_revenue": _json_safe(form.cleaned_data.get('max_revenue')),
             }
         )
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        _recalcular_factos(self.request.user, (self.object.valid_from, self.object.valid_to))
+        return response
 
 class CommissionRuleUpdateView(LoginRequiredMixin, RoleRequiredMixin, UpdateView):
     """(Update) - Formulário para editar uma regra."""
@@ -62,12 +87,12 @@ class CommissionRuleUpdateView(LoginRequiredMixin, RoleRequiredMixin, UpdateView
         messages.success(self.request, "Regra de comissão atualizada com sucesso.")
         
         # Prepara os dados antigos (form.initial) e novos (form.cleaned_data) para o log
-        # Converte Decimals para float para serem compatíveis com JSON
-        old_data = {k: float(v) if isinstance(v, Decimal) else v for k, v in form.initial.items()}
-        new_data = {k: float(v) if isinstance(v, Decimal) else v for k, v in form.cleaned_data.items()}
+        # Converte Decimals e datas para serem compatíveis com JSON
+        old_data = {k: _json_safe(v) for k, v in form.initial.items()}
+        new_data = {k: _json_safe(v) for k, v in form.cleaned_data.items()}
 
         # Log de auditoria
-        AuditLog.objects.create(
+        registar_auditoria(
             user=self.request.user,
             action="update_commission_rule",
             details={
@@ -79,7 +104,14 @@ class CommissionRuleUpdateView(LoginRequiredMixin, RoleRequiredMixin, UpdateView
                 }
             }
         )
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # A vigência antiga e a nova podem cobrir meses diferentes
+        _recalcular_factos(
+            self.request.user,
+            (form.initial.get('valid_from'), form.initial.get('valid_to')),
+            (self.object.valid_from, self.object.valid_to),
+        )
+        return response
 
 class CommissionRuleDeleteView(LoginRequiredMixin, RoleRequiredMixin, DeleteView):
     """(Delete) - Página de confirmação para eliminar."""
@@ -88,23 +120,24 @@ class CommissionRuleDeleteView(LoginRequiredMixin, RoleRequiredMixin, DeleteView
     success_url = reverse_lazy('commission_list')
     allowed_roles = [User.Role.ADMIN]
 
-    def delete(self, request, *args, **kwargs):
-        # Guarda o objeto antes de eliminar para o log
-        self.object = self.get_object() 
+    def form_valid(self, form):
+        # Desde o Django 4, o POST do DeleteView passa por form_valid() e não por delete()
         rule_name = self.object.rule_name
+        periodo = (self.object.valid_from, self.object.valid_to)
         
-        # Chama o delete() original
-        response = super().delete(request, *args, **kwargs)
+        # Chama o form_valid() original (que elimina o objeto)
+        response = super().form_valid(form)
+        _recalcular_factos(self.request.user, periodo)
         
         messages.success(self.request, f"Regra '{rule_name}' eliminada com sucesso.")
         
         # Log de auditoria
-        AuditLog.objects.create(
+        registar_auditoria(
             user=self.request.user,
             action="delete_commission_rule",
             details={
-                "rule_id": self.object.id,
-                "rule_name": self.object.rule_name,
+                "rule_id": self.kwargs['pk'],
+                "rule_name": rule_name,
                 "source": self.object.source,
                 "percentage": float(self.object.percentage)
             }
@@ -0,0 +1,93 @@
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CommissionRule, Sale, SaleSource
+
+
+def limites_do_mes(year, month):
+    """Início (inclusive) e fim (exclusivo) do mês, no fuso horário atual."""
+    tz = timezone.get_current_timezone()
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return timezone.make_aware(start, tz), timezone.make_aware(end, tz)
+
+
+def relatorio_comissoes(year, month, scope=None, consultant_ids=None):
+    """
+    Receita líquida e comissão por consultor num mês, numa única query.
+
+    As vendas são agregadas por (consultor, fonte, dia) e cruzadas com a
+    regra de comissão aplicável (pelo nome da fonte):
+    - a vigência da regra é avaliada no dia da venda;
+    - o escalão é avaliado sobre a receita mensal do consultor nessa fonte.
+    GROUPING SETS devolve também o total do âmbito na mesma query.
+
+    Devolve {'rows': {consultant_id: {'revenue', 'commission'}}, 'total': {...}}.
+    """
+    start, end = limites_do_mes(year, month)
+    sales = Sale.objects.filter(date__gte=start, date__lt=end, consultant__isnull=False)
+    if scope is not None:
+        sales = scope.filter_sales(sales)
+    if consultant_ids is not None:
+        sales = sales.filter(consultant_id__in=list(consultant_ids))
+
+    daily = (
+        sales
+        .annotate(day=TruncDate('date'))
+        .values('consultant_id', 'source_ref_id', 'day')
+        .annotate(net=Sum('revenue_net'))
+        .order_by()
+    )
+    daily_sql, daily_params = daily.query.sql_with_params()
+    rules = connection.ops.quote_name(CommissionRule._meta.db_table)
+    sources = connection.ops.quote_name(SaleSource._meta.db_table)
+
+    sql = f"""
+        WITH daily AS ({daily_sql}),
+        monthly AS (
+            SELECT consultant_id, source_ref_id, SUM(net) AS total
+              FROM daily
+             GROUP BY consultant_id, source_ref_id
+        )
+        SELECT GROUPING(d.consultant_id) AS is_total,
+               d.consultant_id,
+               SUM(d.net) AS revenue,
+               COALESCE(SUM(d.net * r.percentage / 100), 0) AS commission
+          FROM daily AS d
+          JOIN monthly AS m
+            ON m.consultant_id = d.consultant_id AND m.source_ref_id = d.source_ref_id
+          JOIN {sources} AS s
+            ON s.id = d.source_ref_id
+          LEFT JOIN LATERAL (
+                SELECT cr.percentage
+                  FROM {rules} AS cr
+                 WHERE cr.source = s.name
+                   AND (cr.valid_from IS NULL OR cr.valid_from <= d.day)
+                   AND (cr.valid_to IS NULL OR cr.valid_to >= d.day)
+                   AND m.total >= cr.min_revenue
+                   AND (cr.max_revenue IS NULL OR m.total < cr.max_revenue)
+                 ORDER BY cr.valid_from DESC NULLS LAST, cr.min_revenue DESC
+                 LIMIT 1
+          ) AS r ON TRUE
+         GROUP BY GROUPING SETS ((d.consultant_id), ())
+    """
+
+    zero = Decimal('0.00')
+    report = {'rows': {}, 'total': {'revenue': zero, 'commission': zero}}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, daily_params)
+        for is_total, consultant_id, revenue, commission in cursor.fetchall():
+            values = {
+                'revenue': revenue or zero,
+                'commission': (commission or zero).quantize(Decimal('0.01')),
+            }
+            if is_total:
+                report['total'] = values
+            else:
+                report['rows'][consultant_id] = values
+    return report
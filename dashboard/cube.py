@@ -0,0 +1,247 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .categorias import cache_de
+from .generations import get_all_generations, sales_generations
+from .models import Sale, SaleSource, User
+
+# ---
+# Cubo de vendas em memória (um por processo)
+# ---
+# O Dashboard Geral combina período x produtos (fontes) x consultores, e
+# cada combinação era mais um agregado em SQL. Cada processo guarda um
+# cubo denso dia x fonte x consultor com [bruto, líquido, vendas] (valores
+# em centavos, int64: as somas são exatas) dos últimos CUBE_DAYS dias, e
+# os KPIs, a pizza por fonte e a tendência de 12 meses passam a ser somas
+# de fatias do cubo em numpy (menos de 1 ms) em vez de três queries.
+#
+# O cubo é carregado com um único agregado (GROUP BY dia, fonte, consultor)
+# e fica associado às gerações das vendas (global e por fonte, as mesmas da
+# ETag): quando uma importação ou reatribuição as incrementa, o pedido
+# seguinte recarrega-o. Enquanto uma thread carrega, as outras usam o SQL.
+#
+# O cubo guarda somas acumuladas ao longo dos dias (acumulado[d] = soma dos
+# dias anteriores a d): qualquer período é acumulado[fim] - acumulado[início],
+# e o custo de uma secção não depende do número de dias.
+#
+# Memória: antes de carregar, o tamanho é estimado (dias x fontes x
+# utilizadores x 24 bytes); acima de DASHBOARD_CUBE_MAX_MB o cubo não é
+# carregado e tudo continua em SQL. Também vão ao SQL os períodos que
+# começam antes do cubo e as secções com dimensões que o cubo não tem
+# (top/bottom clientes).
+#
+# Ativo com settings.DASHBOARD_CUBE = True.
+
+CUBE_DAYS = 730
+CUBE_MAX_MB = 64
+# Janela do gráfico de tendência (como em services.vendas_dashboard)
+TENDENCIA_DIAS = 365
+
+# Métricas (última dimensão do cubo)
+BRUTO, LIQUIDO, VENDAS = range(3)
+BYTES_POR_CELULA = 3 * np.dtype(np.int64).itemsize
+
+
+def _centavos(valor):
+    return int(valor * 100) if valor is not None else 0
+
+
+def _reais(centavos):
+    """Centavos -> Decimal com 2 casas, como sai do SQL."""
+    return Decimal(int(centavos)).scaleb(-2)
+
+
+class CuboVendas:
+    """
+    Somas acumuladas por dia (desde 'inicio') x fonte x consultor;
+    acumulado=None se o cubo não coube no limite de memória.
+    """
+
+    def __init__(self, chave, inicio, acumulado=None, fontes=(), consultores=()):
+        self.chave = chave
+        self.inicio = inicio
+        self.acumulado = acumulado
+        self.dias = 0 if acumulado is None else acumulado.shape[0] - 1
+        self.fontes = np.asarray(fontes, dtype=np.int64)
+        # Vendas sem consultor no índice 0 (nenhum âmbito, exceto o global, o inclui)
+        self.consultores = np.asarray(consultores, dtype=np.int64)
+        self.meses = (np.datetime64(inicio, 'D') + np.arange(self.dias)).astype('datetime64[M]')
+
+    @property
+    def disponivel(self):
+        return self.acumulado is not None
+
+    @property
+    def nbytes(self):
+        return 0 if self.acumulado is None else self.acumulado.nbytes
+
+    def atual(self, chave, today):
+        """Ainda serve: mesmas gerações e a janela da tendência cabe no cubo."""
+        return self.chave == chave and today - timedelta(days=TENDENCIA_DIAS) >= self.inicio
+
+    def fatia(self, scope, start_date, end_date, products=None, consultants=None, today=None):
+        """FatiaCubo com os filtros do Dashboard Geral, ou None se tiverem de ir ao SQL."""
+        if not self.disponivel or start_date < self.inicio:
+            return None
+        mascara_fontes = None
+        if products:
+            mascara_fontes = np.isin(self.fontes, cache_de(SaleSource).existentes(products))
+        mascara_consultores = None
+        ids = scope.member_ids
+        if ids is not None:
+            mascara_consultores = np.isin(self.consultores, list(ids))
+        if consultants:
+            try:
+                escolhidos = np.isin(self.consultores, [int(c) for c in consultants])
+            except (TypeError, ValueError):
+                return None  # O SQL dá o mesmo erro que antes
+            mascara_consultores = escolhidos if mascara_consultores is None else mascara_consultores & escolhidos
+        return FatiaCubo(self, start_date, end_date, today, mascara_fontes, mascara_consultores)
+
+
+class FatiaCubo:
+    """Secções do Dashboard Geral calculadas sobre o cubo (mesmos valores que o SQL)."""
+
+    def __init__(self, cubo, start_date, end_date, today, mascara_fontes, mascara_consultores):
+        self.cubo = cubo
+        self.start_date = start_date
+        self.end_date = end_date
+        self.today = today
+        self.mascara_fontes = mascara_fontes
+        self.mascara_consultores = mascara_consultores
+
+    def _dia(self, data):
+        return min(max((data - self.cubo.inicio).days, 0), self.cubo.dias)
+
+    def _acumulado(self, dias):
+        """Acumulados nos dias indicados, só das fontes e consultores filtrados."""
+        valores = self.cubo.acumulado[dias]
+        if self.mascara_fontes is not None:
+            valores = valores[:, self.mascara_fontes]
+        if self.mascara_consultores is not None:
+            valores = valores[:, :, self.mascara_consultores]
+        return valores
+
+    def _periodo(self):
+        """Somas do período por fonte x consultor x métrica."""
+        inicio, fim = self._acumulado([self._dia(self.start_date), self._dia(self.end_date + timedelta(days=1))])
+        return fim - inicio
+
+    def totais(self):
+        """Como o aggregate de calcular_kpis_gerais (None quando não há vendas)."""
+        somas = self._periodo().sum(axis=(0, 1))
+        vendas = int(somas[VENDAS])
+        return {
+            'total_revenue_net': _reais(somas[LIQUIDO]) if vendas else None,
+            'total_revenue_gross': _reais(somas[BRUTO]) if vendas else None,
+            'total_sales': vendas,
+        }
+
+    def receita_por_fonte(self):
+        """(fonte, receita líquida) por ordem decrescente de receita."""
+        somas = self._periodo().sum(axis=1)
+        fontes = self.cubo.fontes if self.mascara_fontes is None else self.cubo.fontes[self.mascara_fontes]
+        nomes = cache_de(SaleSource)
+        linhas = [
+            (nomes.nome(int(fonte)), _reais(soma[LIQUIDO]))
+            for fonte, soma in zip(fontes, somas) if soma[VENDAS]
+        ]
+        return sorted(linhas, key=lambda linha: -linha[1])
+
+    def tendencia_mensal(self):
+        """(início do mês, receita bruta) dos meses com vendas nos últimos 12 meses."""
+        primeiro = self._dia(self.today - timedelta(days=TENDENCIA_DIAS))
+        meses = self.cubo.meses[primeiro:]
+        if not len(meses):
+            return []
+        # Primeiro dia de cada mês (e o fim do cubo): as somas mensais são diferenças dos acumulados
+        inicios = primeiro + np.flatnonzero(np.r_[True, meses[1:] != meses[:-1]])
+        acumulados = self._acumulado(np.r_[inicios, self.cubo.dias]).sum(axis=(1, 2))
+        return [
+            (timezone.make_aware(datetime.combine(mes.astype('datetime64[D]').item(), time.min)), _reais(soma[BRUTO]))
+            for mes, soma in zip(self.cubo.meses[inicios], np.diff(acumulados, axis=0)) if soma[VENDAS]
+        ]
+
+
+def carregar_cubo(chave, today):
+    """Carrega o cubo (ou um cubo indisponível, se passar do limite de memória)."""
+    inicio = today - timedelta(days=getattr(settings, 'DASHBOARD_CUBE_DAYS', CUBE_DAYS))
+    vendas = Sale.objects.filter(date__gte=timezone.make_aware(datetime.combine(inicio, time.min)))
+
+    # Estimativa por excesso, com queries baratas, antes do agregado
+    ultima = vendas.aggregate(ultima=Max('date'))['ultima']
+    if ultima is None:
+        return CuboVendas(chave, inicio, np.zeros((1, 0, 0, 3), dtype=np.int64))
+    dias = (timezone.localtime(ultima).date() - inicio).days + 1
+    limite = getattr(settings, 'DASHBOARD_CUBE_MAX_MB', CUBE_MAX_MB) * 1024 * 1024
+    if (dias + 1) * SaleSource.objects.count() * (User.objects.count() + 1) * BYTES_POR_CELULA > limite:
+        return CuboVendas(chave, inicio)
+
+    linhas = list(
+        vendas.annotate(dia=TruncDate('date'))
+        .values('dia', 'source_ref_id', 'consultant_id')
+        .annotate(bruto=Sum('revenue_gross'), liquido=Sum('revenue_net'), n=Count('id'))
+        .values_list('dia', 'source_ref_id', 'consultant_id', 'bruto', 'liquido', 'n')
+    )
+    fontes = sorted({linha[1] for linha in linhas})
+    consultores = sorted({linha[2] or 0 for linha in linhas})
+    # acumulado[0] fica a zeros; o dia d soma-se em d + 1 e o cumsum faz o resto
+    acumulado = np.zeros((dias + 1, len(fontes), len(consultores), 3), dtype=np.int64)
+    if linhas:
+        dia, fonte, consultor, bruto, liquido, n = zip(*linhas)
+        indices = (
+            np.array([(d - inicio).days + 1 for d in dia]),
+            np.searchsorted(fontes, fonte),
+            np.searchsorted(consultores, [c or 0 for c in consultor]),
+        )
+        acumulado[indices] = np.column_stack([[_centavos(v) for v in bruto], [_centavos(v) for v in liquido], n])
+        np.cumsum(acumulado, axis=0, out=acumulado)
+    return CuboVendas(chave, inicio, acumulado, fontes, consultores)
+
+
+_cubo = None
+_lock = threading.Lock()
+
+
+def obter_cubo(today, generations=None):
+    """
+    O cubo do processo, recarregado se as gerações das vendas mudaram.
+    None se estiver desligado, não couber no limite ou outra thread o
+    estiver a carregar (nesses casos, o pedido usa o SQL).
+    """
+    global _cubo
+    if not getattr(settings, 'DASHBOARD_CUBE', False):
+        return None
+    chave = tuple(sales_generations(generations if generations is not None else get_all_generations()))
+    cubo = _cubo
+    if cubo is None or not cubo.atual(chave, today):
+        if not _lock.acquire(blocking=False):
+            return None
+        try:
+            cubo = _cubo
+            if cubo is None or not cubo.atual(chave, today):
+                cubo = _cubo = carregar_cubo(chave, today)
+        finally:
+            _lock.release()
+    return cubo if cubo.disponivel else None
+
+
+def fatia_do_cubo(scope, start_date, end_date, products=None, consultants=None, today=None, generations=None):
+    """FatiaCubo para os filtros do Dashboard Geral, ou None (usar o SQL)."""
+    cubo = obter_cubo(today, generations)
+    if cubo is None:
+        return None
+    return cubo.fatia(scope, start_date, end_date, products=products, consultants=consultants, today=today)
+
+
+def limpar_cubo():
+    global _cubo
+    with _lock:
+        _cubo = None
@@ -0,0 +1,131 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# ---
+# Leituras do dashboard numa réplica do PostgreSQL
+# ---
+# As views de leitura pesada (Dashboard Geral e a sua API, Minha Carteira,
+# Detalhe do Cliente e exportações) são decoradas com @leitura_replica:
+# durante o pedido, as leituras dos modelos do dashboard vão para o alias
+# settings.DASHBOARD_REPLICA_DB. Tudo o resto (escritas, importadores,
+# comandos, sessões e o próprio utilizador autenticado) fica no primário.
+#
+# Ler o que se acabou de escrever: depois de um pedido de escrita com
+# sucesso, o LeituraPrimarioMiddleware marca o browser com um cookie
+# curto e, enquanto ele existir, também as views de leitura usam o
+# primário (ex: o redirect depois de atribuir clientes ou gravar metas).
+
+REPLICA_PIN_COOKIE = 'ler_primario'
+REPLICA_PIN_SECONDS = 10
+
+# Lidos sempre do primário: autenticação (um utilizador acabado de criar
+# ou com a password alterada ainda pode não existir na réplica)
+PRIMARY_ONLY_MODELS = {'user'}
+
+_usar_replica = ContextVar('dashboard_usar_replica', default=False)
+
+
+def replica_alias():
+    """Alias da réplica configurada, ou None (tudo no primário)."""
+    alias = getattr(settings, 'DASHBOARD_REPLICA_DB', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+class ReplicaRouter:
+    """Router (settings.DATABASE_ROUTERS) que envia as leituras marcadas para a réplica."""
+
+    def db_for_read(self, model, **hints):
+        if not _usar_replica.get():
+            return None
+        if model._meta.app_label != 'dashboard' or model._meta.model_name in PRIMARY_ONLY_MODELS:
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        # Explícito: um objeto lido da réplica é sempre gravado no primário
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primário têm os mesmos dados
+        databases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema por replicação, nunca por migrate
+        if db == replica_alias():
+            return False
+        return None
+
+
+def _pode_usar_replica(request):
+    return replica_alias() is not None and REPLICA_PIN_COOKIE not in request.COOKIES
+
+
+def _conteudo_na_replica(content, usar):
+    """Itera uma resposta em streaming com a réplica ativa a cada bloco."""
+    iterator = iter(content)
+    while True:
+        token = _usar_replica.set(usar)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _usar_replica.reset(token)
+        yield chunk
+
+
+def leitura_replica(view):
+    """
+    Decorator para views só de leitura: as queries do pedido (incluindo as
+    ETags e o conteúdo em streaming) são lidas da réplica, se configurada.
+    """
+    def depois(response, usar):
+        if usar and getattr(response, 'streaming', False) and not response.is_async:
+            response.streaming_content = _conteudo_na_replica(response.streaming_content, usar)
+        return response
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            usar = _pode_usar_replica(request)
+            token = _usar_replica.set(usar)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _usar_replica.reset(token)
+            return depois(response, usar)
+    else:
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            usar = _pode_usar_replica(request)
+            token = _usar_replica.set(usar)
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                _usar_replica.reset(token)
+            return depois(response, usar)
+    return inner
+
+
+class LeituraPrimarioMiddleware:
+    """
+    Depois de um pedido de escrita (POST, ...) com sucesso, as leituras do
+    mesmo browser ficam no primário durante REPLICA_PIN_SECONDS, para que
+    o redirect seguinte já veja o que foi escrito (atraso da replicação).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
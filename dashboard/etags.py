@@ -0,0 +1,170 @@
+import hashlib
+from datetime import datetime, time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .generations import CLIENTS_SCOPE, FACTS_SCOPE, get_all_generations, sales_generations
+from .hierarchy import HIERARCHY_SCOPE
+from .models import Client
+from .payloads import formato_pedido
+from .scope import get_data_scope
+
+# ---
+# GET condicional (ETag / Last-Modified) para as views de leitura
+# ---
+# As respostas dependem apenas dos dados de vendas (geração global e por
+# fonte), do âmbito do utilizador, dos filtros normalizados e do dia atual
+# (as datas por defeito e a janela de 12 meses mudam à meia-noite).
+# As funções abaixo leem apenas a pequena tabela DataGeneration, para que
+# um If-None-Match válido seja respondido com 304 sem nenhum agregado.
+#
+# As páginas HTML (Minha Carteira, Detalhe do Cliente) também mostram o que
+# é da sessão: o token CSRF do formulário de saída e as mensagens em fila
+# (base.html). A ETag delas junta o utilizador e o segredo CSRF (que muda a
+# cada login) e não há 304 com mensagens por mostrar; também não enviam
+# Last-Modified, que não distingue sessões. As chaves sem sessão (chave_*)
+# servem o JSON da API e os snapshots (ver dashboard/snapshots.py).
+
+
+def geracoes_do_pedido(request):
+    """Contadores lidos uma única vez por pedido (ETag e Last-Modified)."""
+    cached = getattr(request, '_generations', None)
+    if cached is None:
+        cached = get_all_generations()
+        request._generations = cached
+    return cached
+
+
+def periodo_normalizado(request):
+    """(início, fim) dos filtros de data, com os mesmos defaults das views."""
+    today = timezone.now().date()
+    try:
+        start = datetime.strptime(request.GET.get('start_date', today.replace(day=1).isoformat()), '%Y-%m-%d').date()
+        end = datetime.strptime(request.GET.get('end_date', today.isoformat()), '%Y-%m-%d').date()
+    except ValueError:
+        return today.replace(day=1), today
+    return start, end
+
+
+def _chave(request, filters, scopes=(), sources=None):
+    """Hash da view, âmbito, dia, gerações e filtros (igual para todas as sessões)."""
+    generations = geracoes_do_pedido(request)
+    scope = get_data_scope(request)
+    hierarchy = generations.get(HIERARCHY_SCOPE, (0, None))[0]
+    parts = [
+        request.resolver_match.url_name if request.resolver_match else request.path,
+        scope.cache_key_for(hierarchy),
+        timezone.now().date().isoformat(),
+        sales_generations(generations, sources),
+        [(s, generations.get(s, (0, None))[0]) for s in scopes],
+        filters,
+    ]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _etag_pagina(request, chave):
+    """ETag de uma página HTML: a chave dos dados mais a sessão (None = sem 304)."""
+    if get_messages(request):
+        return None  # Mensagens em fila: a página tem de ser renderizada para as mostrar
+    get_token(request)  # Garante o segredo em CSRF_COOKIE (não mascarado, estável na sessão)
+    parts = [chave, request.user.pk, request.META.get('CSRF_COOKIE')]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _last_modified(request, scopes=()):
+    generations = geracoes_do_pedido(request)
+    relevant = {s for s, _ in sales_generations(generations)} | {HIERARCHY_SCOPE, *scopes}
+    updated = [generations[s][1] for s in relevant if s in generations and generations[s][1]]
+    # Nunca anterior à meia-noite de hoje (os defaults de data mudam com o dia)
+    midnight = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    return max([midnight, *updated])
+
+
+def condicional_async(etag_func=None, last_modified_func=None):
+    """
+    Equivalente ao @condition do Django para views async: as funções de
+    ETag/Last-Modified (síncronas, leem a BD) correm em sync_to_async.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            def calcular():
+                modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+                etag = etag_func(request, *args, **kwargs) if etag_func else None
+                return etag, modified
+
+            etag, modified = await sync_to_async(calcular)()
+            etag = quote_etag(etag) if etag is not None else None
+            modified = int(modified.timestamp()) if modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+# --- API do Dashboard Geral ---
+
+def _filtros_dashboard(request):
+    products = sorted(set(request.GET.getlist('products[]')))
+    consultants = sorted(set(request.GET.getlist('consultants[]')))
+    return products, consultants
+
+
+def chave_dashboard_geral(request):
+    products, consultants = _filtros_dashboard(request)
+    return _chave(
+        request, (periodo_normalizado(request), products, consultants, formato_pedido(request)),
+        sources=products,
+    )
+
+
+def etag_dashboard_geral(request):
+    # O JSON não depende da sessão: a ETag é a própria chave
+    return chave_dashboard_geral(request)
+
+
+def last_modified_dashboard_geral(request):
+    return _last_modified(request)
+
+
+# --- Minha Carteira / Minha Equipa ---
+
+def chave_minha_carteira(request):
+    return _chave(request, (periodo_normalizado(request),), scopes=(FACTS_SCOPE, CLIENTS_SCOPE))
+
+
+def etag_minha_carteira(request):
+    return _etag_pagina(request, chave_minha_carteira(request))
+
+
+# --- Detalhe do Cliente ---
+
+def _cliente_visivel(request, cnpj):
+    client = getattr(request, '_etag_client', None)
+    if client is None:
+        client = get_object_or_404(Client, cnpj=cnpj)
+        request._etag_client = client
+    return client if get_data_scope(request).can_view_client(client) else None
+
+
+def etag_client_detail(request, cnpj):
+    client = _cliente_visivel(request, cnpj)
+    if client is None:
+        # Sem permissão: a view responde com 403, nunca com 304
+        return None
+    return _etag_pagina(request, _chave(request, (periodo_normalizado(request), cnpj, client.updated_at.isoformat())))
@@ -0,0 +1,229 @@
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+import io
+import re
+from xml.sax.saxutils import escape
+import zipfile
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import DecimalField, Max, Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .cleaning import formatar_cnpj
+from .models import Sale
+
+# ---
+# Exportações no servidor (CSV / XLSX em streaming)
+# ---
+# As linhas são lidas com iterator(chunk_size=...) (cursor do lado do
+# servidor no PostgreSQL) e escritas à medida que são enviadas: a memória
+# usada é constante, seja qual for o número de linhas exportadas.
+
+EXPORT_CHUNK_SIZE = 2000
+ROWS_PER_YIELD = 500
+
+FORMATO_CSV = 'csv'
+FORMATO_XLSX = 'xlsx'
+CONTENT_TYPES = {
+    FORMATO_CSV: 'text/csv; charset=utf-8',
+    FORMATO_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _texto(value):
+    """Valor de uma célula como texto (datas no formato usado na interface)."""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    return str(value)
+
+
+# --- CSV ---
+
+class _Echo:
+    """Pseudo-ficheiro para o csv.writer: write() devolve a linha em vez de a guardar."""
+
+    def write(self, value):
+        return value
+
+
+def _celula_csv(value):
+    if isinstance(value, (Decimal, float)):
+        # Vírgula decimal, como o Excel em pt-BR espera com separador ';'
+        return str(value).replace('.', ',')
+    return _texto(value)
+
+
+def linhas_csv(header, rows):
+    """CSV (';', UTF-8 com BOM para o Excel) gerado em blocos de linhas."""
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow(header)
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow([_celula_csv(v) for v in row]))
+        if len(buffer) >= ROWS_PER_YIELD:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+# --- XLSX ---
+# Um XLSX é um ZIP de XMLs. A folha é escrita diretamente no ZIP (modo
+# streaming do zipfile, sem seek) com strings inline, o que dispensa
+# bibliotecas externas e a tabela de strings partilhadas em memória.
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_PARTES_XLSX = (
+    ('[Content_Types].xml', _XML + (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    )),
+    ('_rels/.rels', _XML + (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    )),
+    ('xl/workbook.xml', _XML + (
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )),
+    ('xl/_rels/workbook.xml.rels', _XML + (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    )),
+)
+_INICIO_FOLHA = _XML + '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+_FIM_FOLHA = '</sheetData></worksheet>'
+# Caracteres de controlo não são válidos em XML
+_CONTROLO = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ZipSink(io.RawIOBase):
+    """Destino do ZIP sem seek: guarda os bytes escritos até serem enviados."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _celula_xlsx(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(_CONTROLO.sub("", _texto(value)))}</t></is></c>'
+
+
+def _linha_xlsx(numero, values):
+    return f'<row r="{numero}">{"".join(_celula_xlsx(v) for v in values)}</row>'.encode('utf-8')
+
+
+def linhas_xlsx(header, rows):
+    """XLSX de uma folha, gerado em blocos de linhas."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _PARTES_XLSX:
+            zf.writestr(name, content)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(_INICIO_FOLHA.encode('utf-8'))
+            sheet.write(_linha_xlsx(1, header))
+            for numero, row in enumerate(rows, start=2):
+                sheet.write(_linha_xlsx(numero, row))
+                if numero % ROWS_PER_YIELD == 0:
+                    yield sink.take()
+            sheet.write(_FIM_FOLHA.encode('utf-8'))
+    yield sink.take()
+
+
+def resposta_exportacao(formato, nome, header, rows):
+    """StreamingHttpResponse (download) com as linhas no formato pedido."""
+    formato = formato if formato in CONTENT_TYPES else FORMATO_CSV
+    gerador = linhas_xlsx if formato == FORMATO_XLSX else linhas_csv
+    response = StreamingHttpResponse(gerador(header, rows), content_type=CONTENT_TYPES[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nome}.{formato}"'
+    return response
+
+
+# --- Conjuntos de dados exportáveis: (cabeçalho, linhas) ---
+
+def _com_cnpj_formatado(rows, coluna):
+    """Formata a coluna de CNPJ (guardado como inteiro) linha a linha."""
+    for row in rows:
+        row = list(row)
+        row[coluna] = formatar_cnpj(row[coluna])
+        yield row
+
+
+def exportacao_vendas(sales):
+    """Vendas (já filtradas pelo âmbito e pelos filtros) linha a linha."""
+    header = [
+        'Data', 'Fonte', 'ID', 'CNPJ', 'Cliente', 'Consultor', 'Produto', 'Detalhe',
+        'Pagamento', 'Status', 'TPV', 'Receita Líquida', 'Volume',
+    ]
+    rows = sales.order_by('date', 'id').values_list(
+        'date', 'source_ref__name', 'raw_id', 'raw_client_cnpj', 'raw_client_name', 'consultant__email',
+        'product_name_ref__name', 'product_detail_ref__name', 'payment_type_ref__name', 'status_ref__name',
+        'revenue_gross', 'revenue_net', 'volume',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return header, _com_cnpj_formatado(rows, 3)
+
+
+def exportacao_desempenho_clientes(clients, start_date, end_date):
+    """Clientes da carteira com a receita líquida no período (como na Minha Carteira)."""
+    header = ['CNPJ', 'Cliente', 'Consultor', 'Receita no Período', 'Última Venda']
+    rows = clients.annotate(
+        revenue_periodo=Coalesce(
+            Sum('sales__revenue_net', filter=Q(sales__date__date__gte=start_date, sales__date__date__lte=end_date)),
+            Decimal(0), output_field=DecimalField(),
+        ),
+        last_sale_date=Max('sales__date'),
+    ).order_by('-revenue_periodo', 'cnpj').values_list(
+        'cnpj', 'client_name', 'consultant__email', 'revenue_periodo', 'last_sale_date',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return header, _com_cnpj_formatado(rows, 0)
+
+
+def exportacao_orfaos():
+    """Clientes das vendas sem consultor (como em Atribuir Clientes)."""
+    header = ['CNPJ', 'Cliente', 'Receita Líquida', 'Última Venda', 'Fontes']
+    rows = (
+        Sale.objects.filter(consultant__isnull=True)
+        .values('raw_client_cnpj', 'raw_client_name')
+        .annotate(
+            total_revenue=Sum('revenue_net'),
+            last_sale=Max('date'),
+            sources=StringAgg('source_ref__name', ', ', distinct=True),
+        )
+        .order_by('-last_sale')
+        .values_list('raw_client_cnpj', 'raw_client_name', 'total_revenue', 'last_sale', 'sources')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return header, _com_cnpj_formatado(rows, 0)
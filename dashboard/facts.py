@@ -0,0 +1,148 @@
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .commissions import relatorio_comissoes
+from .generations import FACTS_SCOPE, bump_generations
+from .jobs import enqueue_job
+from .models import ConsultantMonthFact, Goal, Sale
+
+ZERO = Decimal('0.00')
+
+
+def _percentagem(realizado, meta):
+    if not meta:
+        return ZERO
+    return (realizado / meta * 100).quantize(Decimal('0.01'))
+
+
+def meses_com_dados(consultant_ids=None):
+    """(ano, mês) com vendas atribuídas ou metas, opcionalmente só destes consultores."""
+    sales = Sale.objects.filter(consultant__isnull=False)
+    goals = Goal.objects.all()
+    if consultant_ids is not None:
+        sales = sales.filter(consultant_id__in=list(consultant_ids))
+        goals = goals.filter(user_id__in=list(consultant_ids))
+
+    meses = set(
+        sales.annotate(y=ExtractYear('date'), m=ExtractMonth('date'))
+        .values_list('y', 'm').distinct().order_by()
+    )
+    meses.update(goals.values_list('year', 'month').distinct().order_by())
+    return sorted(meses)
+
+
+def atualizar_factos(meses=None, consultant_ids=None):
+    """
+    Recalcula os factos de desempenho dos meses indicados (todos os meses
+    com dados, se None), opcionalmente só para alguns consultores.
+
+    Por mês: uma query de receita/comissão (motor de comissões), uma de
+    metas, um upsert em lote e a remoção das linhas que deixaram de ter
+    vendas e meta. Devolve o número de linhas gravadas.
+    """
+    if consultant_ids is not None:
+        consultant_ids = sorted(set(consultant_ids))
+        if not consultant_ids:
+            return 0
+    if meses is None:
+        meses = meses_com_dados(consultant_ids)
+
+    saved = 0
+    for year, month in sorted(set((int(y), int(m)) for y, m in meses)):
+        report = relatorio_comissoes(year, month, consultant_ids=consultant_ids)
+        goals = Goal.objects.filter(year=year, month=month)
+        if consultant_ids is not None:
+            goals = goals.filter(user_id__in=consultant_ids)
+        goal_map = dict(goals.values_list('user_id', 'target_value'))
+
+        facts = []
+        for consultant_id in set(report['rows']) | set(goal_map):
+            row = report['rows'].get(consultant_id, {})
+            revenue = row.get('revenue', ZERO)
+            goal = goal_map.get(consultant_id, ZERO)
+            facts.append(ConsultantMonthFact(
+                consultant_id=consultant_id, year=year, month=month,
+                revenue_net=revenue, goal=goal,
+                commission=row.get('commission', ZERO),
+                attainment=_percentagem(revenue, goal),
+            ))
+
+        stale = ConsultantMonthFact.objects.filter(year=year, month=month)
+        if consultant_ids is not None:
+            stale = stale.filter(consultant_id__in=consultant_ids)
+        stale.exclude(consultant_id__in=[f.consultant_id for f in facts]).delete()
+
+        ConsultantMonthFact.objects.bulk_create(
+            facts, batch_size=1000,
+            unique_fields=['consultant', 'year', 'month'],
+            update_conflicts=True,
+            update_fields=['revenue_net', 'goal', 'commission', 'attainment', 'updated_at'],
+        )
+        saved += len(facts)
+
+    bump_generations(FACTS_SCOPE)
+    return saved
+
+
+def agendar_atualizacao_factos(meses=None, consultant_ids=None, user=None):
+    """Enfileira atualizar_factos() em segundo plano (edições de regras e reatribuições)."""
+    details = {
+        'months': None if meses is None else sorted({(int(y), int(m)) for y, m in meses}),
+        'consultant_ids': None if consultant_ids is None else sorted(set(consultant_ids)),
+    }
+    if details['months'] == [] or details['consultant_ids'] == []:
+        return None
+    return enqueue_job('atualizacao_factos', 'atualizar_factos_desempenho', user=user, details=details)
+
+
+def meses_da_vigencia(*periodos):
+    """
+    Meses com vendas cobertos por um ou mais períodos (valid_from, valid_to)
+    de regras de comissão; None nas pontas significa sem limite.
+    """
+    meses = set()
+    for valid_from, valid_to in periodos:
+        sales = Sale.objects.filter(consultant__isnull=False)
+        if valid_from:
+            sales = sales.filter(date__date__gte=valid_from)
+        if valid_to:
+            sales = sales.filter(date__date__lte=valid_to)
+        meses.update(
+            sales.annotate(y=ExtractYear('date'), m=ExtractMonth('date'))
+            .values_list('y', 'm').distinct().order_by()
+        )
+    return sorted(meses)
+
+
+def totais_do_ambito(scope, year, month):
+    """Receita, meta e comissão do mês somadas sobre os factos visíveis no âmbito."""
+    totals = scope.filter_facts(
+        ConsultantMonthFact.objects.filter(year=year, month=month)
+    ).aggregate(
+        revenue_net=Coalesce(Sum('revenue_net'), ZERO),
+        goal=Coalesce(Sum('goal'), ZERO),
+        commission=Coalesce(Sum('commission'), ZERO),
+    )
+    totals['attainment'] = _percentagem(totals['revenue_net'], totals['goal'])
+    return totals
+
+
+def ranking_do_mes(scope, year, month, limit=None):
+    """Consultores do âmbito ordenados pela receita do mês (leaderboard)."""
+    qs = (
+        scope.filter_facts(ConsultantMonthFact.objects.filter(year=year, month=month))
+        .select_related('consultant')
+        .order_by('-revenue_net', 'consultant_id')
+    )
+    return qs[:limit] if limit else qs
+
+
+def meses_das_vendas(sales):
+    """(ano, mês) locais das vendas indicadas (objetos Sale de uma importação)."""
+    return sorted({
+        (local.year, local.month)
+        for local in (timezone.localtime(sale.date) for sale in sales)
+    })
@@ -49,9 +49,17 @@ class CommissionRuleForm(forms.ModelForm):
     """
     class Meta:
         model = CommissionRule
-        fields = ('rule_name', 'source', 'percentage')
+        fields = ('rule_name', 'source', 'percentage', 'valid_from', 'valid_to', 'min_revenue', 'max_revenue')
+        widgets = {
+            'valid_from': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
+            'valid_to': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
+        }
         help_texts = {
             'source': "O 'source' exato da tabela de Vendas (ex: Rovema Pay, Bionio, ELIQ).",
             'percentage': "O valor da percentagem (ex: 10.5 para 10.5%).",
+            'valid_from': "Primeiro dia de vigência (vazio = desde sempre).",
+            'valid_to': "Último dia de vigência (vazio = sem fim).",
+            'min_revenue': "Receita mensal mínima do consultor nesta fonte para aplicar o escalão.",
+            'max_revenue': "Receita mensal a partir da qual o escalão deixa de se aplicar (vazio = sem limite).",
         }
 # --- (FIM DA NOVA FUNCIONALIDADE) ---
\ No newline at end of file
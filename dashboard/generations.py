@@ -0,0 +1,82 @@
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DataGeneration
+
+# Contadores por fonte de vendas (ex: 'source:ELIQ'), incrementados pelos importadores
+SOURCE_PREFIX = 'source:'
+# Contador dos factos de desempenho (metas, comissões)
+FACTS_SCOPE = 'factos'
+# Contador dos dados dos clientes (nome, carteira)
+CLIENTS_SCOPE = 'clientes'
+
+
+def source_scope(source):
+    return f"{SOURCE_PREFIX}{source}"
+
+
+def bump_generations(*scopes):
+    """Incrementa os contadores indicados (criando-os se ainda não existirem)."""
+    DataGeneration.objects.bulk_create(
+        [DataGeneration(scope=scope) for scope in scopes], ignore_conflicts=True
+    )
+    DataGeneration.objects.filter(scope__in=scopes).update(
+        generation=F('generation') + 1, updated_at=timezone.now()
+    )
+
+
+def bump_data_generation(*scopes):
+    """
+    Incrementa a geração global dos dados de vendas (e as extra indicadas)
+    uma única vez. Deve ser chamada no fim de cada operação em massa.
+    """
+    bump_generations(DataGeneration.GLOBAL, *scopes)
+
+
+def registar_importacao(*sources):
+    """
+    Regista uma importação: incrementa apenas a geração das fontes
+    importadas e marca a data da última importação (por fonte e global).
+    """
+    scopes = [source_scope(source) for source in sources]
+    bump_generations(*scopes)
+    DataGeneration.objects.bulk_create(
+        [DataGeneration(scope=DataGeneration.GLOBAL)], ignore_conflicts=True
+    )
+    DataGeneration.objects.filter(
+        scope__in=[DataGeneration.GLOBAL, *scopes]
+    ).update(last_import_at=timezone.now())
+
+
+def get_data_generation(scope=DataGeneration.GLOBAL):
+    """Devolve a geração atual (0 se ainda não houve nenhuma alteração)."""
+    return (
+        DataGeneration.objects.filter(scope=scope)
+        .values_list('generation', flat=True)
+        .first()
+    ) or 0
+
+
+def get_all_generations():
+    """Todos os contadores numa query: {scope: (generation, updated_at)}."""
+    return {
+        scope: (generation, updated_at)
+        for scope, generation, updated_at in
+        DataGeneration.objects.values_list('scope', 'generation', 'updated_at')
+    }
+
+
+def sales_generations(generations, sources=None):
+    """
+    Parte da assinatura que identifica o estado das vendas: a geração
+    global (atribuições, reatribuições) e a de cada fonte importada
+    (todas, ou só as indicadas). Devolve uma lista ordenada de pares.
+    """
+    wanted = None if not sources else {source_scope(s) for s in sources}
+    pairs = [(DataGeneration.GLOBAL, generations.get(DataGeneration.GLOBAL, (0, None))[0])]
+    pairs.extend(
+        (scope, generations[scope][0])
+        for scope in generations
+        if scope.startswith(SOURCE_PREFIX) and (wanted is None or scope in wanted)
+    )
+    return sorted(pairs)
@@ -0,0 +1,155 @@
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+import operator
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+from .assignment import coluna_csv, ler_csv, resolver_consultores
+from .facts import atualizar_factos
+from .audit import registar_auditoria
+from .models import Goal
+
+CSV_CONSULTANT_COLUMNS = ('consultor', 'consultor_id', 'consultant', 'email')
+CSV_YEAR_COLUMNS = ('ano', 'year')
+CSV_MONTH_COLUMNS = ('mes', 'mês', 'month')
+CSV_VALUE_COLUMNS = ('meta', 'valor', 'target_value')
+
+MESES = range(1, 13)
+
+
+class GoalError(Exception):
+    """Erro de leitura ou validação de um lote de metas."""
+
+
+def parse_valor_meta(value):
+    """
+    Converte o valor digitado (ex: '1.234,56', '1234.56' ou vazio) num Decimal.
+    Vazio conta como 0 (= apagar a meta). Lança InvalidOperation se inválido.
+    """
+    value = str(value or '').strip().replace('R$', '').strip()
+    if not value:
+        return Decimal('0.0')
+    if ',' in value:
+        # Remove . (milhar) e troca , (decimal) por .
+        value = value.replace('.', '').replace(',', '.')
+    return Decimal(value)
+
+
+def ler_csv_metas(uploaded_file):
+    """
+    Lê um CSV de metas com as colunas 'consultor' (ID ou e-mail), 'ano',
+    'mes' e 'meta'. Aceita ';' ou ',' como separador.
+    """
+    linhas = ler_csv(uploaded_file)
+    if not linhas:
+        raise GoalError("O ficheiro CSV está vazio.")
+
+    cols = {
+        'consultor': coluna_csv(linhas, CSV_CONSULTANT_COLUMNS),
+        'ano': coluna_csv(linhas, CSV_YEAR_COLUMNS),
+        'mes': coluna_csv(linhas, CSV_MONTH_COLUMNS),
+        'meta': coluna_csv(linhas, CSV_VALUE_COLUMNS),
+    }
+    if not all(cols.values()):
+        raise GoalError("O CSV precisa das colunas 'consultor', 'ano', 'mes' e 'meta'.")
+
+    return [{key: row.get(col) for key, col in cols.items()} for row in linhas]
+
+
+def gravar_metas_em_lote(user, metas):
+    """
+    Grava um lote de metas (dicts com 'consultor', 'ano', 'mes', 'meta')
+    numa única transação: um upsert em lote para os valores positivos e um
+    único DELETE para os valores zero/vazios. Só são aceites consultores
+    do âmbito do utilizador (uma query para todo o lote).
+
+    Atualiza os factos de desempenho dos meses/consultores afetados.
+    Devolve {'errors', 'saved', 'deleted'}.
+    """
+    errors = []
+    pedidos = {}
+    for linha, item in enumerate(metas, start=1):
+        ref = str(item.get('consultor') or '').strip().lower()
+        try:
+            year = int(str(item.get('ano')).strip())
+            month = int(str(item.get('mes')).strip())
+            if month not in MESES:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"Linha {linha}: ano/mês inválido ('{item.get('ano')}/{item.get('mes')}').")
+            continue
+        try:
+            valor = parse_valor_meta(item.get('meta'))
+        except InvalidOperation:
+            errors.append(f"Linha {linha}: valor inválido '{item.get('meta')}'.")
+            continue
+        if not ref:
+            errors.append(f"Linha {linha}: consultor em falta.")
+            continue
+        # Se a mesma meta aparecer várias vezes, prevalece a última linha
+        pedidos[(ref, year, month)] = valor
+
+    consultores = resolver_consultores(user, {ref for ref, _, _ in pedidos})
+
+    gravar, apagar = {}, {}
+    for (ref, year, month), valor in pedidos.items():
+        consultor = consultores.get(ref)
+        if consultor is None:
+            errors.append(f"Consultor '{ref}' não encontrado ou fora da sua equipa.")
+            continue
+        destino = gravar if valor > 0 else apagar
+        destino[(consultor.id, year, month)] = valor
+
+    if not gravar and not apagar:
+        return {'errors': errors, 'saved': 0, 'deleted': 0}
+
+    with transaction.atomic():
+        Goal.objects.bulk_create(
+            [
+                Goal(user_id=user_id, year=year, month=month, target_value=valor)
+                for (user_id, year, month), valor in gravar.items()
+            ],
+            batch_size=1000,
+            unique_fields=['user', 'year', 'month'],
+            update_conflicts=True,
+            update_fields=['target_value'],
+        )
+
+        deleted = 0
+        if apagar:
+            deleted, _ = Goal.objects.filter(reduce(operator.or_, (
+                Q(user_id=user_id, year=year, month=month) for user_id, year, month in apagar
+            ))).delete()
+
+        chaves = list(gravar) + list(apagar)
+        atualizar_factos(
+            meses={(year, month) for _, year, month in chaves},
+            consultant_ids={user_id for user_id, _, _ in chaves},
+        )
+
+    registar_auditoria(
+        user=user,
+        action="metas_lote",
+        details={"saved": len(gravar), "deleted": deleted, "errors": len(errors)},
+    )
+    return {'errors': errors, 'saved': len(gravar), 'deleted': deleted}
+
+
+def grelha_anual(consultores, year):
+    """
+    Metas dos 12 meses de um ano para os consultores indicados, numa única
+    query (pivot com um Sum condicional por mês).
+    Devolve {user_id: [meta_jan, ..., meta_dez]}.
+    """
+    pivot = (
+        Goal.objects.filter(year=year, user__in=consultores)
+        .values('user_id')
+        .annotate(**{
+            f'm{month}': Coalesce(Sum('target_value', filter=Q(month=month)), Decimal('0.0'))
+            for month in MESES
+        })
+        .order_by()
+    )
+    return {row['user_id']: [row[f'm{month}'] for month in MESES] for row in pivot}
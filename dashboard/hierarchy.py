@@ -0,0 +1,101 @@
+from django.db import connection
+
+from .generations import bump_generations
+from .models import User, UserHierarchy
+
+# Geração incrementada sempre que a hierarquia muda (invalida os âmbitos em sessão)
+HIERARCHY_SCOPE = 'hierarquia'
+
+# Proteção contra ciclos herdados de dados antigos na reconstrução total
+MAX_DEPTH = 32
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def subarvore(user_id):
+    """Subquery com os IDs de toda a equipa (direta e indireta) de um utilizador, incluindo ele próprio."""
+    return UserHierarchy.objects.filter(ancestor_id=user_id).values('descendant_id')
+
+
+def adicionar_utilizador(user_id, manager_id=None):
+    """Cria a linha do próprio utilizador e liga-o aos ancestrais do gestor."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {_table(UserHierarchy)} (ancestor_id, descendant_id, depth) "
+            f"VALUES (%s, %s, 0) ON CONFLICT (ancestor_id, descendant_id) DO NOTHING",
+            [user_id, user_id],
+        )
+    if manager_id is not None:
+        mover_utilizador(user_id, manager_id)
+    else:
+        bump_generations(HIERARCHY_SCOPE)
+
+
+def mover_utilizador(user_id, manager_id):
+    """
+    Move a sub-árvore de user_id para baixo de manager_id (ou para a raiz,
+    se manager_id for None): apaga as ligações aos ancestrais antigos e
+    cria as ligações aos novos, em duas instruções.
+    """
+    h = _table(UserHierarchy)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {h} (ancestor_id, descendant_id, depth) VALUES (%s, %s, 0) "
+            f"ON CONFLICT (ancestor_id, descendant_id) DO NOTHING",
+            [user_id, user_id],
+        )
+        cursor.execute(
+            f"""
+            DELETE FROM {h}
+             WHERE descendant_id IN (SELECT descendant_id FROM {h} WHERE ancestor_id = %s)
+               AND ancestor_id NOT IN (SELECT descendant_id FROM {h} WHERE ancestor_id = %s)
+            """,
+            [user_id, user_id],
+        )
+        if manager_id is not None:
+            cursor.execute(
+                f"INSERT INTO {h} (ancestor_id, descendant_id, depth) VALUES (%s, %s, 0) "
+                f"ON CONFLICT (ancestor_id, descendant_id) DO NOTHING",
+                [manager_id, manager_id],
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {h} (ancestor_id, descendant_id, depth)
+                SELECT sup.ancestor_id, sub.descendant_id, sup.depth + sub.depth + 1
+                  FROM {h} AS sup
+                 CROSS JOIN {h} AS sub
+                 WHERE sup.descendant_id = %s
+                   AND sub.ancestor_id = %s
+                ON CONFLICT (ancestor_id, descendant_id) DO UPDATE SET depth = EXCLUDED.depth
+                """,
+                [manager_id, user_id],
+            )
+    bump_generations(HIERARCHY_SCOPE)
+
+
+def reconstruir_hierarquia():
+    """Reconstrói toda a tabela de fecho a partir de User.manager (CTE recursiva)."""
+    h = _table(UserHierarchy)
+    u = _table(User)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {h}")
+        cursor.execute(
+            f"""
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM {u}
+                UNION ALL
+                SELECT t.ancestor_id, child.id, t.depth + 1
+                  FROM tree AS t
+                  JOIN {u} AS child ON child.manager_id = t.descendant_id
+                 WHERE t.depth < %s
+            )
+            INSERT INTO {h} (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, MIN(depth)
+              FROM tree
+             GROUP BY ancestor_id, descendant_id
+            """,
+            [MAX_DEPTH],
+        )
+    bump_generations(HIERARCHY_SCOPE)
@@ -0,0 +1,289 @@
+from datetime import datetime, time as dtime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.utils import timezone
+import numpy as np
+
+from .cleaning import cnpj_digitos
+from .models import Client, Sale
+
+# ---
+# Ficheiros e API de teste para os importadores
+# ---
+# Geradores de CSV nos formatos dos parceiros (latin-1, separador ';',
+# valores em formato brasileiro, CNPJs como o Excel os exporta: sem zeros
+# à esquerda, com pontuação ou em notação científica) e um servidor HTTP
+# local que responde como a API ELIQ (TransacaoSearch). Servem o
+# benchmark dos importadores (benchmark_imports) e testes manuais sem
+# ficheiros reais.
+#
+# Os IDs das vendas geradas começam por BENCH_ID_PREFIX, por isso as
+# vendas importadas a partir destes ficheiros podem ser apagadas sem
+# tocar nas reais (apagar_vendas_benchmark).
+
+BENCH_ID_PREFIX = 'BENCH'
+CHUNK_ROWS = 50_000
+
+NOMES = ['Posto São João', 'Mercado Ipê', 'Transportes Araújo', 'Farmácia Popular', 'Padaria Pão Dourado',
+         'Auto Peças Rondônia', 'Restaurante Sabor da Terra', 'Construtora Madeira', 'Distribuidora Guaporé']
+BIONIO_BENEFICIOS = ['Vale Alimentação', 'Vale Refeição', 'Vale Combustível', 'Bem-estar', 'Premiação']
+BIONIO_PAGAMENTOS = ['Boleto', 'Pix', 'Transferência']
+# Estados válidos e, no fim, os que o importador descarta
+BIONIO_ESTADOS = (['Transferido', 'Pago e Agendado'], ['Cancelado', 'Aguardando pagamento'])
+ROVEMA_TIPOS = ['Crédito', 'Débito', 'Crédito Parcelado', 'Pix']
+ROVEMA_BANDEIRAS = ['Visa', 'Mastercard', 'Elo', 'Hipercard', 'Amex']
+ROVEMA_ESTADOS = (['Pago', 'Antecipado'], ['Cancelado', 'Estornado'])
+ELIQ_PRODUTOS = [('Gasolina Comum', 'Combustível'), ('Diesel S10', 'Combustível'), ('Etanol', 'Combustível'),
+                 ('Troca de Óleo', 'Manutenção'), ('Lavagem', 'Serviços'), ('Pedágio', 'Pedágio')]
+
+
+def brl(valor, simbolo=False):
+    """1234.5 -> '1.234,50' (ou 'R$ 1.234,50')."""
+    texto = f"{valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return f"R$ {texto}" if simbolo else texto
+
+
+def cnpj_exportado(cnpj, estilo):
+    """Um CNPJ (inteiro ou texto) como aparece nos ficheiros dos parceiros."""
+    cnpj = cnpj_digitos(cnpj)
+    if estilo == 0:  # número: o Excel perde os zeros à esquerda
+        return str(int(cnpj))
+    if estilo == 1:
+        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+    # Notação científica com vírgula (e a precisão que isso perde)
+    return f"{int(cnpj):.5E}".replace('.', ',')
+
+
+def cnpjs_para_fixtures(n=5000, orphan_ratio=0.1, seed=0):
+    """
+    CNPJs de clientes existentes (para a atribuição encontrar carteiras)
+    mais uma fração de CNPJs desconhecidos (órfãos).
+    """
+    rng = np.random.default_rng(seed)
+    conhecidos = [cnpj_digitos(c) for c in Client.objects.order_by('cnpj').values_list('cnpj', flat=True)[:n]]
+    orfaos = max(1, int(max(len(conhecidos), 1) * orphan_ratio)) if conhecidos else n
+    desconhecidos = [f"{x:014d}" for x in rng.integers(10**12, 10**13, size=orfaos)]
+    return conhecidos + desconhecidos
+
+
+def _colunas_comuns(rng, n, cnpjs, dias, sci_ratio):
+    cliente = rng.integers(0, len(cnpjs), size=n)
+    estilo = rng.choice(3, size=n, p=[(1 - sci_ratio) / 2, (1 - sci_ratio) / 2, sci_ratio])
+    dia = rng.integers(0, max(dias, 1), size=n)
+    segundos = rng.integers(6 * 3600, 22 * 3600, size=n)
+    escolhas = rng.random(size=(n, 4))
+    return cliente, estilo, dia, segundos, escolhas
+
+
+def _escrever_csv(path, cabecalho, linhas_por_bloco):
+    with open(path, 'w', encoding='latin-1', newline='') as f:
+        f.write(';'.join(cabecalho) + '\r\n')
+        for bloco in linhas_por_bloco:
+            f.write(''.join(bloco))
+
+
+def gerar_csv_bionio(path, rows, start, end, cnpjs, seed=0, cancel_ratio=0.08, sci_ratio=0.1):
+    """Escreve um CSV no formato do Bionio com 'rows' pedidos entre start e end."""
+    rng = np.random.default_rng(seed)
+    dias = (end - start).days + 1
+    cabecalho = ['Número do pedido', 'Razão social', 'Nome fantasia', 'CNPJ da organização',
+                 'Nome do benefício', 'Tipo de pagamento', 'Status do pedido', 'Data do pedido',
+                 'Data do pagamento do pedido', 'Quantidade de colaboradores', 'Valor total do pedido']
+
+    def blocos():
+        for offset in range(0, rows, CHUNK_ROWS):
+            n = min(CHUNK_ROWS, rows - offset)
+            cliente, estilo, dia, _, e = _colunas_comuns(rng, n, cnpjs, dias, sci_ratio)
+            valor = np.round(1800.0 * rng.lognormal(0.0, 0.9, size=n), 2)
+            colaboradores = rng.integers(1, 300, size=n)
+            cancelado = e[:, 3] < cancel_ratio
+            bloco = []
+            for i in range(n):
+                validos, descartados = BIONIO_ESTADOS
+                estados = descartados if cancelado[i] else validos
+                pago = start + timedelta(days=int(dia[i]))
+                nome = NOMES[cliente[i] % len(NOMES)]
+                bloco.append(';'.join((
+                    f"{BENCH_ID_PREFIX}{offset + i}", f"{nome} Ltda", nome,
+                    cnpj_exportado(cnpjs[cliente[i]], estilo[i]),
+                    BIONIO_BENEFICIOS[int(e[i, 0] * len(BIONIO_BENEFICIOS))],
+                    BIONIO_PAGAMENTOS[int(e[i, 1] * len(BIONIO_PAGAMENTOS))],
+                    estados[int(e[i, 2] * len(estados))],
+                    (pago - timedelta(days=2)).strftime('%d/%m/%Y'), pago.strftime('%d/%m/%Y'),
+                    str(colaboradores[i]), brl(valor[i], simbolo=True),
+                )) + '\r\n')
+            yield bloco
+
+    _escrever_csv(path, cabecalho, blocos())
+
+
+def gerar_csv_rovema(path, rows, start, end, cnpjs, seed=0, cancel_ratio=0.05, sci_ratio=0.1):
+    """Escreve um CSV no formato do Rovema Pay com 'rows' parcelas entre start e end."""
+    rng = np.random.default_rng(seed)
+    dias = (end - start).days + 1
+    cabecalho = ['ID Venda', 'ID Parcela', 'Venda', 'CNPJ', 'EC', 'Tipo', 'Bandeira', 'Status', 'Bruto', 'Spread']
+
+    def blocos():
+        venda = 0
+        for offset in range(0, rows, CHUNK_ROWS):
+            n = min(CHUNK_ROWS, rows - offset)
+            cliente, estilo, dia, segundos, e = _colunas_comuns(rng, n, cnpjs, dias, sci_ratio)
+            bruto = np.round(250.0 * rng.lognormal(0.0, 0.8, size=n), 2)
+            spread = np.round(bruto * (0.01 + 0.025 * rng.random(size=n)), 2)
+            cancelado = e[:, 3] < cancel_ratio
+            bloco = []
+            parcela, c = 1, cliente[0]
+            for i in range(n):
+                validos, descartados = ROVEMA_ESTADOS
+                estados = descartados if cancelado[i] else validos
+                tipo = ROVEMA_TIPOS[int(e[i, 0] * len(ROVEMA_TIPOS))]
+                # Vendas parceladas ocupam várias linhas seguidas (uma por parcela, mesmo cliente)
+                if tipo != 'Crédito Parcelado' or parcela >= 6 or e[i, 1] < 0.3:
+                    venda, parcela, c = venda + 1, 1, cliente[i]
+                else:
+                    parcela += 1
+                instante = datetime.combine(start + timedelta(days=int(dia[i])), dtime.min) + timedelta(seconds=int(segundos[i]))
+                bloco.append(';'.join((
+                    f"{BENCH_ID_PREFIX}{venda}", str(parcela), instante.strftime('%d/%m/%Y %H:%M:%S'),
+                    cnpj_exportado(cnpjs[c], estilo[i]), NOMES[c % len(NOMES)], tipo,
+                    ROVEMA_BANDEIRAS[int(e[i, 1] * len(ROVEMA_BANDEIRAS))],
+                    estados[int(e[i, 2] * len(estados))], brl(bruto[i]), brl(spread[i]),
+                )) + '\r\n')
+            yield bloco
+
+    _escrever_csv(path, cabecalho, blocos())
+
+
+def gerar_transacoes_eliq(rows, start, end, cnpjs, seed=0, cancel_ratio=0.05):
+    """Lista de transações como a API ELIQ as devolve (ordenadas por data)."""
+    rng = np.random.default_rng(seed)
+    dias = (end - start).days + 1
+    cliente, _, dia, segundos, e = _colunas_comuns(rng, rows, cnpjs, dias, 0)
+    litros = np.round(rng.lognormal(3.5, 0.6, size=rows), 3)
+    preco = np.round(5.0 + 2.0 * rng.random(size=rows), 2)
+    ordem = np.lexsort((segundos, dia))
+    transacoes = []
+    for i in ordem:
+        nome_produto, categoria = ELIQ_PRODUTOS[int(e[i, 0] * len(ELIQ_PRODUTOS))]
+        total = round(float(litros[i] * preco[i]), 2)
+        instante = datetime.combine(start + timedelta(days=int(dia[i])), dtime.min) + timedelta(seconds=int(segundos[i]))
+        cliente_info = {'cnpj': cnpjs[cliente[i]], 'nome': NOMES[cliente[i] % len(NOMES)]}
+        produto_info = {'nome': nome_produto, 'categoria': categoria}
+        transacao = {
+            'id': f"{BENCH_ID_PREFIX}{i}",
+            'status': 'cancelada' if e[i, 3] < cancel_ratio else 'confirmada',
+            'data_cadastro': instante.strftime('%Y-%m-%d %H:%M:%S'),
+            'valor_total': total,
+            'valor_unitario': float(preco[i]),
+            'quantidade': float(litros[i]),
+            'valor_taxa_cliente': -round(total * (0.02 + 0.04 * float(e[i, 1])), 2),
+            'placa': f"ABC{int(e[i, 2] * 10000):04d}",
+            'hodometro': int(e[i, 1] * 300_000),
+            'estabelecimento': {'nome': 'Posto Parceiro', 'cidade': 'Porto Velho', 'uf': 'RO'},
+        }
+        # A API devolve o cliente e o produto no topo ou dentro de 'informacao'
+        if e[i, 2] < 0.5:
+            transacao.update(cliente=cliente_info, produto=produto_info)
+        else:
+            transacao['informacao'] = {'cliente': cliente_info, 'produto': produto_info}
+        transacoes.append(transacao)
+    return transacoes
+
+
+class ServidorEliqFalso:
+    """
+    Servidor HTTP local que imita o endpoint TransacaoSearch da API ELIQ:
+    GET ?TransacaoSearch[data_cadastro]=dd/mm/aaaa - dd/mm/aaaa com
+    'Authorization: Bearer <token>', devolve a lista de transações do
+    período em JSON, depois de 'latency' segundos.
+
+        with ServidorEliqFalso(transacoes, latency=0.2) as servidor:
+            settings.API_CREDENTIALS = {'eliq_url': servidor.url, 'eliq_token': servidor.token}
+    """
+
+    def __init__(self, transacoes, latency=0.0, token='token-local', host='127.0.0.1', port=0):
+        self.transacoes = transacoes
+        self.latency = latency
+        self.token = token
+        self.pedidos = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/transacao"
+
+    def _periodo(self, query):
+        try:
+            inicio, fim = parse_qs(query)['TransacaoSearch[data_cadastro]'][0].split(' - ')
+            return (datetime.strptime(inicio.strip(), '%d/%m/%Y').strftime('%Y-%m-%d'),
+                    datetime.strptime(fim.strip(), '%d/%m/%Y').strftime('%Y-%m-%d') + ' 23:59:59')
+        except (KeyError, ValueError):
+            return None
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor.pedidos += 1
+                if self.headers.get('Authorization') != f"Bearer {servidor.token}":
+                    return self._json(401, {'message': 'Unauthorized'})
+                periodo = servidor._periodo(urlparse(self.path).query)
+                if periodo is None:
+                    return self._json(400, {'message': 'TransacaoSearch[data_cadastro] inválido'})
+                time.sleep(servidor.latency)
+                inicio, fim = periodo
+                self._json(200, [t for t in servidor.transacoes if inicio <= t['data_cadastro'] <= fim])
+
+            def _json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def servir(self):
+        """Bloqueia a servir pedidos (comando fake_eliq_server)."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+def apagar_vendas_benchmark():
+    """Apaga as vendas importadas a partir destes ficheiros. Devolve quantas."""
+    apagadas, _ = Sale.objects.filter(raw_id__regex=rf'^[A-Z]+_{BENCH_ID_PREFIX}[0-9]').delete()
+    return apagadas
+
+
+def periodo_padrao(days=90):
+    today = timezone.localdate()
+    return today - timedelta(days=days - 1), today
@@ -0,0 +1,89 @@
+import io
+import os
+import subprocess
+import sys
+import traceback
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from .audit import flush_auditoria
+from .models import BackgroundJob
+
+
+def enqueue_job(kind, command, user=None, details=None, progress_total=0):
+    """
+    Cria o registo da tarefa e lança o comando de gestão em segundo plano,
+    da mesma forma que a Carga de Dados lança os importadores.
+
+    O comando recebe '--job-id' e deve usar run_job() para reportar o
+    progresso. Com settings.BACKGROUND_JOBS_INLINE = True o comando corre
+    no próprio processo (testes e desenvolvimento).
+    """
+    job = BackgroundJob.objects.create(
+        kind=kind, user=user, details=details or {}, progress_total=progress_total
+    )
+
+    if getattr(settings, 'BACKGROUND_JOBS_INLINE', False):
+        call_command(command, job_id=job.id, stdout=io.StringIO())
+        job.refresh_from_db()
+        return job
+
+    manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+    args = [sys.executable, manage_py, command, f"--job-id={job.id}"]
+    # O subprocesso só pode arrancar depois do commit, senão não vê a tarefa
+    transaction.on_commit(
+        lambda: subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    )
+    return job
+
+
+def run_job(job_id, handler):
+    """
+    Executa handler(job) marcando a tarefa como em execução, concluída ou
+    falhada. O valor devolvido pelo handler é guardado em details['result'].
+    """
+    job = BackgroundJob.objects.get(id=job_id)
+    job.status = BackgroundJob.Status.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    try:
+        result = handler(job)
+    except Exception as e:
+        job.status = BackgroundJob.Status.FAILED
+        job.error = f"{e}\n{traceback.format_exc()}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        raise
+    finally:
+        # A auditoria da tarefa fica gravada quando ela termina
+        flush_auditoria()
+
+    job.refresh_from_db(fields=['progress_done', 'progress_total'])
+    job.status = BackgroundJob.Status.DONE
+    job.finished_at = timezone.now()
+    if result is not None:
+        job.details['result'] = result
+    if job.progress_total and job.progress_done < job.progress_total:
+        job.progress_done = job.progress_total
+    job.save(update_fields=['status', 'finished_at', 'details', 'progress_done'])
+    return job
+
+
+def job_status_payload(job):
+    """Representação JSON do estado de uma tarefa (usada pelo polling da interface)."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'percent': job.percent,
+        'result': job.details.get('result'),
+        'error': job.error.splitlines()[0] if job.error else None,
+        'finished': job.status in (BackgroundJob.Status.DONE, BackgroundJob.Status.FAILED),
+    }
@@ -0,0 +1,40 @@
+from datetime import timedelta
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dashboard.audit import ARCHIVE_BATCH_SIZE, DEFAULT_RETENTION_DAYS, arquivar_auditoria, registar_auditoria
+
+
+class Command(BaseCommand):
+    help = 'Move os registos de auditoria mais antigos do que a retenção para ficheiros .jsonl.gz mensais (correr diariamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help=f'Dias mantidos na base de dados (por defeito settings.AUDIT_LOG_RETENTION_DAYS ou {DEFAULT_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--dir', default=None,
+            help='Pasta dos ficheiros (por defeito settings.AUDIT_LOG_ARCHIVE_DIR ou <BASE_DIR>/audit_archive)',
+        )
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Registos movidos por lote')
+
+    def handle(self, *args, **options):
+        days = options['days'] or getattr(settings, 'AUDIT_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+        if days < 1:
+            raise CommandError("A retenção tem de ser de pelo menos 1 dia.")
+        directory = (
+            options['dir']
+            or getattr(settings, 'AUDIT_LOG_ARCHIVE_DIR', None)
+            or os.path.join(settings.BASE_DIR, 'audit_archive')
+        )
+        before = timezone.now() - timedelta(days=days)
+
+        self.stdout.write(f"Arquivando registos de auditoria anteriores a {before:%d/%m/%Y} em {directory}...")
+        total = arquivar_auditoria(before, directory, batch_size=options['batch_size'])
+        if total:
+            registar_auditoria(None, "arquivo_auditoria", {"archived": total, "before": before.isoformat()})
+        self.stdout.write(self.style.SUCCESS(f"Arquivo concluído! {total} registos movidos."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.assignment import aplicar_atribuicoes
+from dashboard.jobs import run_job
+
+
+class Command(BaseCommand):
+    help = 'Aplica em segundo plano um lote de atribuições de clientes (criado em Atribuir Clientes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=int, required=True, help='ID da tarefa (BackgroundJob) com as atribuições')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Iniciando atribuição de clientes em lote...'))
+
+        def handler(job):
+            return aplicar_atribuicoes(job.details['atribuicoes'], user=job.user, job=job)
+
+        try:
+            job = run_job(options['job_id'], handler)
+        except Exception as e:
+            raise CommandError(f"Erro durante a atribuição em lote: {e}")
+
+        result = job.details.get('result', {})
+        self.stdout.write(self.style.SUCCESS(
+            f"Atribuição concluída! {result.get('clients_saved', 0)} clientes e "
+            f"{result.get('sales_updated', 0)} vendas atualizadas."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.facts import atualizar_factos
+from dashboard.jobs import run_job
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os factos de desempenho mensais (receita, meta, comissão e % atingido) por consultor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=int, help='ID da tarefa (BackgroundJob) com os meses/consultores a atualizar', default=None)
+        parser.add_argument('--year', type=int, help='Ano a recalcular (com --month)', default=None)
+        parser.add_argument('--month', type=int, help='Mês a recalcular (com --year)', default=None)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Iniciando atualização dos factos de desempenho...'))
+
+        if options['job_id']:
+            def handler(job):
+                saved = atualizar_factos(
+                    meses=job.details.get('months'),
+                    consultant_ids=job.details.get('consultant_ids'),
+                )
+                return {'facts_saved': saved}
+
+            try:
+                job = run_job(options['job_id'], handler)
+            except Exception as e:
+                raise CommandError(f"Erro durante a atualização dos factos: {e}")
+            saved = job.details['result']['facts_saved']
+        else:
+            if bool(options['year']) != bool(options['month']):
+                raise CommandError("Indique --year e --month em conjunto (ou nenhum, para recalcular tudo).")
+            meses = [(options['year'], options['month'])] if options['year'] else None
+            saved = atualizar_factos(meses=meses)
+
+        self.stdout.write(self.style.SUCCESS(f"Atualização concluída! {saved} factos gravados."))
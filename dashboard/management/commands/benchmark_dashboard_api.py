@@ -0,0 +1,94 @@
+import asyncio
+from importlib import import_module
+import statistics
+import time
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from dashboard.models import User
+
+ENDPOINTS = (
+    ('sync', 'api_dashboard_geral_data'),
+    ('async', 'api_dashboard_geral_data_async'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga da API do Dashboard Geral (síncrona e/ou async) contra um servidor em execução: '
+        'latência e débito (pedidos/s). Corra-o contra cada perfil do gunicorn para comparar'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', type=str, default='http://127.0.0.1:8000', help='URL do servidor a testar')
+        parser.add_argument('--user', type=str, required=True, help='E-mail ou ID do utilizador cujo âmbito é usado')
+        parser.add_argument('--requests', type=int, default=20, help='Pedidos por endpoint')
+        parser.add_argument('--concurrency', type=int, default=4, help='Pedidos em simultâneo')
+        parser.add_argument('--start-date', type=str, default=None, help='Filtro start_date (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=str, default=None, help='Filtro end_date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--endpoints', choices=[label for label, _ in ENDPOINTS] + ['all'], default='all',
+            help='API a testar (a async só faz sentido sob ASGI)'
+        )
+
+    def handle(self, *args, **options):
+        ref = options['user']
+        lookup = {'id': int(ref)} if ref.isdigit() else {'email__iexact': ref}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"Utilizador '{ref}' não encontrado.")
+
+        params = {k: options[k] for k in ('start_date', 'end_date') if options[k]}
+
+        # Sessão temporária do utilizador (evita guardar passwords no comando)
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+
+        try:
+            for label, url_name in ENDPOINTS:
+                if options['endpoints'] not in ('all', label):
+                    continue
+                url = options['base_url'].rstrip('/') + reverse(url_name)
+                timings, elapsed = asyncio.run(self._medir(
+                    url, params, {settings.SESSION_COOKIE_NAME: session.session_key},
+                    options['requests'], options['concurrency'],
+                ))
+                self._relatorio(label, timings, elapsed)
+        finally:
+            session.delete()
+
+    async def _medir(self, url, params, cookies, total, concurrency):
+        """Tempos (ms) de `total` pedidos, no máximo `concurrency` em simultâneo, e a duração total (s)."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with httpx.AsyncClient(cookies=cookies, timeout=120.0, follow_redirects=False) as client:
+            async def pedido():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(url, params=params)
+                    elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    raise CommandError(f"{url} respondeu {response.status_code} (sessão/URL inválidos?)")
+                return elapsed
+
+            await pedido()  # Aquecimento (ligações, caches do servidor)
+            start = time.perf_counter()
+            timings = await asyncio.gather(*(pedido() for _ in range(total)))
+            return timings, time.perf_counter() - start
+
+    def _relatorio(self, label, timings, elapsed):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{label:>5}: n={len(timings)} min={timings[0]:.1f}ms "
+            f"mediana={statistics.median(timings):.1f}ms p95={p95:.1f}ms max={timings[-1]:.1f}ms "
+            f"débito={len(timings) / elapsed:.1f} pedidos/s"
+        )
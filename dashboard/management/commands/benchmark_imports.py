@@ -0,0 +1,172 @@
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.utils import timezone
+
+from dashboard.audit import flush_auditoria
+from dashboard.benchmarks import cabecalho_relatorio
+from dashboard.facts import atualizar_factos, meses_com_dados
+from dashboard.generations import registar_importacao
+from dashboard.import_fixtures import (
+    ServidorEliqFalso, apagar_vendas_benchmark, cnpjs_para_fixtures, gerar_csv_bionio,
+    gerar_csv_rovema, gerar_transacoes_eliq, periodo_padrao,
+)
+from dashboard.models import AuditLog
+from dashboard.telemetry import rss_atual
+
+FONTES = {
+    # fonte: (comando, chave em details, valor, nome em registar_importacao)
+    'bionio': ('import_bionio', 'file_type', 'bionio', 'Bionio'),
+    'rovema': ('import_rovema', 'file_type', 'rovema', 'Rovema Pay'),
+    'eliq': ('import_eliq', 'api_type', 'eliq', 'ELIQ'),
+}
+ACOES_FIM = ('fim_carga_csv', 'fim_carga_api', 'falha_carga_csv', 'falha_carga_api')
+
+
+def _importar(command, args):
+    """Processo filho: importa, grava a auditoria e fecha as ligações (o filho sai com os._exit)."""
+    try:
+        call_command(command, *args, stdout=io.StringIO())
+    finally:
+        flush_auditoria()
+        connections.close_all()
+
+
+def _executar(command, args, isolado):
+    """
+    Corre o importador e devolve o código de saída. Isolado, corre num
+    processo filho (fork): o pico de RSS medido é o dessa importação, e
+    não o maior de todas as anteriores deste processo.
+    """
+    if not isolado:
+        try:
+            call_command(command, *args, stdout=io.StringIO())
+        except SystemExit as e:
+            return e.code
+        finally:
+            flush_auditoria()
+        return 0
+    connections.close_all()
+    processo = multiprocessing.get_context('fork').Process(target=_importar, args=(command, args))
+    processo.start()
+    processo.join()
+    return processo.exitcode
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark dos importadores (Bionio, Rovema Pay e ELIQ) com ficheiros gerados e uma API ELIQ local: '
+        'linhas/s, tempo por fase e pico de memória, num relatório JSON comparável. Use numa base de dados de testes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=str, default='10000,100000', help='Tamanhos a medir, separados por vírgulas')
+        parser.add_argument('--sources', type=str, default='bionio,rovema,eliq', help='Importadores a medir')
+        parser.add_argument('--days', type=int, default=90, help='Dias de vendas nos ficheiros (até hoje)')
+        parser.add_argument('--latency-ms', type=int, default=200, help='Atraso da API ELIQ local')
+        parser.add_argument('--seed', type=int, default=0, help='Semente dos ficheiros gerados')
+        parser.add_argument('--tracemalloc', action='store_true', help='Mede também o pico de memória Python por fase')
+        parser.add_argument('--in-process', action='store_true', help='Corre os importadores neste processo (sem fork)')
+        parser.add_argument('--keep-files', type=str, default=None, help='Guarda os CSV gerados nesta pasta')
+        parser.add_argument('--output', type=str, default=None, help='Ficheiro JSON do relatório (por omissão, stdout)')
+
+    def handle(self, *args, **options):
+        fontes = [f.strip() for f in options['sources'].split(',') if f.strip()]
+        desconhecidas = set(fontes) - set(FONTES)
+        if desconhecidas:
+            raise CommandError(f"Fontes desconhecidas: {', '.join(sorted(desconhecidas))}")
+        try:
+            tamanhos = [int(s) for s in options['rows'].split(',') if s.strip()]
+        except ValueError:
+            raise CommandError("--rows deve ser uma lista de inteiros separados por vírgulas.")
+        isolado = not options['in_process'] and 'fork' in multiprocessing.get_all_start_methods()
+
+        start, end = periodo_padrao(options['days'])
+        cnpjs = cnpjs_para_fixtures(seed=options['seed'])
+        relatorio = cabecalho_relatorio(runs=1)
+        relatorio.update(isolated=isolado, latency_ms=options['latency_ms'])
+        pasta = tempfile.mkdtemp(prefix='benchmark_imports_')
+        extra = ['--tracemalloc'] if options['tracemalloc'] else []
+
+        try:
+            for rows in tamanhos:
+                for fonte in fontes:
+                    self.stderr.write(f"{fonte}: {rows} linhas...")
+                    apagar_vendas_benchmark()
+                    resultado = self._medir(fonte, rows, start, end, cnpjs, pasta, options, isolado, extra)
+                    relatorio['results'].append(resultado)
+                    self.stderr.write(
+                        f"  {resultado['error']}" if 'error' in resultado else
+                        f"  {resultado['rows_per_second']} linhas/s, {resultado['total_seconds']}s, "
+                        f"pico de RSS {resultado['peak_rss_mb']} MB"
+                    )
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+            # Repõe os factos e as gerações sem as vendas do benchmark
+            apagar_vendas_benchmark()
+            atualizar_factos(meses_com_dados())
+            registar_importacao(*(FONTES[f][3] for f in fontes))
+
+        saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(saida + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Relatório gravado em {options['output']}"))
+        else:
+            self.stdout.write(saida)
+
+    def _medir(self, fonte, rows, start, end, cnpjs, pasta, options, isolado, extra):
+        command, chave, valor, _ = FONTES[fonte]
+        resultado = {'source': fonte, 'rows': rows}
+        inicio = timezone.now()
+        base_rss = rss_atual()
+
+        if fonte == 'eliq':
+            transacoes = gerar_transacoes_eliq(rows, start, end, cnpjs, seed=options['seed'])
+            with ServidorEliqFalso(transacoes, latency=options['latency_ms'] / 1000) as servidor:
+                credenciais = {'eliq_url': servidor.url, 'eliq_token': servidor.token}
+                with override_settings(API_CREDENTIALS=credenciais):
+                    segundos = time.perf_counter()
+                    codigo = _executar(command, [start.isoformat(), end.isoformat(), *extra], isolado)
+                    segundos = time.perf_counter() - segundos
+        else:
+            gerador = gerar_csv_bionio if fonte == 'bionio' else gerar_csv_rovema
+            path = os.path.join(pasta, f"{fonte}-{rows}.csv")
+            gerador(path, rows, start, end, cnpjs, seed=options['seed'])
+            resultado['file_mb'] = round(os.path.getsize(path) / (1024 * 1024), 1)
+            if options['keep_files']:
+                os.makedirs(options['keep_files'], exist_ok=True)
+                shutil.copy(path, options['keep_files'])
+            segundos = time.perf_counter()
+            # O import_rovema apaga o ficheiro no fim
+            codigo = _executar(command, [path, *extra], isolado)
+            segundos = time.perf_counter() - segundos
+
+        resultado['wall_seconds'] = round(segundos, 3)
+        resultado['baseline_rss_mb'] = round(base_rss / (1024 * 1024), 1)
+        log = (
+            AuditLog.objects.filter(action__in=ACOES_FIM, timestamp__gte=inicio, details__contains={chave: valor})
+            .order_by('-id').first()
+        )
+        if codigo or log is None or 'telemetry' not in log.details:
+            resultado['error'] = (log.details.get('error') if log else None) or f"código de saída {codigo}"
+            return resultado
+        telemetria = log.details['telemetry']
+        resultado.update(
+            rows_saved=log.details.get('rows_saved'),
+            orphans_found=log.details.get('orphans_found'),
+            rows_per_second=telemetria.get('rows_per_second'),
+            total_seconds=telemetria['total_seconds'],
+            peak_rss_mb=telemetria['peak_rss_mb'],
+            phases=telemetria['phases'],
+        )
+        return resultado
@@ -0,0 +1,84 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.benchmarks import cabecalho_relatorio, comparar, medir_views
+from dashboard.models import Client, Sale
+from dashboard.synthetic import apagar_dados_sinteticos, gerar_dados_sinteticos
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede as views principais (dashboard geral, minha carteira, detalhe de cliente, atribuição) '
+        'para vários tamanhos de dados sintéticos e grava um relatório JSON comparável'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=str, default='10000,100000,1000000',
+            help='Números de vendas a gerar, separados por vírgulas (cada tamanho apaga e regera os dados sintéticos)'
+        )
+        parser.add_argument('--no-generate', action='store_true', help='Mede os dados atuais, sem gerar')
+        parser.add_argument('--runs', type=int, default=5, help='Pedidos medidos por view (depois de um de aquecimento)')
+        parser.add_argument('--views', type=str, default=None, help='Apenas estas medições, separadas por vírgulas')
+        parser.add_argument('--clients-per-sale', type=float, default=0.02, help='Clientes gerados por venda')
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos dados sintéticos')
+        parser.add_argument('--output', type=str, default=None, help='Ficheiro JSON do relatório (por omissão, stdout)')
+        parser.add_argument('--compare', type=str, default=None, help='Relatório anterior com que comparar as medianas')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs tem de ser pelo menos 1.")
+        only = {v.strip() for v in options['views'].split(',')} if options['views'] else None
+        anterior = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    anterior = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Não foi possível ler {options['compare']}: {e}")
+
+        relatorio = cabecalho_relatorio(options['runs'])
+
+        if options['no_generate']:
+            tamanhos = [None]
+        else:
+            try:
+                tamanhos = [int(s) for s in options['sizes'].split(',') if s.strip()]
+            except ValueError:
+                raise CommandError("--sizes deve ser uma lista de inteiros separados por vírgulas.")
+
+        for tamanho in tamanhos:
+            if tamanho is not None:
+                self.stderr.write(f"A gerar {tamanho} vendas sintéticas...")
+                apagar_dados_sinteticos()
+                gerar_dados_sinteticos(
+                    sales=tamanho, clients=max(50, int(tamanho * options['clients_per_sale'])),
+                    seed=options['seed'],
+                )
+            self.stderr.write("A medir as views...")
+            views = medir_views(runs=options['runs'], only=only)
+            relatorio['results'].append({
+                'sales': Sale.objects.count(),
+                'clients': Client.objects.count(),
+                'views': views,
+            })
+            for nome, dados in views.items():
+                self.stderr.write(
+                    f"  {nome}: {dados['error']}" if 'error' in dados else
+                    f"  {nome}: mediana {dados['median_ms']} ms, p95 {dados['p95_ms']} ms, "
+                    f"{dados['queries']} queries, {dados['bytes']} bytes"
+                )
+
+        saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(saida + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Relatório gravado em {options['output']}"))
+        else:
+            self.stdout.write(saida)
+
+        if anterior:
+            self.stderr.write("Comparação com o relatório anterior (mediana):")
+            for vendas, nome, antes, agora, razao in comparar(relatorio, anterior):
+                self.stderr.write(f"  {vendas} vendas, {nome}: {antes} -> {agora} ms ({razao:.2f}x)")
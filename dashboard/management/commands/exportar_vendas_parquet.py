@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.analytics import EXPORT_BATCH_SIZE, AnaliseIndisponivel, exportar_vendas_parquet, pasta_parquet
+from dashboard.db_router import replica_alias
+
+
+class Command(BaseCommand):
+    help = 'Exporta as vendas para Parquet (um ficheiro por mês), só os meses novos ou alterados (correr no cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=None,
+            help='Pasta dos ficheiros (por defeito settings.ANALYTICS_PARQUET_DIR ou <BASE_DIR>/analytics/sales)',
+        )
+        parser.add_argument('--full', action='store_true', help='Reescreve todos os meses')
+        parser.add_argument('--replica', action='store_true', help='Lê as vendas da réplica (settings.DASHBOARD_REPLICA_DB)')
+        parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE, help='Vendas lidas e escritas por lote')
+
+    def handle(self, *args, **options):
+        using = 'default'
+        if options['replica']:
+            using = replica_alias()
+            if using is None:
+                raise CommandError("Não há réplica configurada (settings.DASHBOARD_REPLICA_DB).")
+        directory = options['dir'] or pasta_parquet()
+
+        self.stdout.write(f"Exportando vendas para {directory}...")
+        inicio = time.perf_counter()
+        try:
+            resultado = exportar_vendas_parquet(
+                directory, full=options['full'], using=using,
+                batch_size=options['batch_size'], log=self.stdout.write,
+            )
+        except AnaliseIndisponivel as e:
+            raise CommandError(str(e))
+        vendas = sum(resultado['exported'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Exportação concluída em {time.perf_counter() - inicio:.1f}s! "
+            f"{len(resultado['exported'])} meses reescritos ({vendas} vendas), "
+            f"{resultado['unchanged']} sem alterações, {len(resultado['removed'])} removidos."
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.import_fixtures import ServidorEliqFalso, cnpjs_para_fixtures, gerar_transacoes_eliq, periodo_padrao
+
+
+class Command(BaseCommand):
+    help = 'Servidor local que imita a API ELIQ (TransacaoSearch), para testar o import_eliq sem a API real'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765, help='Porta (em 127.0.0.1)')
+        parser.add_argument('--rows', type=int, default=50_000, help='Número de transações servidas')
+        parser.add_argument('--days', type=int, default=90, help='Dias de transações (até hoje)')
+        parser.add_argument('--latency-ms', type=int, default=500, help='Atraso de cada resposta')
+        parser.add_argument('--token', type=str, default='token-local', help='Token Bearer aceite')
+        parser.add_argument('--seed', type=int, default=0, help='Semente das transações')
+
+    def handle(self, *args, **options):
+        start, end = periodo_padrao(options['days'])
+        transacoes = gerar_transacoes_eliq(options['rows'], start, end, cnpjs_para_fixtures(seed=options['seed']), seed=options['seed'])
+        servidor = ServidorEliqFalso(
+            transacoes, latency=options['latency_ms'] / 1000, token=options['token'], port=options['port'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"API ELIQ local em {servidor.url} ({len(transacoes)} transações, {start} a {end})"))
+        self.stdout.write(f"API_CREDENTIALS = {{'eliq_url': '{servidor.url}', 'eliq_token': '{options['token']}'}}")
+        try:
+            servidor.servir()
+        except KeyboardInterrupt:
+            pass
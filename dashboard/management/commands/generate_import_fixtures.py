@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.import_fixtures import cnpjs_para_fixtures, gerar_csv_bionio, gerar_csv_rovema, periodo_padrao
+
+GERADORES = {'bionio': gerar_csv_bionio, 'rovema': gerar_csv_rovema}
+
+
+class Command(BaseCommand):
+    help = 'Gera um CSV de teste no formato do Bionio ou do Rovema Pay, com o número de linhas pedido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=sorted(GERADORES), help='Formato do ficheiro')
+        parser.add_argument('output', type=str, help='Caminho do CSV a escrever')
+        parser.add_argument('--rows', type=int, default=100_000, help='Número de linhas')
+        parser.add_argument('--days', type=int, default=90, help='Dias de vendas (até hoje)')
+        parser.add_argument('--start-date', type=str, default=None, help='Data inicial (YYYY-MM-DD), em vez de --days')
+        parser.add_argument('--orphan-ratio', type=float, default=0.1, help='CNPJs desconhecidos, em fração dos clientes usados')
+        parser.add_argument('--seed', type=int, default=0, help='Semente (os mesmos parâmetros geram o mesmo ficheiro)')
+
+    def handle(self, *args, **options):
+        start, end = periodo_padrao(options['days'])
+        if options['start_date']:
+            try:
+                start = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Formato de data inválido. Use YYYY-MM-DD.")
+        cnpjs = cnpjs_para_fixtures(orphan_ratio=options['orphan_ratio'], seed=options['seed'])
+        GERADORES[options['source']](options['output'], options['rows'], start, end, cnpjs, seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['rows']} linhas ({options['source']}, {start} a {end}) escritas em {options['output']}"
+        ))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.synthetic import SYNTHETIC_DOMAIN, SYNTHETIC_PASSWORD, apagar_dados_sinteticos, gerar_dados_sinteticos
+
+
+class Command(BaseCommand):
+    help = 'Gera dados sintéticos realistas (utilizadores, equipas, clientes, metas, regras e milhões de vendas) para benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=1_000_000, help='Número de vendas (as três fontes)')
+        parser.add_argument('--clients', type=int, default=20_000, help='Clientes com carteira')
+        parser.add_argument('--consultants', type=int, default=200, help='Número de consultores')
+        parser.add_argument('--managers', type=int, default=20, help='Número de gestores (1 em cada 10 é diretor)')
+        parser.add_argument('--months', type=int, default=24, help='Meses de histórico (até ao mês atual)')
+        parser.add_argument('--orphan-ratio', type=float, default=0.05, help='CNPJs órfãos, em fração dos clientes')
+        parser.add_argument('--seed', type=int, default=42, help='Semente (os mesmos parâmetros geram os mesmos dados)')
+        parser.add_argument('--reset', action='store_true', help='Apaga os dados sintéticos anteriores antes de gerar')
+        parser.add_argument('--delete', action='store_true', help='Apenas apaga os dados sintéticos')
+
+    def handle(self, *args, **options):
+        if options['reset'] or options['delete']:
+            deleted = apagar_dados_sinteticos()
+            self.stdout.write(f"Dados sintéticos anteriores apagados ({deleted} vendas).")
+            if options['delete']:
+                return
+
+        if options['consultants'] < 1 or options['managers'] < 1 or options['clients'] < 1:
+            raise CommandError("São precisos pelo menos 1 consultor, 1 gestor e 1 cliente.")
+
+        inicio = time.perf_counter()
+
+        def progresso(feitas, total):
+            self.stdout.write(f"  {feitas}/{total} vendas ({feitas / (time.perf_counter() - inicio):,.0f}/s)")
+
+        self.stdout.write(self.style.SUCCESS('Gerando dados sintéticos...'))
+        try:
+            resumo = gerar_dados_sinteticos(
+                sales=options['sales'], clients=options['clients'],
+                consultants=options['consultants'], managers=options['managers'],
+                months=options['months'], orphan_ratio=options['orphan_ratio'],
+                seed=options['seed'], progress=progresso,
+            )
+        except Exception as e:
+            raise CommandError(f"Erro ao gerar os dados (já existem dados sintéticos? use --reset): {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {time.perf_counter() - inicio:.1f}s: "
+            + ", ".join(f"{key}={value}" for key, value in resumo.items())
+        ))
+        self.stdout.write(f"Login: admin_sint@{SYNTHETIC_DOMAIN} / {SYNTHETIC_PASSWORD}")
@@ -1,30 +1,18 @@
 import pandas as pd
 from datetime import datetime
-from decimal import Decimal
 import sys
 import os 
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
-from dashboard.models import User, Client, Sale, AuditLog
-
-def clean_value(value_str):
-    if pd.isna(value_str): return Decimal('0.0')
-    if isinstance(value_str, (int, float, Decimal)): return Decimal(value_str)
-    value_str = str(value_str).strip().replace("R$", "").replace("%", "")
-    value_str = value_str.replace(".", "").replace(",", ".")
-    try: return Decimal(value_str)
-    except Exception: return Decimal('0.0')
-
-def clean_cnpj(cnpj_str):
-    if pd.isna(cnpj_str): return None
-    cnpj_str = str(cnpj_str)
-    if 'E' in cnpj_str.upper():
-        try: cnpj_str = "{:.0f}".format(float(cnpj_str.replace(',', '.')))
-        except: pass 
-    cleaned_cnpj = "".join(filter(str.isdigit, cnpj_str))
-    return cleaned_cnpj.zfill(14)
+from dashboard.audit import registar_auditoria
+from dashboard.cleaning import clean_cnpj, clean_value
+from dashboard.models import User, Client, Sale
+from dashboard.facts import atualizar_factos, meses_das_vendas
+from dashboard.generations import registar_importacao
+from dashboard.snapshots import agendar_aquecimento
+from dashboard.telemetry import TelemetriaImportacao, formatar_telemetria
 
 class Command(BaseCommand):
     help = 'Importa dados de vendas do arquivo CSV Rovema Pay'
@@ -32,6 +20,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str, help='O caminho para o arquivo RovemaPay.csv')
         parser.add_argument('--user-id', type=int, help='ID do utilizador que iniciou a ação', default=None)
+        parser.add_argument('--tracemalloc', action='store_true', help='Mede também o pico de memória Python de cada fase (mais lento)')
 
     @transaction.atomic
     def handle(self, *args, **options):
@@ -44,84 +33,101 @@ class Command(BaseCommand):
             except User.DoesNotExist: user = None
             
         log_details = {"file_type": "rovema", "filename": os.path.basename(file_path)}
+        telemetria = TelemetriaImportacao(tracemalloc_ativo=options['tracemalloc'])
 
         try:
-            self.stdout.write("Carregando mapa de clientes e consultores...")
-            client_map = {c.cnpj: c for c in Client.objects.all()}
-            user_map = {u: u.manager for u in User.objects.filter(role=User.Role.CONSULTANT)}
-            cnpj_to_consultant = {c.cnpj: c.consultant for c in Client.objects.all() if c.consultant}
+            with telemetria.fase('mapas'):
+                self.stdout.write("Carregando mapa de clientes e consultores...")
+                client_map = {c.cnpj: c for c in Client.objects.all()}
+                user_map = {u: u.manager for u in User.objects.filter(role=User.Role.CONSULTANT)}
+                cnpj_to_consultant = {c.cnpj: c.consultant for c in Client.objects.all() if c.consultant}
 
-            try:
-                df = pd.read_csv(
-                    file_path, sep=';', dtype=str, encoding='latin-1'
-                )
-            except Exception as e:
-                raise Exception(f"Erro ao ler o CSV: {e}")
+            with telemetria.fase('leitura'):
+                try:
+                    df = pd.read_csv(
+                        file_path, sep=';', dtype=str, encoding='latin-1'
+                    )
+                except Exception as e:
+                    raise Exception(f"Erro ao ler o CSV: {e}")
 
-            df_paid = df[df['Status'].isin(['Pago', 'Antecipado'])].copy()
-            if df_paid.empty:
-                self.stdout.write(self.style.WARNING("Nenhum registro de venda válida encontrado."))
-                return
-            
-            sales_to_process = {}
-            total_rows = len(df_paid)
-            orphans_found = 0
-            
-            for index, row in df_paid.iterrows():
-                cnpj = clean_cnpj(row['CNPJ'])
-                if not cnpj: continue 
+            with telemetria.fase('limpeza'):
+                df_paid = df[df['Status'].isin(['Pago', 'Antecipado'])].copy()
+                if df_paid.empty:
+                    self.stdout.write(self.style.WARNING("Nenhum registro de venda válida encontrado."))
+                    return
+                
+                total_rows = len(df_paid)
+                linhas = []
+                for index, row in df_paid.iterrows():
+                    cnpj = clean_cnpj(row['CNPJ'])
+                    if not cnpj: continue 
 
-                try:
-                    naive_datetime = datetime.strptime(row['Venda'], "%d/%m/%Y %H:%M:%S")
-                    data_venda = timezone.make_aware(naive_datetime, timezone.get_default_timezone())
-                except: continue 
+                    try:
+                        naive_datetime = datetime.strptime(row['Venda'], "%d/%m/%Y %H:%M:%S")
+                        data_venda = timezone.make_aware(naive_datetime, timezone.get_default_timezone())
+                    except: continue 
 
-                revenue_gross = clean_value(row['Bruto'])
-                revenue_net = clean_value(row['Spread'])
-                doc_id = f"ROVEMA_{row['ID Venda']}_{row['ID Parcela']}"
+                    linhas.append((cnpj, f"ROVEMA_{row['ID Venda']}_{row['ID Parcela']}", dict(
+                        raw_client_name=row['EC'],
+                        date=data_venda, revenue_gross=clean_value(row['Bruto']), revenue_net=clean_value(row['Spread']),
+                        product_name=row['Tipo'], product_detail=row['Bandeira'],
+                        status=row['Status'],
+                    )))
 
-                client_obj = client_map.get(cnpj)
-                consultant_obj = client_obj.consultant if client_obj else cnpj_to_consultant.get(cnpj)
-                manager_obj = client_obj.manager if client_obj else (user_map.get(consultant_obj) if consultant_obj else None)
+            with telemetria.fase('atribuicao'):
+                sales_to_process = {}
+                orphans_found = 0
+                for cnpj, doc_id, campos in linhas:
+                    client_obj = client_map.get(cnpj)
+                    consultant_obj = client_obj.consultant if client_obj else cnpj_to_consultant.get(cnpj)
+                    manager_obj = client_obj.manager if client_obj else (user_map.get(consultant_obj) if consultant_obj else None)
 
-                if not consultant_obj:
-                    orphans_found += 1
+                    if not consultant_obj:
+                        orphans_found += 1
+                    
+                    sales_to_process[doc_id] = Sale(
+                        source="Rovema Pay", raw_id=doc_id, client=client_obj,
+                        consultant=consultant_obj, manager=manager_obj,
+                        raw_client_cnpj=cnpj, **campos,
+                    )
+            
+            with telemetria.fase('gravacao'):
+                final_sales_list = list(sales_to_process.values())
+                self.stdout.write(f"Processamento concluído. {len(final_sales_list)} vendas ÚNICAS prontas para salvar.")
                 
-                sale = Sale(
-                    source="Rovema Pay", raw_id=doc_id, client=client_obj,
-                    consultant=consultant_obj, manager=manager_obj,
-                    raw_client_cnpj=cnpj, raw_client_name=row['EC'],
-                    date=data_venda, revenue_gross=revenue_gross, revenue_net=revenue_net,
-                    product_name=row['Tipo'], product_detail=row['Bandeira'],
-                    status=row['Status'],
+                Sale.objects.bulk_create(
+                    final_sales_list, batch_size=1000,
+                    unique_fields=['source_ref', 'raw_id'],
+                    update_conflicts=True,
+                    update_fields=['client', 'consultant', 'manager', 'date', 'revenue_gross', 
+                                   'revenue_net', 'product_name_ref', 'product_detail_ref', 'status_ref']
                 )
-                sales_to_process[doc_id] = sale
-            
-            final_sales_list = list(sales_to_process.values())
-            self.stdout.write(f"Processamento concluído. {len(final_sales_list)} vendas ÚNICAS prontas para salvar.")
-            
-            Sale.objects.bulk_create(
-                final_sales_list, batch_size=1000,
-                unique_fields=['source', 'raw_id'],
-                update_conflicts=True,
-                update_fields=['client', 'consultant', 'manager', 'date', 'revenue_gross', 
-                               'revenue_net', 'product_name', 'product_detail', 'status']
-            )
+
+            with telemetria.fase('pos_processamento'):
+                # Atualiza os factos de desempenho apenas dos meses importados
+                facts_saved = atualizar_factos(meses_das_vendas(final_sales_list))
+                # Invalida as ETags/caches que dependem das vendas desta fonte
+                registar_importacao("Rovema Pay")
+                # Pré-calcula as vistas por defeito em cache (em segundo plano, após o commit)
+                agendar_aquecimento(user)
             
             log_details.update({
                 "status": "Sucesso",
                 "rows_found": len(df),
                 "rows_processed": total_rows,
                 "rows_saved": len(final_sales_list),
-                "orphans_found": orphans_found
+                "orphans_found": orphans_found,
+                "facts_saved": facts_saved,
+                "telemetry": telemetria.resumo(rows=total_rows),
             })
-            AuditLog.objects.create(user=user, action="fim_carga_csv", details=log_details)
+            registar_auditoria(user, "fim_carga_csv", log_details)
             self.stdout.write(self.style.SUCCESS(f"Importação Rovema Pay concluída! {len(final_sales_list)} registros salvos."))
+            self.stdout.write(formatar_telemetria(log_details["telemetry"]))
 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"Erro durante a importação: {e}"))
-            log_details.update({"status": "Falha", "error": str(e)})
-            AuditLog.objects.create(user=user, action="falha_carga_csv", details=log_details)
+            log_details.update({"status": "Falha", "error": str(e), "telemetry": telemetria.resumo()})
+            registar_auditoria(user, "falha_carga_csv", log_details)
             sys.exit(1)
 
         # --- (INÍCIO DA CORREÇÃO) ---
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboard.hierarchy import reconstruir_hierarquia
+from dashboard.models import UserHierarchy
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a tabela de fecho da hierarquia (UserHierarchy) a partir de User.manager'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.stdout.write("Reconstruindo a hierarquia de utilizadores...")
+        reconstruir_hierarquia()
+        self.stdout.write(self.style.SUCCESS(
+            f"Hierarquia reconstruída! {UserHierarchy.objects.count()} ligações."
+        ))
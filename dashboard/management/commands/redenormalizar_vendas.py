@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.jobs import run_job
+from dashboard.redenormalization import DEFAULT_CHUNK_SIZE, redenormalizar_vendas
+
+
+class Command(BaseCommand):
+    help = 'Atualiza o consultor/gestor das vendas afetadas por uma mudança de carteira ou de equipa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=int, required=True, help='ID da tarefa (BackgroundJob) com os clientes/consultores afetados')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='IDs de vendas por lote')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Iniciando reatribuição das vendas...'))
+
+        def handler(job):
+            updated = redenormalizar_vendas(
+                client_cnpjs=job.details.get('client_cnpjs', []),
+                consultant_ids=job.details.get('consultant_ids', []),
+                job=job,
+                chunk_size=options['chunk_size'],
+            )
+            return {'sales_updated': updated}
+
+        try:
+            job = run_job(options['job_id'], handler)
+        except Exception as e:
+            raise CommandError(f"Erro durante a reatribuição das vendas: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reatribuição concluída! {job.details['result']['sales_updated']} vendas atualizadas."
+        ))
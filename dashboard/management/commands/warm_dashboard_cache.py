@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.jobs import run_job
+from dashboard.snapshots import WARMUP_WORKERS, aquecer_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Pré-calcula em cache a API do Dashboard Geral e a Minha Carteira de cada gestor/consultor (vistas por defeito)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=int, help='ID da tarefa (BackgroundJob), quando enfileirado após uma importação', default=None)
+        parser.add_argument('--workers', type=int, help='Snapshots calculados em simultâneo', default=WARMUP_WORKERS)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Iniciando aquecimento do cache do dashboard...'))
+
+        if options['job_id']:
+            try:
+                job = run_job(options['job_id'], lambda job: {'snapshots': aquecer_snapshots(options['workers'])})
+            except Exception as e:
+                raise CommandError(f"Erro durante o aquecimento do cache: {e}")
+            total = job.details['result']['snapshots']
+        else:
+            total = aquecer_snapshots(options['workers'])
+
+        if not total:
+            self.stdout.write(self.style.WARNING("Cache de snapshots inativo (settings.DASHBOARD_SNAPSHOT_CACHE) ou sem utilizadores."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Aquecimento concluído! {total} snapshots em cache."))
@@ -0,0 +1,356 @@
+import atexit
+from contextlib import ExitStack
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Métricas por pedido (latência, queries, tamanho da resposta)
+# ---
+# Com settings.DASHBOARD_METRICS = True, o MetricasMiddleware mede cada
+# pedido por view: duração, número e tempo das queries e bytes enviados,
+# em histogramas expostos no formato de texto do Prometheus em
+# metricas/ (só administradores, ou com o token DASHBOARD_METRICS_TOKEN).
+#
+# Queries acima de DASHBOARD_SLOW_QUERY_MS (200) são registadas no logger
+# 'dashboard.metrics' com o SQL; pedidos acima de DASHBOARD_SLOW_REQUEST_MS
+# (1000) também, com o total de queries e o SQL da mais lenta.
+#
+# Desligado (defeito), o middleware retira-se da cadeia no arranque
+# (MiddlewareNotUsed): custo zero por pedido.
+#
+# Cada processo tem o seu registo. Com vários workers (gunicorn), defina
+# DASHBOARD_METRICS_DIR: cada worker grava lá o seu registo de
+# METRICS_DUMP_SECONDS em METRICS_DUMP_SECONDS e o endpoint soma todos.
+
+METRICS_DUMP_SECONDS = 10
+DEFAULT_SLOW_QUERY_MS = 200
+DEFAULT_SLOW_REQUEST_MS = 1000
+
+# Nome: (ajuda, limites dos buckets)
+HISTOGRAMAS = {
+    'dashboard_request_duration_seconds': (
+        "Duração dos pedidos por view",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    'dashboard_request_db_queries': (
+        "Queries por pedido",
+        (1, 2, 5, 10, 20, 50, 100, 200, 500),
+    ),
+    'dashboard_request_db_seconds': (
+        "Tempo total em queries por pedido",
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    ),
+    'dashboard_response_size_bytes': (
+        "Tamanho das respostas",
+        (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+    ),
+}
+CONTADOR_PEDIDOS = 'dashboard_requests_total'
+
+
+class RegistoMetricas:
+    """Histogramas e contadores do processo, seguros entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (métrica, view) -> [contagens por bucket..., +Inf, soma]
+        self.histogramas = {}
+        # (view, método, status) -> pedidos
+        self.pedidos = {}
+
+    def observar(self, metrica, view, value):
+        limites = HISTOGRAMAS[metrica][1]
+        with self._lock:
+            valores = self.histogramas.get((metrica, view))
+            if valores is None:
+                valores = self.histogramas[(metrica, view)] = [0] * (len(limites) + 2)
+            for i, limite in enumerate(limites):
+                if value <= limite:
+                    valores[i] += 1
+                    break
+            else:
+                valores[len(limites)] += 1
+            valores[-1] += value
+
+    def contar_pedido(self, view, method, status):
+        chave = (view, method, str(status))
+        with self._lock:
+            self.pedidos[chave] = self.pedidos.get(chave, 0) + 1
+
+    def exportar(self):
+        with self._lock:
+            return {
+                'histogramas': [[m, v, list(valores)] for (m, v), valores in self.histogramas.items()],
+                'pedidos': [[*chave, n] for chave, n in self.pedidos.items()],
+            }
+
+    def juntar(self, dados):
+        """Soma o registo exportado de outro processo a este."""
+        for metrica, view, valores in dados.get('histogramas', []):
+            if metrica not in HISTOGRAMAS:
+                continue
+            atuais = self.histogramas.setdefault((metrica, view), [0] * len(valores))
+            for i, value in enumerate(valores):
+                atuais[i] += value
+        for view, method, status, n in dados.get('pedidos', []):
+            self.pedidos[(view, method, status)] = self.pedidos.get((view, method, status), 0) + n
+
+
+registo = RegistoMetricas()
+
+
+# --- Vários processos (DASHBOARD_METRICS_DIR) ---
+
+def _metrics_dir():
+    return getattr(settings, 'DASHBOARD_METRICS_DIR', None)
+
+
+def _ficheiro_processo(directory, pid):
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+
+def _gravar_json(path, dados):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(tmp, path)  # atómico: o endpoint nunca lê um ficheiro a meio
+
+
+_ultima_gravacao = 0.0
+
+
+def gravar_registo(force=False):
+    """Grava o registo deste processo em DASHBOARD_METRICS_DIR (no máximo a cada METRICS_DUMP_SECONDS)."""
+    global _ultima_gravacao
+    directory = _metrics_dir()
+    if not directory:
+        return
+    agora = time.monotonic()
+    if not force and agora - _ultima_gravacao < METRICS_DUMP_SECONDS:
+        return
+    _ultima_gravacao = agora
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _gravar_json(_ficheiro_processo(directory, os.getpid()), registo.exportar())
+    except OSError:
+        logger.exception("Não foi possível gravar as métricas em %s", directory)
+
+
+def arquivar_processo(pid):
+    """
+    Junta o ficheiro de um worker que terminou ao metrics-arquivo.json, para
+    os totais não baixarem nem os ficheiros se acumularem (hook child_exit
+    do gunicorn, no processo mestre).
+    """
+    directory = _metrics_dir()
+    path = _ficheiro_processo(directory, pid) if directory else None
+    if not path or not os.path.exists(path):
+        return
+    arquivo = os.path.join(directory, "metrics-arquivo.json")
+    total = RegistoMetricas()
+    for origem in (arquivo, path):
+        if os.path.exists(origem):
+            with open(origem, encoding='utf-8') as f:
+                total.juntar(json.load(f))
+    _gravar_json(arquivo, total.exportar())
+    os.remove(path)
+
+
+def limpar_registos():
+    """Apaga os ficheiros de métricas (arranque do gunicorn: os contadores recomeçam)."""
+    directory = _metrics_dir()
+    if directory:
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            os.remove(path)
+
+
+def registo_agregado():
+    """Registo deste processo somado aos dos outros workers (se DASHBOARD_METRICS_DIR)."""
+    total = RegistoMetricas()
+    total.juntar(registo.exportar())
+    directory = _metrics_dir()
+    if directory:
+        proprio = _ficheiro_processo(directory, os.getpid())
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            if path == proprio:
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    total.juntar(json.load(f))
+            except (OSError, ValueError):
+                continue  # worker a terminar entre o glob e a leitura
+    return total
+
+
+# --- Formato de texto do Prometheus ---
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def texto_prometheus(dados):
+    linhas = []
+    for metrica, (ajuda, limites) in HISTOGRAMAS.items():
+        linhas.append(f"# HELP {metrica} {ajuda}")
+        linhas.append(f"# TYPE {metrica} histogram")
+        for (nome, view), valores in sorted(dados.histogramas.items()):
+            if nome != metrica:
+                continue
+            view = _label(view)
+            acumulado = 0
+            for limite, n in zip((*limites, '+Inf'), valores[:-1]):
+                acumulado += n
+                linhas.append(f'{metrica}_bucket{{view="{view}",le="{limite}"}} {acumulado}')
+            linhas.append(f'{metrica}_sum{{view="{view}"}} {_numero(valores[-1])}')
+            linhas.append(f'{metrica}_count{{view="{view}"}} {acumulado}')
+    linhas.append(f"# HELP {CONTADOR_PEDIDOS} Pedidos por view, método e status")
+    linhas.append(f"# TYPE {CONTADOR_PEDIDOS} counter")
+    for (view, method, status), n in sorted(dados.pedidos.items()):
+        linhas.append(
+            f'{CONTADOR_PEDIDOS}{{view="{_label(view)}",method="{_label(method)}",status="{status}"}} {n}'
+        )
+    return "\n".join(linhas) + "\n"
+
+
+# --- Importações (última de cada fonte, a partir da auditoria) ---
+
+FONTES_IMPORTACAO = {
+    'bionio': {'file_type': 'bionio'},
+    'rovema': {'file_type': 'rovema'},
+    'eliq': {'api_type': 'eliq'},
+}
+_MB = 1024 * 1024
+
+
+def texto_importacoes():
+    """Gauges da telemetria da última importação com sucesso de cada fonte (ver telemetry.py)."""
+    from .models import AuditLog
+    gauges = {
+        'dashboard_import_duration_seconds': ("Duração da última importação", []),
+        'dashboard_import_rows_per_second': ("Linhas por segundo na última importação", []),
+        'dashboard_import_peak_rss_bytes': ("Pico de RSS na última importação", []),
+        'dashboard_import_last_success_timestamp_seconds': ("Fim da última importação com sucesso", []),
+        'dashboard_import_phase_seconds': ("Duração de cada fase na última importação", []),
+        'dashboard_import_phase_rss_bytes': ("RSS no fim de cada fase na última importação", []),
+    }
+    for fonte, filtro in FONTES_IMPORTACAO.items():
+        log = (
+            AuditLog.objects.filter(action__in=['fim_carga_csv', 'fim_carga_api'], details__contains=filtro)
+            .order_by('-timestamp').only('timestamp', 'details').first()
+        )
+        telemetria = (log.details or {}).get('telemetry') if log else None
+        if not telemetria:
+            continue
+        fonte_label = f'source="{fonte}"'
+        gauges['dashboard_import_duration_seconds'][1].append((fonte_label, telemetria['total_seconds']))
+        if telemetria.get('rows_per_second') is not None:
+            gauges['dashboard_import_rows_per_second'][1].append((fonte_label, telemetria['rows_per_second']))
+        gauges['dashboard_import_peak_rss_bytes'][1].append((fonte_label, int(telemetria['peak_rss_mb'] * _MB)))
+        gauges['dashboard_import_last_success_timestamp_seconds'][1].append((fonte_label, log.timestamp.timestamp()))
+        for fase in telemetria.get('phases', []):
+            labels = f'{fonte_label},phase="{_label(fase["name"])}"'
+            gauges['dashboard_import_phase_seconds'][1].append((labels, fase['seconds']))
+            gauges['dashboard_import_phase_rss_bytes'][1].append((labels, int(fase['rss_mb'] * _MB)))
+
+    linhas = []
+    for metrica, (ajuda, amostras) in gauges.items():
+        linhas.append(f"# HELP {metrica} {ajuda}")
+        linhas.append(f"# TYPE {metrica} gauge")
+        linhas.extend(f"{metrica}{{{labels}}} {_numero(value)}" for labels, value in amostras)
+    return "\n".join(linhas) + "\n"
+
+
+# --- Middleware ---
+
+class _MedidorQueries:
+    """execute_wrapper que conta e cronometra as queries do pedido."""
+
+    def __init__(self, request, slow_ms):
+        self.request = request
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.seconds = 0.0
+        self.mais_lenta = (0.0, '')
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.count += 1
+            self.seconds += duracao
+            if duracao > self.mais_lenta[0]:
+                self.mais_lenta = (duracao, sql)
+            if duracao * 1000 >= self.slow_ms:
+                logger.warning(
+                    "Query lenta (%.0f ms) em %s: %s", duracao * 1000, nome_view(self.request), sql
+                )
+
+
+def nome_view(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'sem_rota'
+
+
+def _contar_bytes(content, view):
+    total = 0
+    for chunk in content:
+        total += len(chunk)
+        yield chunk
+    registo.observar('dashboard_response_size_bytes', view, total)
+
+
+class MetricasMiddleware:
+    """Mede cada pedido (ver acima). Colocar logo a seguir ao SecurityMiddleware."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DASHBOARD_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_query_ms = getattr(settings, 'DASHBOARD_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+        self.slow_request_ms = getattr(settings, 'DASHBOARD_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+        atexit.register(gravar_registo, force=True)
+
+    def __call__(self, request):
+        medidor = _MedidorQueries(request, self.slow_query_ms)
+        inicio = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(medidor))
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        view = nome_view(request)
+        registo.observar('dashboard_request_duration_seconds', view, duracao)
+        registo.observar('dashboard_request_db_queries', view, medidor.count)
+        registo.observar('dashboard_request_db_seconds', view, medidor.seconds)
+        registo.contar_pedido(view, request.method, response.status_code)
+        if response.streaming:
+            if not response.is_async:
+                response.streaming_content = _contar_bytes(response.streaming_content, view)
+        else:
+            registo.observar('dashboard_response_size_bytes', view, len(response.content))
+
+        if duracao * 1000 >= self.slow_request_ms:
+            logger.warning(
+                "Pedido lento (%.0f ms) em %s: %d queries (%.0f ms); a mais lenta (%.0f ms): %s",
+                duracao * 1000, view, medidor.count, medidor.seconds * 1000,
+                medidor.mais_lenta[0] * 1000, medidor.mais_lenta[1],
+            )
+        gravar_registo()
+        return response
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_backgroundjob_datageneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHierarchy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='dashboard_u_descend_98976b_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        # Preenche a tabela de fecho com a hierarquia existente
+        migrations.RunSQL(
+            sql="""
+                WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                    SELECT id, id, 0 FROM dashboard_user
+                    UNION ALL
+                    SELECT t.ancestor_id, child.id, t.depth + 1
+                      FROM tree AS t
+                      JOIN dashboard_user AS child ON child.manager_id = t.descendant_id
+                     WHERE t.depth < 32
+                )
+                INSERT INTO dashboard_userhierarchy (ancestor_id, descendant_id, depth)
+                SELECT ancestor_id, descendant_id, MIN(depth)
+                  FROM tree
+                 GROUP BY ancestor_id, descendant_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
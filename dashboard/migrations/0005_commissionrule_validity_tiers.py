@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_userhierarchy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commissionrule',
+            name='max_revenue',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Limite superior (exclusivo) do escalão (vazio = sem limite)', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='commissionrule',
+            name='min_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Receita líquida mensal mínima do consultor na fonte para este escalão', max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='commissionrule',
+            name='valid_from',
+            field=models.DateField(blank=True, help_text='Início da vigência (vazio = desde sempre)', null=True),
+        ),
+        migrations.AddField(
+            model_name='commissionrule',
+            name='valid_to',
+            field=models.DateField(blank=True, help_text='Fim da vigência, inclusive (vazio = sem fim)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='commissionrule',
+            name='source',
+            field=models.CharField(db_index=True, help_text="O 'source' exato da tabela de Vendas (ex: Rovema Pay)", max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='commissionrule',
+            index=models.Index(fields=['source', 'valid_from'], name='dashboard_c_source_c5e032_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_commissionrule_validity_tiers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultantMonthFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('revenue_net', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('goal', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('commission', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('attainment', models.DecimalField(decimal_places=2, default=0, help_text='% da meta atingido (0 se não houver meta)', max_digits=9)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('consultant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_facts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year', 'month', '-revenue_net'], name='dashboard_c_year_a98cd8_idx')],
+                'unique_together': {('consultant', 'year', 'month')},
+            },
+        ),
+    ]
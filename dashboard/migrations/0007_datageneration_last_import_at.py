@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_consultantmonthfact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datageneration',
+            name='last_import_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
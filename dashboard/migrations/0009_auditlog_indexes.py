@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:54
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices criados sem bloquear as escritas (a tabela pode já ser grande)
+    atomic = False
+
+    dependencies = [
+        ('dashboard', '0008_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['action', '-timestamp', '-id'], name='dashboard_a_action_1decb3_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='dashboard_a_timesta_d49ba7_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['details'], name='auditlog_details_gin', opclasses=['jsonb_path_ops']),
+        ),
+        # O índice só de 'action' passa a ser um prefixo do composto
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(max_length=100),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_auditlog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile (determinístico)'), ('sampling', 'Amostragem (flamegraph)')], max_length=20)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(blank=True, max_length=100)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('query_count', models.PositiveIntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0)),
+                ('summary', models.TextField(blank=True, help_text='Funções mais pesadas (texto)')),
+                ('pstats', models.BinaryField(null=True)),
+                ('collapsed_stacks', models.TextField(blank=True)),
+                ('sql_timeline', models.JSONField(default=list)),
+                ('token_id', models.CharField(blank=True, db_index=True, help_text='Link assinado que originou o perfil (cada link só serve uma vez)', max_length=64)),
+                ('requested_by', models.ForeignKey(help_text='Admin que pediu o perfil', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(help_text='Utilizador do pedido medido (o âmbito dos dados é o dele)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
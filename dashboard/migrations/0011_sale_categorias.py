@@ -0,0 +1,123 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Converte as colunas de texto repetido das vendas (source, status,
+# payment_type, product_name, product_detail) em ids de tabelas de lookup.
+# A migração não é atómica: as vendas são convertidas em lotes de LOTE ids,
+# cada lote numa transação curta (sem bloquear a tabela toda de uma vez).
+
+LOTE = 50_000
+
+# (coluna de texto, coluna do id, tabela de lookup)
+COLUNAS = (
+    ('source', 'source_ref_id', 'dashboard_salesource'),
+    ('status', 'status_ref_id', 'dashboard_salestatus'),
+    ('payment_type', 'payment_type_ref_id', 'dashboard_paymenttype'),
+    ('product_name', 'product_name_ref_id', 'dashboard_product'),
+    ('product_detail', 'product_detail_ref_id', 'dashboard_productdetail'),
+)
+
+
+def _em_lotes(schema_editor, sql):
+    """Executa sql (com %s para o início e o fim do lote) sobre todas as vendas."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(id), MAX(id) FROM dashboard_sale")
+        minimo, maximo = cursor.fetchone()
+        if minimo is None:
+            return
+        for inicio in range(minimo, maximo + 1, LOTE):
+            cursor.execute(sql, [inicio, inicio + LOTE])
+
+
+def converter_categorias(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for texto, _, tabela in COLUNAS:
+            cursor.execute(
+                f"INSERT INTO {tabela} (name) SELECT DISTINCT {texto} FROM dashboard_sale "
+                f"WHERE {texto} <> '' ON CONFLICT (name) DO NOTHING"
+            )
+    atribuicoes = ", ".join(
+        f"{ref} = (SELECT id FROM {tabela} WHERE name = s.{texto})" for texto, ref, tabela in COLUNAS
+    )
+    _em_lotes(schema_editor, f"UPDATE dashboard_sale AS s SET {atribuicoes} WHERE s.id >= %s AND s.id < %s")
+
+
+def reverter_categorias(apps, schema_editor):
+    atribuicoes = ", ".join(
+        f"{texto} = COALESCE((SELECT name FROM {tabela} WHERE id = s.{ref}), '')" for texto, ref, tabela in COLUNAS
+    )
+    _em_lotes(schema_editor, f"UPDATE dashboard_sale AS s SET {atribuicoes} WHERE s.id >= %s AND s.id < %s")
+
+
+def _categoria(name):
+    return migrations.CreateModel(
+        name=name,
+        fields=[
+            ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+            ('name', models.CharField(max_length=100, unique=True)),
+        ],
+        options={'abstract': False},
+    )
+
+
+def _referencia(name, to):
+    return migrations.AddField(
+        model_name='sale',
+        name=name,
+        field=models.ForeignKey(
+            blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT,
+            related_name='+', to=to,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('dashboard', '0010_profileartifact'),
+    ]
+
+    operations = [
+        _categoria('SaleSource'),
+        _categoria('SaleStatus'),
+        _categoria('PaymentType'),
+        _categoria('Product'),
+        _categoria('ProductDetail'),
+        migrations.AddField(
+            model_name='sale',
+            name='source_ref',
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='dashboard.salesource',
+            ),
+        ),
+        _referencia('status_ref', 'dashboard.salestatus'),
+        _referencia('payment_type_ref', 'dashboard.paymenttype'),
+        _referencia('product_name_ref', 'dashboard.product'),
+        _referencia('product_detail_ref', 'dashboard.productdetail'),
+        # Antes da conversão: na reversão, a unicidade antiga só volta depois de repor os textos
+        migrations.AlterUniqueTogether(
+            name='sale',
+            unique_together={('source_ref', 'raw_id')},
+        ),
+        migrations.RunPython(converter_categorias, reverter_categorias),
+        # Só no estado: na reversão, a coluna volta com '' nas linhas existentes (até serem repostas)
+        migrations.AlterField(
+            model_name='sale',
+            name='source',
+            field=models.CharField(db_index=True, default='', max_length=50),
+        ),
+        migrations.RemoveField(model_name='sale', name='source'),
+        migrations.RemoveField(model_name='sale', name='status'),
+        migrations.RemoveField(model_name='sale', name='payment_type'),
+        migrations.RemoveField(model_name='sale', name='product_name'),
+        migrations.RemoveField(model_name='sale', name='product_detail'),
+        migrations.AlterField(
+            model_name='sale',
+            name='source_ref',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, related_name='+', to='dashboard.salesource',
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+# CNPJs como inteiros (bigint) em Client.cnpj (e na FK Sale.client_id) e em
+# Sale.raw_client_cnpj. Antes da conversão, os CNPJs das vendas são limpos
+# como em dashboard.cleaning.clean_cnpj (só dígitos; vazio ou inválido -> NULL).
+# Na reversão, os zeros à esquerda são repostos.
+
+LIMPAR_VENDAS = """
+    UPDATE dashboard_sale
+       SET raw_client_cnpj = CASE
+               WHEN regexp_replace(raw_client_cnpj, '[^0-9]', '', 'g') ~ '^[0-9]{1,14}$'
+                AND regexp_replace(raw_client_cnpj, '[^0-9]', '', 'g') !~ '^0+$'
+               THEN regexp_replace(raw_client_cnpj, '[^0-9]', '', 'g')
+           END
+     WHERE raw_client_cnpj !~ '^[0-9]{1,14}$' OR raw_client_cnpj ~ '^0+$'
+"""
+
+REPOR_ZEROS = [
+    "UPDATE dashboard_sale SET raw_client_cnpj = lpad(raw_client_cnpj, 14, '0') WHERE length(raw_client_cnpj) < 14",
+    "UPDATE dashboard_sale SET raw_client_cnpj = '' WHERE raw_client_cnpj IS NULL",
+    "UPDATE dashboard_sale SET client_id = lpad(client_id, 14, '0') WHERE length(client_id) < 14",
+    "UPDATE dashboard_client SET cnpj = lpad(cnpj, 14, '0') WHERE length(cnpj) < 14",
+    # Verifica já as FKs (diferidas): o ALTER TABLE seguinte não pode ter verificações pendentes
+    "SET CONSTRAINTS ALL IMMEDIATE",
+]
+
+
+def verificar_clientes(apps, schema_editor):
+    """Um cliente com um CNPJ que não é só dígitos faria falhar a conversão a meio."""
+    Client = apps.get_model('dashboard', 'Client')
+    invalidos = list(
+        Client.objects.exclude(cnpj__regex=r'^[0-9]{1,14}$').values_list('cnpj', flat=True)[:20]
+    )
+    if invalidos:
+        raise RuntimeError(
+            "Clientes com CNPJ inválido (corrija-os antes de migrar): " + ", ".join(invalidos)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_sale_categorias'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sale',
+            name='raw_client_cnpj',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+        migrations.RunSQL(LIMPAR_VENDAS, REPOR_ZEROS),
+        migrations.RunPython(verificar_clientes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='sale',
+            name='raw_client_cnpj',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='client',
+            name='cnpj',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+    ]
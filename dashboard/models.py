@@ -1,10 +1,16 @@
 import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.core.exceptions import ValidationError
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from decimal import Decimal # Adicionar import
 
+from .categorias import campo_categoria
+from .cleaning import formatar_cnpj
+
 # ---
 # Modelo 1: Usuário (O Modelo Central)
 # ---
@@ -35,6 +41,15 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username'] 
 
+    def clean(self):
+        super().clean()
+        # Impede ciclos na hierarquia (ex: A gere B e B passa a gerir A)
+        if self.pk and self.manager_id:
+            if self.manager_id == self.pk or UserHierarchy.objects.filter(
+                ancestor_id=self.pk, descendant_id=self.manager_id
+            ).exists():
+                raise ValidationError({'manager': "O gestor não pode pertencer à equipa deste utilizador."})
+
     def __str__(self):
         return self.email
 
@@ -43,7 +58,8 @@ class User(AbstractUser):
 # Modelo 2: Cliente
 # ---
 class Client(models.Model):
-    cnpj = models.CharField(max_length=14, primary_key=True, unique=True)
+    # CNPJ como inteiro (ver dashboard.cleaning); formatado só na apresentação
+    cnpj = models.BigIntegerField(primary_key=True)
     client_name = models.CharField(max_length=255)
     
     consultant = models.ForeignKey(
@@ -68,14 +84,50 @@ class Client(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.client_name} ({self.cnpj})"
+        return f"{self.client_name} ({formatar_cnpj(self.cnpj)})"
 
 
 # ---
 # Modelo 3: Vendas (SalesData)
 # ---
+class Categoria(models.Model):
+    """
+    Tabela de lookup de uma coluna categórica das vendas (poucos valores
+    distintos). As vendas guardam apenas o id; os nomes vêm da cache em
+    dashboard.categorias.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.name
+
+
+class SaleSource(Categoria):
+    """Fonte da venda (Bionio, Rovema Pay, ELIQ)."""
+
+
+class SaleStatus(Categoria):
+    """Estado da venda na fonte (ex: Transferido, confirmada)."""
+
+
+class PaymentType(Categoria):
+    """Tipo de pagamento (ex: Boleto, Pix)."""
+
+
+class Product(Categoria):
+    """Nome do produto/benefício."""
+
+
+class ProductDetail(Categoria):
+    """Detalhe do produto (ex: bandeira do cartão, categoria do combustível)."""
+
+
 class Sale(models.Model):
-    source = models.CharField(max_length=50, db_index=True)
+    source_ref = models.ForeignKey(SaleSource, on_delete=models.PROTECT, related_name='+')
     raw_id = models.CharField(max_length=100, db_index=True)
 
     client = models.ForeignKey(
@@ -105,16 +157,33 @@ class Sale(models.Model):
     revenue_net = models.DecimalField(max_digits=12, decimal_places=2, default=0.0)
     volume = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True) 
     
-    product_name = models.CharField(max_length=100, blank=True)
-    product_detail = models.CharField(max_length=100, blank=True) 
-    payment_type = models.CharField(max_length=50, blank=True)   
-    status = models.CharField(max_length=50, blank=True)         
+    # Colunas categóricas: smallint com o id da categoria (ver Categoria)
+    product_name_ref = models.ForeignKey(
+        Product, on_delete=models.PROTECT, null=True, blank=True, db_index=False, related_name='+'
+    )
+    product_detail_ref = models.ForeignKey(
+        ProductDetail, on_delete=models.PROTECT, null=True, blank=True, db_index=False, related_name='+'
+    )
+    payment_type_ref = models.ForeignKey(
+        PaymentType, on_delete=models.PROTECT, null=True, blank=True, db_index=False, related_name='+'
+    )
+    status_ref = models.ForeignKey(
+        SaleStatus, on_delete=models.PROTECT, null=True, blank=True, db_index=False, related_name='+'
+    )
 
     raw_client_name = models.CharField(max_length=255, blank=True)
-    raw_client_cnpj = models.CharField(max_length=20, blank=True, db_index=True)
+    raw_client_cnpj = models.BigIntegerField(null=True, blank=True, db_index=True)
+
+    # Os nomes, como texto (leitura e escrita), p.ex. sale.source == 'ELIQ'.
+    # Nas queries usam-se os campos *_ref (ex: source_ref__name).
+    source = campo_categoria('source', SaleSource)
+    product_name = campo_categoria('product_name', Product)
+    product_detail = campo_categoria('product_detail', ProductDetail)
+    payment_type = campo_categoria('payment_type', PaymentType)
+    status = campo_categoria('status', SaleStatus)
 
     class Meta:
-        unique_together = ('source', 'raw_id')
+        unique_together = ('source_ref', 'raw_id')
 
     def __str__(self):
         return f"{self.source}: R$ {self.revenue_net} em {self.date.strftime('%Y-%m-%d')}"
@@ -150,10 +219,20 @@ class AuditLog(models.Model):
         null=True,
         blank=True
     )
-    timestamp = models.DateTimeField(auto_now_add=True)
-    action = models.CharField(max_length=100, db_index=True)
+    # Momento do registo (não o da gravação em lote, ver audit.py)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    action = models.CharField(max_length=100)
     details = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Visualizador de auditoria (paginação keyset) e histórico da Carga de Dados
+            models.Index(fields=['action', '-timestamp', '-id']),
+            models.Index(fields=['-timestamp', '-id']),
+            # Filtros por conteúdo (details @> {"status": "Falha"})
+            GinIndex(fields=['details'], name='auditlog_details_gin', opclasses=['jsonb_path_ops']),
+        ]
+
     def __str__(self):
         return f"[{self.timestamp}] {self.user} - {self.action}"
 
@@ -165,14 +244,241 @@ class CommissionRule(models.Model):
     """
     Armazena as regras de comissão.
     Ex: source='Bionio', percentage=10.0 (significa 10%)
+
+    Uma fonte pode ter várias regras:
+    - por vigência (valid_from/valid_to), para alterar a percentagem a meio
+      do ano sem reescrever o histórico;
+    - por escalão de receita (min_revenue/max_revenue), avaliado sobre a
+      receita líquida mensal do consultor nessa fonte.
+    O cálculo é feito na base de dados (ver commissions.py).
     """
     rule_name = models.CharField(max_length=100, help_text="Ex: Comissão Bionio (10%)")
     
-    source = models.CharField(max_length=50, unique=True, db_index=True, 
+    source = models.CharField(max_length=50, db_index=True, 
                               help_text="O 'source' exato da tabela de Vendas (ex: Rovema Pay)")
                               
     percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.0,
                                      help_text="O valor da percentagem (ex: 10.5 para 10.5%)")
 
+    valid_from = models.DateField(null=True, blank=True,
+                                  help_text="Início da vigência (vazio = desde sempre)")
+    valid_to = models.DateField(null=True, blank=True,
+                                help_text="Fim da vigência, inclusive (vazio = sem fim)")
+
+    min_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0,
+                                      help_text="Receita líquida mensal mínima do consultor na fonte para este escalão")
+    max_revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                      help_text="Limite superior (exclusivo) do escalão (vazio = sem limite)")
+
+    class Meta:
+        indexes = [models.Index(fields=['source', 'valid_from'])]
+
+    def clean(self):
+        super().clean()
+        if self.valid_from and self.valid_to and self.valid_from > self.valid_to:
+            raise ValidationError({'valid_to': "O fim da vigência não pode ser anterior ao início."})
+        if self.max_revenue is not None and self.max_revenue <= (self.min_revenue or 0):
+            raise ValidationError({'max_revenue': "O limite superior tem de ser maior que o mínimo do escalão."})
+
+        # Duas regras da mesma fonte não podem cobrir o mesmo dia e o mesmo escalão
+        overlapping = CommissionRule.objects.filter(source=self.source).exclude(pk=self.pk)
+        if self.valid_to:
+            overlapping = overlapping.filter(models.Q(valid_from__isnull=True) | models.Q(valid_from__lte=self.valid_to))
+        if self.valid_from:
+            overlapping = overlapping.filter(models.Q(valid_to__isnull=True) | models.Q(valid_to__gte=self.valid_from))
+        if self.max_revenue is not None:
+            overlapping = overlapping.filter(min_revenue__lt=self.max_revenue)
+        overlapping = overlapping.filter(models.Q(max_revenue__isnull=True) | models.Q(max_revenue__gt=self.min_revenue or 0))
+        conflict = overlapping.first()
+        if conflict:
+            raise ValidationError({'valid_from': f"Sobrepõe-se à regra '{conflict.rule_name}' (mesma fonte, vigência e escalão)."})
+
+    def __str__(self):
+        return f"{self.rule_name} ({self.source} @ {self.percentage}%)"
+
+
+# ---
+# Modelo 7: Tarefas em Segundo Plano
+# ---
+class BackgroundJob(models.Model):
+    """
+    Regista uma tarefa lançada em segundo plano (comando de gestão num
+    subprocesso) e o seu progresso, para que a interface possa acompanhá-la.
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pendente"
+        RUNNING = "running", "Em execução"
+        DONE = "done", "Concluída"
+        FAILED = "failed", "Falhou"
+
+    kind = models.CharField(max_length=50, db_index=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='background_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    progress_done = models.BigIntegerField(default=0)
+    progress_total = models.BigIntegerField(default=0)
+    details = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+
+    def set_progress(self, done, total=None):
+        """Atualiza apenas as colunas de progresso (uma UPDATE simples)."""
+        self.progress_done = done
+        fields = {'progress_done': done}
+        if total is not None:
+            self.progress_total = total
+            fields['progress_total'] = total
+        BackgroundJob.objects.filter(pk=self.pk).update(**fields)
+
+    @property
+    def percent(self):
+        if not self.progress_total:
+            return 100.0 if self.status == self.Status.DONE else 0.0
+        return round(min(self.progress_done / self.progress_total, 1) * 100, 1)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.status})"
+
+
+# ---
+# Modelo 8: Geração dos Dados
+# ---
+class DataGeneration(models.Model):
+    """
+    Contador incrementado sempre que os dados de vendas mudam em massa
+    (importações, atribuições). Chaves de cache, ETags e agregados
+    derivados usam a geração para saber quando estão desatualizados.
+    Há um contador global (atribuições, reatribuições), um por fonte de
+    vendas ('source:<fonte>', incrementado pelos importadores) e outros
+    para a hierarquia, os factos de desempenho e os clientes.
+    """
+    GLOBAL = 'global'
+
+    scope = models.CharField(max_length=50, unique=True)
+    generation = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    last_import_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.scope}: {self.generation}"
+
+
+
+# ---
+# Modelo 9: Hierarquia de Utilizadores (Closure Table)
+# ---
+class UserHierarchy(models.Model):
+    """
+    Tabela de fecho da hierarquia User.manager: uma linha por cada par
+    (ancestral, descendente), incluindo o próprio utilizador (depth=0).
+    Permite obter toda a sub-árvore de um gestor com um único join indexado.
+    Mantida pelos signals de User (ver hierarchy.py).
+    """
+    ancestor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='descendant_links'
+    )
+    descendant = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='ancestor_links'
+    )
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [models.Index(fields=['descendant', 'ancestor'])]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+# ---
+# Modelo 10: Factos de Desempenho (Consultor x Mês)
+# ---
+class ConsultantMonthFact(models.Model):
+    """
+    Desempenho mensal pré-calculado de cada consultor: receita líquida
+    realizada, meta, comissão e % atingido. Uma linha por (consultor, mês),
+    atualizada incrementalmente pelas importações, edições de metas e de
+    regras de comissão (ver facts.py). Alimenta a Minha Carteira/Equipa,
+    a Gestão de Metas e os rankings sem juntar vendas e metas na mesma query.
+    """
+    consultant = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='month_facts'
+    )
+    year = models.IntegerField()
+    month = models.IntegerField() # 1 = Jan, 12 = Dez
+    revenue_net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    goal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    commission = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    attainment = models.DecimalField(max_digits=9, decimal_places=2, default=0,
+                                     help_text="% da meta atingido (0 se não houver meta)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('consultant', 'year', 'month')
+        indexes = [models.Index(fields=['year', 'month', '-revenue_net'])]
+
+    def __str__(self):
+        return f"{self.consultant_id} {self.month}/{self.year}: R$ {self.revenue_net} ({self.attainment}%)"
+
+
+# ---
+# Modelo 11: Perfis de Pedidos (Profiler a pedido)
+# ---
+class ProfileArtifact(models.Model):
+    """
+    Resultado do profiling de um único pedido, pedido por um admin (ver
+    profiler.py): estatísticas do cProfile (pstats) ou pilhas amostradas
+    (formato 'collapsed' para flamegraphs) e a linha temporal das queries.
+    """
+    class Mode(models.TextChoices):
+        CPROFILE = "cprofile", "cProfile (determinístico)"
+        SAMPLING = "sampling", "Amostragem (flamegraph)"
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        help_text="Admin que pediu o perfil"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        help_text="Utilizador do pedido medido (o âmbito dos dados é o dele)"
+    )
+    mode = models.CharField(max_length=20, choices=Mode.choices)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=100, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    summary = models.TextField(blank=True, help_text="Funções mais pesadas (texto)")
+    pstats = models.BinaryField(null=True, editable=False)
+    collapsed_stacks = models.TextField(blank=True)
+    sql_timeline = models.JSONField(default=list)
+    token_id = models.CharField(max_length=64, blank=True, db_index=True,
+                                help_text="Link assinado que originou o perfil (cada link só serve uma vez)")
+
+    class Meta:
+        ordering = ['-created_at']
+
     def __str__(self):
-        return f"{self.rule_name} ({self.source} @ {self.percentage}%)"
\ No newline at end of file
+        return f"{self.mode} {self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+import json
+
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # Está em requirements.txt; sem ele usa-se o json da biblioteca padrão
+    orjson = None
+
+# ---
+# Serialização dos dados dos gráficos e tabelas
+# ---
+# Formato "rows" (por defeito): lista de dicts, um por linha.
+# Formato "columnar" (?format=columnar): um cabeçalho com o esquema e um
+# array paralelo por coluna, sem repetir as chaves em cada linha:
+#   {"schema": [{"name": "date", "type": "date"}, ...], "length": 12,
+#    "columns": {"date": [...], "volume": [...]}}
+# Os valores seguem tal como saem da base de dados (Decimal, date/datetime);
+# a conversão é feita de uma só vez pelo serializador.
+
+FORMATO_LINHAS = 'rows'
+FORMATO_COLUNAR = 'columnar'
+
+
+def formato_pedido(request):
+    """Formato pedido em ?format= ('columnar' ou, por defeito, 'rows')."""
+    return FORMATO_COLUNAR if request.GET.get('format') == FORMATO_COLUNAR else FORMATO_LINHAS
+
+
+def _default(obj):
+    """Tipos que o orjson/json não serializam sozinhos."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, date):  # inclui datetime (apenas no fallback; o orjson trata-os nativamente)
+        return obj.isoformat()
+    raise TypeError(f"Tipo não serializável em JSON: {type(obj).__name__}")
+
+
+def dumps(data):
+    """JSON compacto em bytes: orjson se estiver instalado, senão json."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def colunar(rows, fields):
+    """
+    Tuplos (ex: values_list) na ordem de `fields` -> payload colunar.
+    `fields` é uma sequência de (nome, tipo), com tipo 'string', 'number',
+    'integer' ou 'date'.
+    """
+    rows = list(rows)
+    columns = zip(*rows) if rows else ([] for _ in fields)
+    return {
+        'schema': [{'name': name, 'type': kind} for name, kind in fields],
+        'length': len(rows),
+        'columns': {name: list(values) for (name, _), values in zip(fields, columns)},
+    }
+
+
+def linhas(rows, fields):
+    """Tuplos na ordem de `fields` -> lista de dicts (formato clássico)."""
+    names = [name for name, _ in fields]
+    return [dict(zip(names, row)) for row in rows]
+
+
+def tabela(formato, rows, fields):
+    """Constrói a série/tabela no formato pedido."""
+    return colunar(rows, fields) if formato == FORMATO_COLUNAR else linhas(rows, fields)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse equivalente, serializado com dumps() (Decimal e datas incluídos)."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,212 @@
+from collections import Counter
+from contextlib import ExitStack
+import cProfile
+import hashlib
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import nome_view
+from .models import ProfileArtifact, User
+
+# ---
+# Profiler a pedido (admins)
+# ---
+# Um pedido é medido quando traz ?_profile=<modo> ou o cabeçalho
+# X-Dashboard-Profile: <modo> e quem o faz é admin, ou quando traz um
+# link assinado gerado por um admin na página Perfis (?_profile=<token>).
+# O link assinado serve para medir o pedido de outro utilizador (p.ex. o
+# gestor que se queixa de uma página lenta) com o âmbito dele: expira ao
+# fim de PROFILER_TOKEN_MAX_AGE e só serve uma vez. Para os restantes
+# pedidos o parâmetro é ignorado e nada é medido nem gravado.
+#
+# Modos:
+#   - cprofile: cProfile de toda a view (guarda o pstats, para o snakeviz,
+#     e as funções mais pesadas em texto);
+#   - sampling: uma thread amostra a pilha do pedido a cada
+#     PROFILER_SAMPLE_INTERVAL e guarda as pilhas no formato 'collapsed'
+#     (flamegraph.pl, speedscope), com muito menos custo que o cProfile.
+# Em ambos, a linha temporal das queries (início, duração, SQL).
+#
+# Nas respostas em streaming só é medido o que acontece até a resposta
+# ser devolvida (não a geração do conteúdo).
+#
+# Ativo com settings.DASHBOARD_PROFILER = True e o middleware depois do
+# AuthenticationMiddleware.
+
+PARAMETRO = '_profile'
+CABECALHO = 'X-Dashboard-Profile'
+MODOS = ('cprofile', 'sampling')
+SALT = 'dashboard.profiler'
+PROFILER_TOKEN_MAX_AGE = 60 * 60
+PROFILER_SAMPLE_INTERVAL = 0.005
+PROFILER_KEEP = 200
+SQL_TIMELINE_MAX = 2000
+SUMMARY_LINES = 40
+
+
+def gerar_link_perfil(admin, mode, user=None):
+    """Token assinado para ?_profile= (opcionalmente só para um utilizador)."""
+    return signing.dumps({'by': admin.pk, 'mode': mode, 'for': getattr(user, 'pk', None)}, salt=SALT, compress=True)
+
+
+def _id_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def pedido_de_perfil(request):
+    """
+    (modo, admin que pediu, id do token) se o pedido deve ser medido, ou
+    None. Nunca lança exceções: um valor inválido é simplesmente ignorado.
+    """
+    valor = request.GET.get(PARAMETRO) or request.headers.get(CABECALHO)
+    if not valor:
+        return None
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    if valor in MODOS:
+        return (valor, user, '') if user.role == User.Role.ADMIN else None
+    try:
+        dados = signing.loads(valor, salt=SALT, max_age=PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if dados.get('mode') not in MODOS or dados.get('for') not in (None, user.pk):
+        return None
+    admin = User.objects.filter(pk=dados.get('by'), role=User.Role.ADMIN, is_active=True).first()
+    token_id = _id_token(valor)
+    if admin is None or ProfileArtifact.objects.filter(token_id=token_id).exists():
+        return None
+    return dados['mode'], admin, token_id
+
+
+class _LinhaTemporalSQL:
+    """execute_wrapper que regista início e duração de cada query."""
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.queries = []
+        self.total = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            fim = time.perf_counter()
+            self.total += 1
+            self.segundos += fim - inicio
+            if len(self.queries) < SQL_TIMELINE_MAX:
+                self.queries.append({
+                    'start_ms': round((inicio - self.inicio) * 1000, 2),
+                    'duration_ms': round((fim - inicio) * 1000, 2),
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                })
+
+
+class AmostradorPilhas:
+    """Amostra a pilha de uma thread a intervalos fixos (formato 'collapsed')."""
+
+    def __init__(self, thread_id, interval=PROFILER_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                code = frame.f_code
+                pilha.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{pilha} {n}" for pilha, n in self.pilhas.most_common())
+
+    def resumo(self, linhas=SUMMARY_LINES):
+        """Funções com mais amostras no topo da pilha (tempo próprio)."""
+        total = sum(self.pilhas.values()) or 1
+        topo = Counter()
+        for pilha, n in self.pilhas.items():
+            topo[pilha.rsplit(';', 1)[-1]] += n
+        return "\n".join(
+            f"{n:6d} amostras {100 * n / total:5.1f}%  {funcao}" for funcao, n in topo.most_common(linhas)
+        )
+
+
+def _resumo_cprofile(profile):
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    return stream.getvalue()
+
+
+class ProfilerMiddleware:
+    """Mede os pedidos pedidos por admins (ver acima). Colocar depois do AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DASHBOARD_PROFILER', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pedido = pedido_de_perfil(request)
+        if pedido is None:
+            return self.get_response(request)
+        mode, admin, token_id = pedido
+
+        inicio = time.perf_counter()
+        linha_temporal = _LinhaTemporalSQL(inicio)
+        artefacto = {}
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(linha_temporal))
+            if mode == 'cprofile':
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profile.disable()
+                profile.create_stats()
+                artefacto.update(pstats=marshal.dumps(profile.stats), summary=_resumo_cprofile(profile))
+            else:
+                with AmostradorPilhas(threading.get_ident()) as amostrador:
+                    response = self.get_response(request)
+                artefacto.update(collapsed_stacks=amostrador.collapsed(), summary=amostrador.resumo())
+        duracao = time.perf_counter() - inicio
+
+        perfil = ProfileArtifact.objects.create(
+            requested_by=admin, user=request.user, mode=mode, method=request.method,
+            path=request.get_full_path()[:500], view_name=nome_view(request)[:100],
+            status_code=response.status_code, duration_ms=round(duracao * 1000, 2),
+            query_count=linha_temporal.total, sql_ms=round(linha_temporal.segundos * 1000, 2),
+            sql_timeline=linha_temporal.queries, token_id=token_id, **artefacto,
+        )
+        # Mantém apenas os PROFILER_KEEP mais recentes
+        antigos = ProfileArtifact.objects.values_list('id', flat=True)[PROFILER_KEEP:]
+        ProfileArtifact.objects.filter(id__in=list(antigos)).delete()
+        response['X-Dashboard-Profile-Id'] = str(perfil.pk)
+        return response
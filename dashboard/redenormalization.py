@@ -0,0 +1,130 @@
+from django.db import connection
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+
+from .facts import atualizar_factos
+from .generations import bump_data_generation
+from .jobs import enqueue_job
+from .audit import registar_auditoria
+from .models import Client, Sale, User
+
+# Janela de IDs de vendas processada por cada UPDATE (cada uma na sua transação)
+DEFAULT_CHUNK_SIZE = 20000
+
+
+def agendar_redenormalizacao(client_cnpjs=(), consultant_ids=(), user=None):
+    """
+    Enfileira a atualização de Sale.consultant/manager apenas para as vendas
+    afetadas por uma mudança de carteira:
+    - client_cnpjs: clientes que mudaram de consultor/gestor;
+    - consultant_ids: consultores que mudaram de gestor.
+    """
+    client_cnpjs = sorted(set(client_cnpjs))
+    consultant_ids = sorted(set(consultant_ids))
+    if not client_cnpjs and not consultant_ids:
+        return None
+
+    return enqueue_job(
+        'redenormalizacao_vendas', 'redenormalizar_vendas', user=user,
+        details={'client_cnpjs': client_cnpjs, 'consultant_ids': consultant_ids},
+    )
+
+
+def redenormalizar_vendas(client_cnpjs=(), consultant_ids=(), job=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Copia novamente o consultor/gestor atual para as vendas afetadas, em
+    janelas de IDs para não bloquear a tabela de vendas numa transação longa.
+    Devolve o número de vendas alteradas.
+    """
+    # int(): tarefas gravadas antes da conversão dos CNPJs para inteiros traziam texto
+    client_cnpjs = [int(cnpj) for cnpj in client_cnpjs]
+    consultant_ids = list(consultant_ids)
+
+    if consultant_ids:
+        # O gestor do cliente acompanha o gestor do seu consultor
+        Client.objects.filter(consultant_id__in=consultant_ids).update(
+            manager_id=Subquery(
+                User.objects.filter(pk=OuterRef('consultant_id')).values('manager_id')[:1]
+            )
+        )
+
+    affected = Sale.objects.none()
+    if client_cnpjs:
+        affected = affected | Sale.objects.filter(client_id__in=client_cnpjs)
+    if consultant_ids:
+        affected = affected | Sale.objects.filter(consultant_id__in=consultant_ids)
+    bounds = affected.aggregate(first=Min('id'), last=Max('id'))
+
+    # Consultores que perdem e que ganham vendas (para os factos de desempenho)
+    consultores_afetados = set()
+    if client_cnpjs:
+        consultores_afetados.update(
+            Sale.objects.filter(client_id__in=client_cnpjs, consultant__isnull=False)
+            .values_list('consultant_id', flat=True).distinct().order_by()
+        )
+        consultores_afetados.update(
+            Client.objects.filter(cnpj__in=client_cnpjs, consultant__isnull=False)
+            .values_list('consultant_id', flat=True)
+        )
+
+    updated = 0
+    if bounds['first'] is not None:
+        first, last = bounds['first'], bounds['last']
+        if job is not None:
+            job.set_progress(0, total=last - first + 1)
+
+        for low in range(first, last + 1, chunk_size):
+            high = low + chunk_size
+            if client_cnpjs:
+                updated += _atualizar_por_cliente(client_cnpjs, low, high)
+            if consultant_ids:
+                updated += _atualizar_por_consultor(consultant_ids, low, high)
+            if job is not None:
+                job.set_progress(min(high, last + 1) - first)
+
+    # Mudar de gestor não altera os números do consultor; mudar de carteira sim
+    if updated and consultores_afetados:
+        atualizar_factos(consultant_ids=consultores_afetados)
+
+    bump_data_generation()
+    registar_auditoria(
+        user=job.user if job is not None else None,
+        action="redenormalizacao_vendas",
+        details={
+            "clients": len(client_cnpjs),
+            "consultants": len(consultant_ids),
+            "sales_updated": updated,
+        },
+    )
+    return updated
+
+
+def _atualizar_por_cliente(client_cnpjs, low, high):
+    sql = f"""
+        UPDATE {connection.ops.quote_name(Sale._meta.db_table)} AS s
+           SET consultant_id = c.consultant_id,
+               manager_id = c.manager_id
+          FROM {connection.ops.quote_name(Client._meta.db_table)} AS c
+         WHERE s.client_id = c.cnpj
+           AND c.cnpj = ANY(%s)
+           AND s.id >= %s AND s.id < %s
+           AND (s.consultant_id IS DISTINCT FROM c.consultant_id
+                OR s.manager_id IS DISTINCT FROM c.manager_id)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [client_cnpjs, low, high])
+        return cursor.rowcount
+
+
+def _atualizar_por_consultor(consultant_ids, low, high):
+    sql = f"""
+        UPDATE {connection.ops.quote_name(Sale._meta.db_table)} AS s
+           SET manager_id = u.manager_id
+          FROM {connection.ops.quote_name(User._meta.db_table)} AS u
+         WHERE s.consultant_id = u.id
+           AND u.id = ANY(%s)
+           AND s.id >= %s AND s.id < %s
+           AND s.manager_id IS DISTINCT FROM u.manager_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [consultant_ids, low, high])
+        return cursor.rowcount
@@ -0,0 +1,144 @@
+from django.db.models import Q
+
+from .generations import get_data_generation
+from .hierarchy import HIERARCHY_SCOPE, subarvore
+from .models import User
+
+SESSION_KEY = '_data_scope'
+
+
+class DataScope:
+    """
+    Âmbito de dados de um utilizador, usado por todas as views para a
+    filtragem de autorização:
+    - admin: vê tudo;
+    - gestor: vê toda a sua sub-árvore (tabela de fecho UserHierarchy);
+    - consultor: vê apenas os seus próprios dados.
+
+    Os filtros de querysets usam a sub-árvore como subquery (um único join
+    indexado). Os IDs da equipa, quando são precisos em Python, ficam em
+    cache na sessão até a hierarquia mudar.
+    """
+
+    def __init__(self, user, session=None):
+        self.user = user
+        self.session = session
+        self._team_ids = None
+
+    @property
+    def is_global(self):
+        return self.user.role == User.Role.ADMIN
+
+    @property
+    def is_manager(self):
+        return self.user.role == User.Role.MANAGER
+
+    @property
+    def member_ids(self):
+        """IDs visíveis (o próprio incluído), ou None para admin (todos)."""
+        if self.is_global:
+            return None
+        if not self.is_manager:
+            return frozenset([self.user.id])
+        if self._team_ids is None:
+            self._team_ids = self._load_team_ids()
+        return self._team_ids
+
+    @property
+    def team_ids(self):
+        """IDs da equipa, sem o próprio (vazio para consultores; None para admin)."""
+        ids = self.member_ids
+        return None if ids is None else ids - {self.user.id}
+
+    @property
+    def cache_key(self):
+        """Identifica o âmbito em chaves de cache e ETags."""
+        return self.cache_key_for()
+
+    def cache_key_for(self, hierarchy_generation=None):
+        """cache_key, reutilizando a geração da hierarquia se já tiver sido lida."""
+        if self.is_global:
+            return 'all'
+        if self.is_manager:
+            if hierarchy_generation is None:
+                hierarchy_generation = get_data_generation(HIERARCHY_SCOPE)
+            return f"m{self.user.id}.h{hierarchy_generation}"
+        return f"u{self.user.id}"
+
+    def _load_team_ids(self):
+        generation = get_data_generation(HIERARCHY_SCOPE)
+        cached = self.session.get(SESSION_KEY) if self.session is not None else None
+        if cached and cached.get('user') == self.user.id and cached.get('generation') == generation:
+            return frozenset(cached['ids'])
+
+        ids = list(subarvore(self.user.id).values_list('descendant_id', flat=True))
+        ids = set(ids) | {self.user.id}
+        if self.session is not None:
+            self.session[SESSION_KEY] = {'user': self.user.id, 'generation': generation, 'ids': sorted(ids)}
+        return frozenset(ids)
+
+    def _members(self):
+        """Valor para filtros '__in': subquery da sub-árvore (gestor) ou o próprio."""
+        if self.is_manager:
+            return subarvore(self.user.id)
+        return [self.user.id]
+
+    # --- Filtros de querysets ---
+
+    def filter_sales(self, queryset):
+        if self.is_global:
+            return queryset
+        return queryset.filter(consultant_id__in=self._members())
+
+    def filter_clients(self, queryset):
+        if self.is_global:
+            return queryset
+        if self.is_manager:
+            members = self._members()
+            return queryset.filter(Q(consultant_id__in=members) | Q(manager_id__in=members))
+        return queryset.filter(consultant_id=self.user.id)
+
+    def filter_goals(self, queryset):
+        if self.is_global:
+            return queryset
+        return queryset.filter(user_id__in=self._members())
+
+    def filter_facts(self, queryset):
+        """Factos de desempenho (ConsultantMonthFact) dos membros visíveis."""
+        if self.is_global:
+            return queryset
+        return queryset.filter(consultant_id__in=self._members())
+
+    def filter_users(self, queryset):
+        """Utilizadores da equipa (sem o próprio gestor); admin vê todos."""
+        if self.is_global:
+            return queryset
+        if self.is_manager:
+            return queryset.filter(id__in=self._members()).exclude(id=self.user.id)
+        return queryset.filter(id=self.user.id)
+
+    # --- Verificações pontuais (sem query extra depois da primeira) ---
+
+    def can_view_client(self, client):
+        if self.is_global:
+            return True
+        ids = self.member_ids
+        return client.consultant_id in ids or (self.is_manager and client.manager_id in ids)
+
+    def can_manage_user(self, user_id):
+        if self.is_global:
+            return True
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return False
+        return self.is_manager and user_id in self.team_ids
+
+
+def get_data_scope(request):
+    """Âmbito do utilizador autenticado, calculado uma vez por pedido."""
+    scope = getattr(request, '_data_scope', None)
+    if scope is None or scope.user.pk != request.user.pk:
+        scope = DataScope(request.user, session=getattr(request, 'session', None))
+        request._data_scope = scope
+    return scope
@@ -1,6 +1,15 @@
-from django.db.models import Sum, Count
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import F, Sum, Count, Max, Q
+from django.db.models.functions import Coalesce, TruncMonth
 from decimal import Decimal
-from .models import Sale
+from .categorias import cache_de
+from .facts import ranking_do_mes, totais_do_ambito
+from .models import Client, Sale, SaleSource, User
+from .payloads import colunar, dumps, tabela
 
 def calcular_kpis_gerais(queryset):
     """
@@ -12,7 +21,11 @@ def calcular_kpis_gerais(queryset):
         total_revenue_gross=Sum('revenue_gross'),
         total_sales=Count('id')
     )
+    return kpis_dos_totais(kpis)
+
 
+def kpis_dos_totais(kpis):
+    """KPIs a partir dos totais (total_revenue_net, total_revenue_gross, total_sales)."""
     kpi_tpv = kpis['total_revenue_gross'] or Decimal('0.0')
     kpi_net = kpis['total_revenue_net'] or Decimal('0.0')
 
@@ -27,4 +40,292 @@ def calcular_kpis_gerais(queryset):
         'kpi_net': kpi_net,
         'kpi_margin': kpi_margin,
         'kpi_total_sales': kpis['total_sales'] or 0
-    }
\ No newline at end of file
+    }
+
+
+# ---
+# Secções do Dashboard Geral
+# ---
+# Cada secção (KPIs, pizza, top/bottom clientes, tendência de 12 meses) é
+# um agregado independente sobre os mesmos filtros. A API síncrona
+# executa-as em sequência; a variante async executa-as em simultâneo, cada
+# uma na sua thread e com a sua ligação à base de dados.
+
+CLIENT_FIELDS = [('raw_client_name', 'string'), ('total_tpv', 'number')]
+SOURCE_FIELDS = [('source', 'string'), ('revenue', 'number')]
+TREND_FIELDS = [('date', 'date'), ('volume', 'number')]
+# Secções que uma fatia do cubo em memória responde sem SQL
+SECOES_DO_CUBO = ('kpis', 'pie_chart_data', 'line_chart_data')
+
+
+def vendas_dashboard(scope, start_date, end_date, products=None, consultants=None, today=None):
+    """
+    Querysets (lazy) do Dashboard Geral: vendas do período e vendas dos
+    últimos 12 meses (gráfico de tendência), no âmbito e com os filtros.
+    """
+    def filtrar(queryset):
+        queryset = scope.filter_sales(queryset)
+        if products:
+            queryset = queryset.filter(source_ref_id__in=cache_de(SaleSource).existentes(products))
+        if consultants:
+            queryset = queryset.filter(consultant_id__in=consultants)
+        return queryset
+
+    twelve_months_ago = today - timedelta(days=365)
+    periodo = filtrar(Sale.objects.filter(date__date__gte=start_date, date__date__lte=end_date))
+    tendencia = filtrar(Sale.objects.filter(date__date__gte=twelve_months_ago))
+    return periodo, tendencia
+
+
+def secao_kpis(queryset):
+    return _kpis_json(calcular_kpis_gerais(queryset))
+
+
+def _kpis_json(kpis):
+    return {
+        'kpi_tpv': float(kpis['kpi_tpv']),
+        'kpi_net': float(kpis['kpi_net']),
+        'kpi_margin': float(kpis['kpi_margin']),
+        'kpi_total_sales': kpis['kpi_total_sales'],
+    }
+
+
+def secao_vendas_por_fonte(queryset, formato):
+    # Agrupa pelo id da fonte (smallint) e só depois troca o id pelo nome
+    fontes = cache_de(SaleSource)
+    rows = [
+        (fontes.nome(source_id), revenue)
+        for source_id, revenue in queryset.values('source_ref_id')
+        .annotate(revenue=Sum('revenue_net'))
+        .order_by('-revenue')
+        .values_list('source_ref_id', 'revenue')
+    ]
+    return tabela(formato, rows, SOURCE_FIELDS)
+
+
+def _desempenho_clientes(queryset):
+    return (
+        queryset.values('raw_client_cnpj', 'raw_client_name')
+        .annotate(total_tpv=Sum('revenue_gross'))
+    )
+
+
+def secao_top_clientes(queryset, formato):
+    rows = _desempenho_clientes(queryset).order_by('-total_tpv').values_list('raw_client_name', 'total_tpv')[:5]
+    return tabela(formato, rows, CLIENT_FIELDS)
+
+
+def secao_bottom_clientes(queryset, formato):
+    rows = (
+        _desempenho_clientes(queryset).filter(total_tpv__gt=0)
+        .order_by('total_tpv').values_list('raw_client_name', 'total_tpv')[:5]
+    )
+    return tabela(formato, rows, CLIENT_FIELDS)
+
+
+def secao_tendencia(queryset, formato):
+    rows = (
+        queryset.annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(tpv=Sum('revenue_gross'))
+        .order_by('month')
+        .values_list('month', 'tpv')
+    )
+    return tabela(formato, rows, TREND_FIELDS)
+
+
+def _secoes(periodo, tendencia, formato, feitas=()):
+    """
+    (chave, função, argumentos) de cada secção independente que vai ao SQL,
+    exceto as já calculadas (feitas) sobre o cubo (ver dashboard/cube.py).
+    """
+    return [secao for secao in [
+        ('kpis', secao_kpis, (periodo,)),
+        ('pie_chart_data', secao_vendas_por_fonte, (periodo, formato)),
+        ('top_5_clients', secao_top_clientes, (periodo, formato)),
+        ('bottom_5_clients', secao_bottom_clientes, (periodo, formato)),
+        ('line_chart_data', secao_tendencia, (tendencia, formato)),
+    ] if secao[0] not in feitas]
+
+
+def secoes_do_cubo(fatia, formato):
+    """
+    KPIs, pizza e tendência calculados sobre o cubo em memória (sem queries
+    de vendas; os nomes das fontes podem ter de ser carregados para a cache).
+    """
+    if fatia is None:
+        return {}
+    return {
+        'kpis': _kpis_json(kpis_dos_totais(fatia.totais())),
+        'pie_chart_data': tabela(formato, fatia.receita_por_fonte(), SOURCE_FIELDS),
+        'line_chart_data': tabela(formato, fatia.tendencia_mensal(), TREND_FIELDS),
+    }
+
+
+def _montar_payload(resultados, start_date, end_date):
+    return {
+        'kpis': resultados['kpis'],
+        'charts': {
+            'pie_chart_data': resultados['pie_chart_data'],
+            'line_chart_data': resultados['line_chart_data'],
+        },
+        'tables': {
+            'top_5_clients': resultados['top_5_clients'],
+            'bottom_5_clients': resultados['bottom_5_clients'],
+        },
+        'filters_display': {
+            'start_date_display': start_date.strftime('%d/%m/%Y'),
+            'end_date_display': end_date.strftime('%d/%m/%Y'),
+        }
+    }
+
+
+def dados_dashboard_geral(periodo, tendencia, start_date, end_date, formato, fatia=None):
+    """Payload da API do Dashboard Geral, com as secções executadas em sequência."""
+    resultados = secoes_do_cubo(fatia, formato)
+    resultados.update({chave: func(*args) for chave, func, args in _secoes(periodo, tendencia, formato, resultados)})
+    return _montar_payload(resultados, start_date, end_date)
+
+
+def _com_ligacao_propria(func):
+    """
+    Executa func numa thread do executor (não na thread partilhada do
+    sync_to_async), ou seja, com uma ligação à base de dados própria, que é
+    fechada no fim para não ficar presa à thread.
+    """
+    def run(*args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def dados_dashboard_geral_async(periodo, tendencia, start_date, end_date, formato, cubo=None):
+    """
+    Igual a dados_dashboard_geral(), mas com as secções em simultâneo: o
+    tempo de resposta aproxima-se do da secção mais lenta e não da soma.
+    'cubo' são as secções já calculadas com secoes_do_cubo(), fora do event
+    loop (podem carregar a cache das fontes).
+    """
+    resultados = dict(cubo or {})
+    secoes = _secoes(periodo, tendencia, formato, resultados)
+    valores = await asyncio.gather(*(_com_ligacao_propria(func)(*args) for _, func, args in secoes))
+    resultados.update({chave: valor for (chave, _, _), valor in zip(secoes, valores)})
+    return _montar_payload(resultados, start_date, end_date)
+
+
+def dados_minha_carteira(scope, start_date, end_date, today):
+    """
+    Agregados da Minha Carteira / Minha Equipa (KPIs, desempenho da equipa,
+    carteira, inativos e série de 12 meses) já avaliados, prontos a guardar
+    em cache e a passar ao template. As listas são dicts só com os campos
+    que o template mostra (sem instâncias de modelos no cache partilhado).
+    """
+    user = scope.user
+
+    meta_year = start_date.year
+    meta_month = start_date.month
+
+    clientes_qs = Client.objects.none()
+    vendas_periodo_qs = Sale.objects.none()
+    performance_equipa = []
+    
+    twelve_months_ago = today - timedelta(days=365)
+    line_chart_qs_base = Sale.objects.filter(date__date__gte=twelve_months_ago)
+    line_chart_qs = Sale.objects.none()
+
+    # Consultor: apenas os seus dados. Gestor: toda a sua sub-árvore.
+    if user.role == User.Role.CONSULTANT:
+        clientes_qs = scope.filter_clients(Client.objects.all())
+        vendas_periodo_qs = scope.filter_sales(Sale.objects.filter(
+            date__date__gte=start_date, date__date__lte=end_date
+        ))
+        line_chart_qs = scope.filter_sales(line_chart_qs_base)
+
+    elif user.role == User.Role.MANAGER:
+        clientes_qs = scope.filter_clients(Client.objects.all())
+        vendas_periodo_qs = scope.filter_sales(Sale.objects.filter(
+            date__date__gte=start_date, date__date__lte=end_date
+        ))
+        
+        # Desempenho do mês lido dos factos pré-calculados (sem juntar vendas e metas)
+        facts_map = {f.consultant_id: f for f in ranking_do_mes(scope, meta_year, meta_month)}
+        performance_equipa = list(
+            scope.filter_users(User.objects.filter(role=User.Role.CONSULTANT))
+            .values('id', 'first_name', 'last_name')
+        )
+        for consultor in performance_equipa:
+            fact = facts_map.get(consultor['id'])
+            consultor['revenue_month'] = fact.revenue_net if fact else Decimal(0)
+            consultor['goal_month'] = fact.goal if fact else Decimal(0)
+            consultor['percent_atingido'] = fact.attainment if fact else Decimal(0)
+            consultor['commission_total'] = fact.commission if fact else Decimal(0)
+        performance_equipa.sort(key=lambda c: c['revenue_month'], reverse=True)
+        
+        line_chart_qs = scope.filter_sales(line_chart_qs_base)
+
+    kpi_revenue_periodo = vendas_periodo_qs.aggregate(
+        total=Coalesce(Sum('revenue_net'), Decimal(0))
+    )['total']
+    kpi_sales_periodo = vendas_periodo_qs.count()
+    kpi_clients_activated = vendas_periodo_qs.values('client_id').distinct().count()
+    kpi_total_clients = clientes_qs.count()
+    
+    # KPIs do mês da meta: soma dos factos de desempenho visíveis no âmbito
+    kpi_revenue_mes = kpi_meta_mes = kpi_percentual_meta = kpi_commission_mes = Decimal(0)
+    if user.role in (User.Role.CONSULTANT, User.Role.MANAGER):
+        totais_mes = totais_do_ambito(scope, meta_year, meta_month)
+        kpi_revenue_mes = totais_mes['revenue_net']
+        kpi_meta_mes = totais_mes['goal']
+        kpi_percentual_meta = totais_mes['attainment']
+        kpi_commission_mes = totais_mes['commission']
+
+    clientes_com_performance = list(clientes_qs.annotate(
+        revenue_periodo=Coalesce(
+            Sum(
+                'sales__revenue_net',
+                filter=Q(sales__date__date__gte=start_date, sales__date__date__lte=end_date)
+            ),
+            Decimal(0)
+        )
+    ).order_by('-revenue_periodo').values('cnpj', 'client_name', 'revenue_periodo'))
+    
+    inactive_days = 60
+    inactive_threshold = today - timedelta(days=inactive_days)
+    
+    # O template mostra o consultor de cada cliente inativo (na mesma query)
+    clientes_inativos = list(clientes_qs.annotate(
+        last_sale_date=Max('sales__date')
+    ).filter(
+        Q(last_sale_date__lt=inactive_threshold) | Q(last_sale_date__isnull=True)
+    ).order_by('last_sale_date').values(
+        'cnpj', 'client_name', 'last_sale_date', consultant_name=F('consultant__first_name')
+    ))
+    
+    trend_data = (
+        line_chart_qs
+        .annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(revenue=Sum('revenue_net'))
+        .order_by('month')
+        .values_list('month', 'revenue')
+    )
+    # Série em formato colunar (o template reconstrói as linhas para o amCharts)
+    line_chart_data = colunar(trend_data, [('date', 'date'), ('revenue', 'number')])
+
+    return {
+        'kpi_revenue_net': kpi_revenue_periodo,
+        'kpi_total_sales': kpi_sales_periodo,
+        'kpi_clients_activated': kpi_clients_activated,
+        'kpi_total_clients': kpi_total_clients,
+        'kpi_revenue_mes': kpi_revenue_mes,
+        'kpi_meta_mes': kpi_meta_mes,
+        'kpi_percentual_meta': kpi_percentual_meta,
+        'kpi_commission_mes': kpi_commission_mes,
+        'clientes_performance': clientes_com_performance,
+        'performance_equipa': performance_equipa,
+        'line_chart_json': dumps(line_chart_data).decode('utf-8'),
+        'clientes_inativos': clientes_inativos,
+        'inactive_days': inactive_days,
+    }
@@ -1,6 +1,13 @@
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
 from django.dispatch import receiver
-from .models import AuditLog
+from .audit import registar_auditoria
+from .categorias import limpar_caches
+from .models import Client, User
+from .redenormalization import agendar_redenormalizacao
+from .hierarchy import adicionar_utilizador, mover_utilizador
+from .generations import CLIENTS_SCOPE, bump_generations
 
 @receiver(user_logged_in)
 def log_user_login(sender, request, user, **kwargs):
@@ -8,7 +15,7 @@ def log_user_login(sender, request, user, **kwargs):
     Regista um log quando um utilizador faz login.
    
     """
-    AuditLog.objects.create(
+    registar_auditoria(
         user=user,
         action="login_success",
         details={"ip_address": request.META.get('REMOTE_ADDR')}
@@ -21,8 +28,115 @@ def log_user_logout(sender, request, user, **kwargs):
    
     """
     if user: # O 'user' pode ser None se a sessão expirou
-        AuditLog.objects.create(
+        registar_auditoria(
             user=user,
             action="logout",
             details={"ip_address": request.META.get('REMOTE_ADDR')}
-        )
\ No newline at end of file
+        )
+
+
+# ---
+# Deteção de mudanças de carteira (Client) e de equipa (User)
+# ---
+# As vendas guardam uma cópia do consultor/gestor (para evitar joins nas
+# leituras). Quando a carteira muda, só as vendas afetadas são atualizadas,
+# numa tarefa em segundo plano.
+
+_NAO_RASTREADO = object()
+
+
+def _toca_campos(update_fields, campos):
+    return update_fields is None or bool(set(update_fields) & campos)
+
+
+@receiver(pre_save, sender=Client)
+def guardar_carteira_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not _toca_campos(update_fields, {'consultant', 'consultant_id', 'manager', 'manager_id'}):
+        instance._carteira_anterior = _NAO_RASTREADO
+        return
+    instance._carteira_anterior = (
+        Client.objects.filter(pk=instance.pk).values_list('consultant_id', 'manager_id').first()
+    )
+
+
+@receiver(post_save, sender=Client)
+def reatribuir_vendas_do_cliente(sender, instance, created, raw=False, **kwargs):
+    anterior = getattr(instance, '_carteira_anterior', _NAO_RASTREADO)
+    if raw or created or anterior is _NAO_RASTREADO or anterior is None:
+        return
+    if anterior != (instance.consultant_id, instance.manager_id):
+        cnpj = instance.pk
+        transaction.on_commit(lambda: agendar_redenormalizacao(client_cnpjs=[cnpj]))
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidar_dados_de_clientes(sender, instance, raw=False, **kwargs):
+    # Páginas com listas de clientes (ETags/caches) deixam de estar atuais
+    if not raw:
+        bump_generations(CLIENTS_SCOPE)
+
+
+@receiver(pre_save, sender=User)
+def guardar_gestor_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    # O login grava apenas 'last_login', por isso não custa nenhuma query extra
+    if raw or instance.pk is None or not _toca_campos(update_fields, {'manager', 'manager_id'}):
+        instance._gestor_anterior = _NAO_RASTREADO
+        return
+    instance._gestor_anterior = (
+        User.objects.filter(pk=instance.pk).values_list('manager_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def reatribuir_vendas_do_consultor(sender, instance, created, raw=False, **kwargs):
+    anterior = getattr(instance, '_gestor_anterior', _NAO_RASTREADO)
+    if raw or created or anterior is _NAO_RASTREADO:
+        return
+    if anterior != instance.manager_id:
+        user_id = instance.pk
+        transaction.on_commit(lambda: agendar_redenormalizacao(consultant_ids=[user_id]))
+
+
+# ---
+# Manutenção da tabela de fecho da hierarquia (UserHierarchy)
+# ---
+# Corre na mesma transação da gravação, para que as permissões reflitam
+# logo a nova equipa.
+
+@receiver(post_save, sender=User)
+def atualizar_hierarquia(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adicionar_utilizador(instance.pk, instance.manager_id)
+        return
+    anterior = getattr(instance, '_gestor_anterior', _NAO_RASTREADO)
+    if anterior is not _NAO_RASTREADO and anterior != instance.manager_id:
+        mover_utilizador(instance.pk, instance.manager_id)
+
+
+@receiver(pre_delete, sender=User)
+def guardar_equipa_direta(sender, instance, **kwargs):
+    instance._equipa_direta = list(
+        User.objects.filter(manager=instance).values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def desligar_equipa_do_utilizador(sender, instance, **kwargs):
+    # As linhas do próprio utilizador saem por CASCADE; a equipa direta fica
+    # sem gestor (SET_NULL) e perde as ligações aos ancestrais antigos
+    for member_id in getattr(instance, '_equipa_direta', []):
+        mover_utilizador(member_id, None)
+
+
+# ---
+# Cache das categorias das vendas
+# ---
+# Depois de um migrate ou de um flush (p.ex. entre testes) as tabelas de
+# categorias podem ter sido recriadas: os ids em memória deixam de valer.
+
+@receiver(post_migrate)
+def esvaziar_cache_categorias(sender, **kwargs):
+    limpar_caches()
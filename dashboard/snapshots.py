@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from .cube import fatia_do_cubo
+from .etags import chave_dashboard_geral, chave_minha_carteira, geracoes_do_pedido, periodo_normalizado
+from .jobs import enqueue_job
+from .models import User
+from .payloads import FORMATO_COLUNAR, dumps, formato_pedido
+from .scope import get_data_scope
+from .services import dados_dashboard_geral, dados_minha_carteira, vendas_dashboard
+
+# ---
+# Snapshots em cache das views de leitura (e aquecimento após importações)
+# ---
+# A chave de cada snapshot (chave_* em dashboard/etags.py) combina apenas a
+# view, o âmbito, os contadores de geração e os filtros normalizados (com o
+# dia). Uma importação muda a chave; não é preciso invalidar nada. Não leva
+# nada da sessão (ao contrário da ETag das páginas HTML): o pedido sintético
+# do aquecimento dá a mesma chave que o browser de qualquer sessão. Pela
+# mesma razão, o snapshot guarda só dados; o token CSRF, as mensagens e o
+# utilizador entram na renderização de cada pedido.
+#
+# Ativo com settings.DASHBOARD_SNAPSHOT_CACHE = '<alias em CACHES>'. O cache
+# tem de ser partilhado entre processos (Redis, DatabaseCache, ...) para
+# que o aquecimento, que corre num subprocesso, sirva os workers web.
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24  # A chave muda à meia-noite; isto só limpa o cache
+WARMUP_WORKERS = 4
+
+
+def _cache():
+    alias = getattr(settings, 'DASHBOARD_SNAPSHOT_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def obter_snapshot(request, chave_func, calcular):
+    """Resultado de calcular() guardado em cache pela chave dos dados do pedido."""
+    cache = _cache()
+    if cache is None:
+        return calcular()
+    key = f"snapshot:{chave_func(request)}"
+    data = cache.get(key)
+    if data is None:
+        data = calcular()
+        cache.set(key, data, SNAPSHOT_TIMEOUT)
+    return data
+
+
+def snapshot_dashboard_geral(request):
+    """JSON (bytes) da API do Dashboard Geral para os filtros do pedido."""
+    def calcular():
+        start_date, end_date = periodo_normalizado(request)
+        filtros = {
+            'products': request.GET.getlist('products[]'),
+            'consultants': request.GET.getlist('consultants[]'),
+            'today': timezone.now().date(),
+        }
+        scope = get_data_scope(request)
+        periodo, tendencia = vendas_dashboard(scope, start_date, end_date, **filtros)
+        # KPIs, pizza e tendência do cubo em memória, se estiver ativo (ver dashboard/cube.py)
+        fatia = fatia_do_cubo(scope, start_date, end_date, generations=geracoes_do_pedido(request), **filtros)
+        return dumps(dados_dashboard_geral(periodo, tendencia, start_date, end_date, formato_pedido(request), fatia))
+    return obter_snapshot(request, chave_dashboard_geral, calcular)
+
+
+def snapshot_minha_carteira(request):
+    """Agregados da Minha Carteira para o período do pedido."""
+    def calcular():
+        start_date, end_date = periodo_normalizado(request)
+        return dados_minha_carteira(get_data_scope(request), start_date, end_date, timezone.now().date())
+    return obter_snapshot(request, chave_minha_carteira, calcular)
+
+
+# --- Aquecimento ---
+
+def pedido_sintetico(user, url_name, params=None):
+    """Pedido GET (sem filtros) como o que o browser do utilizador faria à view."""
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = reverse(url_name)
+    request.GET = QueryDict(mutable=True)
+    request.GET.update(params or {})
+    request.user = user
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    request.resolver_match = resolve(request.path)
+    return request
+
+
+def _aquecer(user, url_name, snapshot, params=None):
+    try:
+        snapshot(pedido_sintetico(user, url_name, params))
+    finally:
+        # Cada thread do executor tem a sua ligação; não a deixar aberta
+        connection.close()
+
+
+def aquecer_snapshots(workers=WARMUP_WORKERS):
+    """
+    Pré-calcula os snapshots das vistas por defeito (mês atual, todos os
+    produtos): a API do Dashboard Geral no âmbito global (partilhado por
+    todos os admins) e a Minha Carteira de cada gestor e consultor ativo.
+    No máximo `workers` em simultâneo. Devolve o número de snapshots.
+    """
+    if _cache() is None:
+        return 0
+
+    tarefas = []
+    admin = User.objects.filter(role=User.Role.ADMIN, is_active=True).order_by('id').first()
+    if admin:
+        # O template pede o formato colunar
+        tarefas.append((admin, 'api_dashboard_geral_data', snapshot_dashboard_geral, {'format': FORMATO_COLUNAR}))
+    for user in User.objects.filter(
+        role__in=[User.Role.MANAGER, User.Role.CONSULTANT], is_active=True
+    ).order_by('id'):
+        tarefas.append((user, 'minha_carteira', snapshot_minha_carteira, None))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # list() propaga a primeira exceção de uma tarefa
+        list(executor.map(lambda tarefa: _aquecer(*tarefa), tarefas))
+    return len(tarefas)
+
+
+def agendar_aquecimento(user=None):
+    """Enfileira o aquecimento (fim de cada importação); nada a fazer sem cache."""
+    if _cache() is None:
+        return None
+    return enqueue_job('aquecimento_cache', 'warm_dashboard_cache', user=user)
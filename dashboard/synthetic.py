@@ -0,0 +1,284 @@
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+import io
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+import numpy as np
+
+from .facts import atualizar_factos
+from .generations import CLIENTS_SCOPE, bump_data_generation, registar_importacao
+from .hierarchy import reconstruir_hierarquia
+from .categorias import cache_de
+from .models import (
+    Client, CommissionRule, Goal, PaymentType, Product, ProductDetail, Sale, SaleSource, SaleStatus, User,
+)
+
+# ---
+# Dados sintéticos (benchmarks e testes de desempenho)
+# ---
+# Gera uma empresa realista: diretores e gestores (hierarquia em dois
+# níveis), consultores com carteiras de tamanhos muito diferentes,
+# clientes com receita concentrada (poucos clientes fazem a maior parte),
+# clientes órfãos (CNPJs sem cliente registado), metas mensais, regras de
+# comissão e vendas das três fontes com produtos, pagamentos e estados
+# próprios. Tudo o que é gerado é identificável e pode ser apagado sem
+# tocar nos dados reais:
+#   - utilizadores com e-mail @SYNTHETIC_DOMAIN;
+#   - clientes com CNPJ a partir de SYNTHETIC_CNPJ_MIN (começados por 99);
+#   - vendas com raw_id começado por SYNTHETIC_RAW_ID_PREFIX;
+#   - regras de comissão com SYNTHETIC_RULE_PREFIX no nome.
+# As vendas são escritas com COPY (centenas de milhares de linhas/s).
+
+SYNTHETIC_DOMAIN = 'sintetico.invalid'
+SYNTHETIC_CNPJ_MIN = 99 * 10 ** 12
+SYNTHETIC_RAW_ID_PREFIX = 'SYN_'
+SYNTHETIC_RULE_PREFIX = '[Sintético]'
+SYNTHETIC_PASSWORD = 'sintetico'
+COPY_CHUNK_SIZE = 100_000
+
+# Fonte: (peso nas vendas, receita bruta mediana, fração líquida, produtos, detalhes, pagamentos, estados)
+FONTES = {
+    'Bionio': (
+        0.25, 1800.0, (1.0, 1.0),
+        ['Vale Alimentação', 'Vale Refeição', 'Vale Combustível', 'Bem-estar'],
+        [''], ['Boleto', 'Pix', 'Transferência'], ['Transferido', 'Pago e Agendado'],
+    ),
+    'Rovema Pay': (
+        0.55, 250.0, (0.01, 0.035),
+        ['Crédito', 'Débito', 'Crédito Parcelado', 'Pix'],
+        ['Visa', 'Mastercard', 'Elo', 'Hipercard'], [''], ['Pago', 'Antecipado'],
+    ),
+    'ELIQ': (
+        0.20, 900.0, (0.02, 0.06),
+        ['Combustível', 'Manutenção', 'Pedágio'],
+        ['Gasolina', 'Diesel', 'Etanol', 'Serviços'], [''], ['confirmada'],
+    ),
+}
+# Modelos das categorias, pela ordem de FONTES: fonte, produtos, detalhes, pagamentos, estados
+CATEGORIAS = (SaleSource, Product, ProductDetail, PaymentType, SaleStatus)
+
+
+def apagar_dados_sinteticos():
+    """Remove tudo o que foi gerado (ver prefixos acima). Devolve o número de vendas apagadas."""
+    with transaction.atomic():
+        # Sale não tem sinais nem dependentes: um único DELETE
+        sales, _ = Sale.objects.filter(raw_id__startswith=SYNTHETIC_RAW_ID_PREFIX).delete()
+        Client.objects.filter(cnpj__gte=SYNTHETIC_CNPJ_MIN).delete()
+        CommissionRule.objects.filter(rule_name__startswith=SYNTHETIC_RULE_PREFIX).delete()
+        # Os subordinados primeiro: os sinais de remoção religam a equipa direta
+        for role in (User.Role.CONSULTANT, User.Role.MANAGER, User.Role.ADMIN):
+            User.objects.filter(email__endswith=f'@{SYNTHETIC_DOMAIN}', role=role).delete()
+        reconstruir_hierarquia()
+        bump_data_generation(CLIENTS_SCOPE)
+    return sales
+
+
+def _primeiro_dia(months_back, today):
+    year, month = today.year, today.month - months_back + 1
+    while month < 1:
+        year, month = year - 1, month + 12
+    return date(year, month, 1)
+
+
+def _meses(inicio, today):
+    year, month = inicio.year, inicio.month
+    while (year, month) <= (today.year, today.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _criar_utilizadores(rng, managers, consultants, password):
+    """Admin, diretores (gerem gestores), gestores e consultores (distribuídos pelos gestores)."""
+    def novo(username, role, manager=None):
+        return User(
+            username=username, email=f'{username}@{SYNTHETIC_DOMAIN}', password=password,
+            role=role, manager=manager, first_name=username.split('_')[0].capitalize(),
+        )
+
+    User.objects.bulk_create([novo('admin_sint', User.Role.ADMIN)])
+    directors = max(1, managers // 10)
+    diretores = User.objects.bulk_create([novo(f'diretor_{i}', User.Role.MANAGER) for i in range(directors)])
+    gestores = User.objects.bulk_create([
+        novo(f'gestor_{i}', User.Role.MANAGER, diretores[i % directors]) for i in range(max(0, managers - directors))
+    ]) or diretores
+    equipa = rng.integers(0, len(gestores), size=consultants)
+    consultores = User.objects.bulk_create([
+        novo(f'consultor_{i}', User.Role.CONSULTANT, gestores[equipa[i]]) for i in range(consultants)
+    ])
+    reconstruir_hierarquia()
+    return consultores
+
+
+def _criar_clientes(rng, clients, consultores, orphan_ratio):
+    """
+    Clientes registados (com carteira) e CNPJs órfãos (só aparecem nas
+    vendas). Devolve arrays alinhados por índice de cliente.
+    """
+    total = clients + int(clients * orphan_ratio)
+    cnpjs = [SYNTHETIC_CNPJ_MIN + n for n in range(total)]
+    nomes = [f'Empresa Sintética {n}' for n in range(total)]
+
+    # Carteiras de tamanhos desiguais (poucos consultores com muitos clientes)
+    peso_consultor = rng.pareto(1.5, size=len(consultores)) + 1
+    dono = rng.choice(len(consultores), size=clients, p=peso_consultor / peso_consultor.sum())
+    Client.objects.bulk_create([
+        Client(
+            cnpj=cnpjs[i], client_name=nomes[i],
+            consultant_id=consultores[dono[i]].id, manager_id=consultores[dono[i]].manager_id,
+        )
+        for i in range(clients)
+    ], batch_size=5000)
+
+    client_id = np.array(cnpjs[:clients] + [None] * (total - clients), dtype=object)
+    consultant_id = np.array([consultores[d].id for d in dono] + [None] * (total - clients), dtype=object)
+    manager_id = np.array([consultores[d].manager_id for d in dono] + [None] * (total - clients), dtype=object)
+    # Receita concentrada: peso de cada cliente segue uma Pareto
+    peso = rng.pareto(1.2, size=total) + 1
+    return cnpjs, nomes, client_id, consultant_id, manager_id, peso / peso.sum()
+
+
+def _linhas_copy(rng, n, offset, clientes, inicio, fim):
+    """n vendas no formato de texto do COPY (tab, \\N para nulos)."""
+    cnpjs, nomes, client_id, consultant_id, manager_id, peso = clientes
+    fontes = list(FONTES)
+    fonte = rng.choice(len(fontes), size=n, p=[FONTES[f][0] for f in fontes])
+    cliente = rng.choice(len(cnpjs), size=n, p=peso)
+    inicio_ts = timezone.make_aware(datetime.combine(inicio, dtime.min)).timestamp()
+    fim_ts = timezone.make_aware(datetime.combine(fim, dtime.max)).timestamp()
+    # Mais vendas nos meses recentes (crescimento)
+    instante = inicio_ts + (fim_ts - inicio_ts) * np.sqrt(rng.random(size=n))
+    mediana = np.array([FONTES[f][1] for f in fontes])
+    liq_min = np.array([FONTES[f][2][0] for f in fontes])
+    liq_max = np.array([FONTES[f][2][1] for f in fontes])
+    bruto = np.round(mediana[fonte] * rng.lognormal(0.0, 0.8, size=n), 2)
+    liquido = np.round(bruto * (liq_min[fonte] + (liq_max - liq_min)[fonte] * rng.random(size=n)), 2)
+    volume = rng.integers(1, 50, size=n)
+    escolhas = rng.random(size=(n, 4))
+    tz = timezone.get_current_timezone()
+
+    buffer = io.StringIO()
+    nulo = '\\N'
+    # As categorias vão para o COPY já como ids (texto vazio = nulo)
+    categorias = {
+        source: [_ids_copy(model, nomes) for model, nomes in zip(CATEGORIAS, ([source], *FONTES[source][3:]))]
+        for source in fontes
+    }
+    for i in range(n):
+        source = fontes[fonte[i]]
+        (source_id,), produtos, detalhes, pagamentos, estados = categorias[source]
+        e = escolhas[i]
+        c = cliente[i]
+        buffer.write('\t'.join((
+            source_id,
+            f'{SYNTHETIC_RAW_ID_PREFIX}{offset + i}',
+            str(client_id[c]) if client_id[c] else nulo,
+            str(consultant_id[c]) if consultant_id[c] else nulo,
+            str(manager_id[c]) if manager_id[c] else nulo,
+            datetime.fromtimestamp(instante[i], tz=tz).isoformat(),
+            f'{bruto[i]:.2f}', f'{liquido[i]:.2f}',
+            f'{volume[i]}.000' if source == 'ELIQ' else nulo,
+            produtos[int(e[0] * len(produtos))], detalhes[int(e[1] * len(detalhes))],
+            pagamentos[int(e[2] * len(pagamentos))], estados[int(e[3] * len(estados))],
+            nomes[c], str(cnpjs[c]),
+        )))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def _ids_copy(model, nomes):
+    ids = cache_de(model).ids(nomes)
+    return [str(ids[nome]) if nome else '\\N' for nome in nomes]
+
+
+def _copiar_vendas(buffer):
+    colunas = (
+        'source_ref_id, raw_id, client_id, consultant_id, manager_id, date, revenue_gross, revenue_net, volume, '
+        'product_name_ref_id, product_detail_ref_id, payment_type_ref_id, status_ref_id, '
+        'raw_client_name, raw_client_cnpj'
+    )
+    sql = f'COPY {Sale._meta.db_table} ({colunas}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.read())
+
+
+def _criar_metas(rng, consultores, inicio, today):
+    metas = []
+    for consultor in consultores:
+        base = float(rng.lognormal(9.5, 0.6))
+        for year, month in _meses(inicio, today):
+            metas.append(Goal(
+                user_id=consultor.id, year=year, month=month,
+                target_value=Decimal(f'{base * float(rng.uniform(0.8, 1.3)):.2f}'),
+            ))
+    Goal.objects.bulk_create(metas, batch_size=5000)
+    return len(metas)
+
+
+def _criar_regras(inicio):
+    """Uma regra base e um escalão superior por fonte (só nas fontes sem regras reais)."""
+    regras = []
+    for source, percentagem in (('Bionio', '2.00'), ('Rovema Pay', '10.00'), ('ELIQ', '5.00')):
+        if CommissionRule.objects.filter(source=source).exists():
+            continue
+        regras += [
+            CommissionRule(
+                rule_name=f'{SYNTHETIC_RULE_PREFIX} {source} base', source=source,
+                percentage=Decimal(percentagem), valid_from=inicio,
+                min_revenue=Decimal('0'), max_revenue=Decimal('50000'),
+            ),
+            CommissionRule(
+                rule_name=f'{SYNTHETIC_RULE_PREFIX} {source} escalão', source=source,
+                percentage=Decimal(percentagem) * Decimal('1.5'), valid_from=inicio,
+                min_revenue=Decimal('50000'),
+            ),
+        ]
+    CommissionRule.objects.bulk_create(regras)
+    return len(regras)
+
+
+def gerar_dados_sinteticos(
+    sales=1_000_000, clients=20_000, consultants=200, managers=20, months=24,
+    orphan_ratio=0.05, seed=42, progress=None,
+):
+    """
+    Gera o conjunto de dados (ver acima) e atualiza a hierarquia, os
+    factos de desempenho e os contadores de geração. Com a mesma semente,
+    gera sempre os mesmos dados. 'progress(feitas, total)' é chamado
+    depois de cada bloco de vendas. Devolve um resumo com as contagens.
+    """
+    rng = np.random.default_rng(seed)
+    today = timezone.localdate()
+    inicio = _primeiro_dia(months, today)
+    password = make_password(SYNTHETIC_PASSWORD)  # um único hash para todos
+
+    with transaction.atomic():
+        consultores = _criar_utilizadores(rng, managers, consultants, password)
+        clientes = _criar_clientes(rng, clients, consultores, orphan_ratio)
+        goals = _criar_metas(rng, consultores, inicio, today)
+        rules = _criar_regras(inicio)
+
+        feitas = 0
+        while feitas < sales:
+            n = min(COPY_CHUNK_SIZE, sales - feitas)
+            _copiar_vendas(_linhas_copy(rng, n, feitas, clientes, inicio, today))
+            feitas += n
+            if progress:
+                progress(feitas, sales)
+
+        facts = atualizar_factos()
+        registar_importacao(*FONTES)
+        bump_data_generation(CLIENTS_SCOPE)
+
+    return {
+        'sales': sales, 'clients': clients, 'orphan_clients': len(clientes[0]) - clients,
+        'consultants': consultants, 'managers': managers, 'goals': goals,
+        'commission_rules': rules, 'facts': facts, 'months': months,
+    }
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ---
+# Telemetria das importações (tempo e memória por fase)
+# ---
+# Cada importador divide o trabalho nas mesmas fases:
+#   mapas -> leitura -> limpeza -> atribuicao -> gravacao -> pos_processamento
+# e guarda, para cada uma, o tempo e a memória (RSS do processo no fim da
+# fase e o pico até lá) em details['telemetry'] do registo de auditoria
+# da importação. A Carga de Dados mostra-os no histórico e o endpoint
+# de métricas expõe os da última importação de cada fonte.
+#
+# Com --tracemalloc, cada fase regista também o pico de memória alocada
+# pelo Python (mais preciso, mas torna a importação mais lenta).
+
+FASES = ('mapas', 'leitura', 'limpeza', 'atribuicao', 'gravacao', 'pos_processamento')
+
+_MB = 1024 * 1024
+
+
+def rss_atual():
+    """RSS atual do processo em bytes (Linux), ou o pico se não for possível ler."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return rss_pico()
+
+
+def rss_pico():
+    """Pico de RSS do processo em bytes (0 se indisponível)."""
+    if resource is None:
+        return 0
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devolve KB; macOS devolve bytes
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+class TelemetriaImportacao:
+    """Mede as fases de uma importação: with telemetria.fase('leitura'): ..."""
+
+    def __init__(self, tracemalloc_ativo=False):
+        self.fases = []
+        self.inicio = time.perf_counter()
+        self.tracemalloc = tracemalloc_ativo
+        if self.tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def fase(self, nome):
+        if self.tracemalloc:
+            tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            medida = {
+                'name': nome,
+                'seconds': round(time.perf_counter() - inicio, 3),
+                'rss_mb': round(rss_atual() / _MB, 1),
+                'peak_rss_mb': round(rss_pico() / _MB, 1),
+            }
+            if self.tracemalloc:
+                medida['py_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / _MB, 1)
+            self.fases.append(medida)
+
+    def resumo(self, rows=None):
+        """Dicionário para details['telemetry'] (inclui as fases já concluídas, mesmo em falha)."""
+        total = round(time.perf_counter() - self.inicio, 3)
+        resumo = {
+            'total_seconds': total,
+            'peak_rss_mb': round(rss_pico() / _MB, 1),
+            'phases': self.fases,
+        }
+        if rows is not None:
+            resumo['rows_per_second'] = round(rows / total, 1) if total else None
+        return resumo
+
+
+def formatar_telemetria(resumo):
+    """Linha de resumo para a saída dos comandos."""
+    fases = ", ".join(f"{fase['name']} {fase['seconds']:.2f}s" for fase in resumo['phases'])
+    return f"Tempo por fase: {fases} | total {resumo['total_seconds']:.2f}s, pico de RSS {resumo['peak_rss_mb']} MB"
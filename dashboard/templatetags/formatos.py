@@ -0,0 +1,13 @@
+from django import template
+
+from dashboard.cleaning import formatar_cnpj
+
+register = template.Library()
+
+@register.filter(name='cnpj')
+def cnpj(value):
+    """
+    Filtro de template que formata um CNPJ guardado como inteiro
+    (ex: 12345678000190 -> 12.345.678/0001-90).
+    """
+    return formatar_cnpj(value)
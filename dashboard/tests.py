@@ -1,6 +1,56 @@
-from django.test import TestCase, Client
+import gzip
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import User
+from django.utils import timezone
+
+from .analytics import _intervalo_mes, _pasta_mes, duckdb, exportar_vendas_parquet, ler_manifesto, pq
+from .audit import arquivar_auditoria, flush_auditoria, pagina_auditoria, registar_auditoria
+from .benchmarks import utilizadores_tipicos
+from .categorias import cache_de, limpar_caches
+from .cleaning import clean_cnpj, formatar_cnpj
+from .commissions import relatorio_comissoes
+from .cube import CUBE_DAYS, fatia_do_cubo, limpar_cubo, obter_cubo
+from .db_router import REPLICA_PIN_COOKIE
+from .facts import atualizar_factos
+from .generations import get_data_generation, registar_importacao
+from .goals import gravar_metas_em_lote
+from .hierarchy import reconstruir_hierarquia
+from .import_fixtures import brl, cnpj_exportado
+from .metrics import (
+    MetricasMiddleware, RegistoMetricas, arquivar_processo, registo, registo_agregado, texto_importacoes, texto_prometheus,
+)
+from .models import AuditLog, User, Sale, Goal, BackgroundJob, DataGeneration, UserHierarchy, CommissionRule, ConsultantMonthFact, ProfileArtifact
+from .models import SaleSource, SaleStatus
+from .scope import DataScope
+from .services import SECOES_DO_CUBO, dados_dashboard_geral, vendas_dashboard
+from .models import Client as ClientRecord
+from .payloads import colunar, dumps
+from .profiler import AmostradorPilhas
+from .snapshots import agendar_aquecimento
+from .synthetic import SYNTHETIC_DOMAIN, SYNTHETIC_RAW_ID_PREFIX, apagar_dados_sinteticos, gerar_dados_sinteticos
+from .telemetry import FASES
 
 class UserRoleTests(TestCase):
     def setUp(self):
@@ -44,4 +94,1523 @@ class UserRoleTests(TestCase):
         self.client.force_login(self.consultant)
         response = self.client.get(reverse('user_list'))
         # Deve receber 403 Forbidden (graças ao seu RoleRequiredMixin/decorator)
-        self.assertEqual(response.status_code, 403)
\ No newline at end of file
+        self.assertEqual(response.status_code, 403)
+
+class BulkAssignmentTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor', email='gestor@teste.com', password='password123',
+            role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor', email='consultor@teste.com', password='password123',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        self.other_consultant = User.objects.create_user(
+            username='outro', email='outro@teste.com', password='password123',
+            role=User.Role.CONSULTANT
+        )
+        now = timezone.now()
+        for i, cnpj in enumerate(['11111111000111', '22222222000122', '33333333000133']):
+            for n in range(2):
+                Sale.objects.create(
+                    source='Bionio', raw_id=f'B{i}{n}', date=now,
+                    revenue_gross=Decimal('100'), revenue_net=Decimal('10'),
+                    raw_client_cnpj=cnpj, raw_client_name=f'Cliente {i}'
+                )
+        self.client = Client()
+        self.client.force_login(self.manager)
+        self.url = reverse('api_atribuir_clientes_lote')
+
+    def post_json(self, atribuicoes):
+        return self.client.post(
+            self.url, data=json.dumps({'atribuicoes': atribuicoes}),
+            content_type='application/json'
+        )
+
+    def test_json_batch_assigns_clients_and_orphan_sales(self):
+        response = self.post_json([
+            {'cnpj': '11.111.111/0001-11', 'consultor': self.consultant.id},
+            {'cnpj': '22222222000122', 'consultor': 'CONSULTOR@teste.com', 'client_name': 'Novo Nome'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['result'], {'clients_saved': 2, 'sales_updated': 4})
+
+        self.assertEqual(ClientRecord.objects.get(cnpj='11111111000111').client_name, 'Cliente 0')
+        self.assertEqual(ClientRecord.objects.get(cnpj='22222222000122').client_name, 'Novo Nome')
+        self.assertEqual(Sale.objects.filter(consultant=self.consultant, manager=self.manager).count(), 4)
+        self.assertEqual(Sale.objects.filter(consultant__isnull=True).count(), 2)
+        self.assertEqual(get_data_generation(), 1)
+
+    def test_manager_cannot_assign_outside_team(self):
+        response = self.post_json([{'cnpj': '11111111000111', 'consultor': self.other_consultant.id}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClientRecord.objects.exists())
+
+    def test_csv_mapping(self):
+        csv_file = SimpleUploadedFile(
+            'mapa.csv', b'cnpj;consultor\n3,3333333000133E+13;consultor@teste.com\n'
+        )
+        response = self.client.post(self.url, {'csv_file': csv_file})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Sale.objects.filter(client_id='33333333000133', consultant=self.consultant).count(), 2)
+
+    @override_settings(BULK_ASSIGN_ASYNC_THRESHOLD=1, BACKGROUND_JOBS_INLINE=True)
+    def test_large_batch_runs_as_background_job(self):
+        response = self.post_json([{'cnpj': '11111111000111', 'consultor': self.consultant.id}])
+        self.assertEqual(response.status_code, 202)
+        job = BackgroundJob.objects.get(id=response.json()['job']['id'])
+        self.assertEqual(job.status, BackgroundJob.Status.DONE)
+        self.assertEqual(job.progress_done, 2)
+        self.assertEqual(job.details['result']['sales_updated'], 2)
+
+        status = self.client.get(reverse('api_estado_tarefa', args=[job.id])).json()
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['percent'], 100.0)
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class SaleRedenormalizationTests(TestCase):
+    def setUp(self):
+        self.manager_a = User.objects.create_user(
+            username='gestor_a', email='gestor_a@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.manager_b = User.objects.create_user(
+            username='gestor_b', email='gestor_b@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant_a = User.objects.create_user(
+            username='consultor_a', email='consultor_a@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager_a
+        )
+        self.consultant_b = User.objects.create_user(
+            username='consultor_b', email='consultor_b@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager_b
+        )
+        self.cliente = ClientRecord.objects.create(
+            cnpj='44444444000144', client_name='Cliente',
+            consultant=self.consultant_a, manager=self.manager_a
+        )
+        for n in range(3):
+            Sale.objects.create(
+                source='ELIQ', raw_id=f'E{n}', date=timezone.now(), client=self.cliente,
+                consultant=self.consultant_a, manager=self.manager_a,
+                raw_client_cnpj=self.cliente.cnpj
+            )
+
+    def test_client_moving_to_another_consultant_updates_its_sales(self):
+        self.cliente.consultant = self.consultant_b
+        self.cliente.manager = self.manager_b
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente.save()
+
+        self.assertEqual(Sale.objects.filter(consultant=self.consultant_b, manager=self.manager_b).count(), 3)
+        job = BackgroundJob.objects.get(kind='redenormalizacao_vendas')
+        self.assertEqual(job.status, BackgroundJob.Status.DONE)
+        self.assertEqual(job.details['result'], {'sales_updated': 3})
+
+    def test_consultant_moving_to_another_manager_updates_clients_and_sales(self):
+        self.consultant_a.manager = self.manager_b
+        with self.captureOnCommitCallbacks(execute=True):
+            self.consultant_a.save()
+
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.manager, self.manager_b)
+        self.assertEqual(Sale.objects.filter(manager=self.manager_b).count(), 3)
+
+    def test_unrelated_saves_do_not_enqueue(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.consultant_a.first_name = 'Novo'
+            self.consultant_a.save()
+            self.consultant_a.save(update_fields=['last_login'])
+            self.cliente.client_name = 'Outro Nome'
+            self.cliente.save()
+        self.assertEqual(len(callbacks), 0)
+        self.assertFalse(BackgroundJob.objects.exists())
+
+
+class HierarchyScopeTests(TestCase):
+    def setUp(self):
+        self.director = User.objects.create_user(
+            username='diretor', email='diretor@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.manager = User.objects.create_user(
+            username='gestor', email='gestor@teste.com', password='x',
+            role=User.Role.MANAGER, manager=self.director
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor', email='consultor@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        self.cliente = ClientRecord.objects.create(
+            cnpj='55555555000155', client_name='Cliente',
+            consultant=self.consultant, manager=self.manager
+        )
+        Sale.objects.create(
+            source='Bionio', raw_id='B1', date=timezone.now(), client=self.cliente,
+            consultant=self.consultant, manager=self.manager, raw_client_cnpj=self.cliente.cnpj
+        )
+
+    def subtree(self, user):
+        return set(UserHierarchy.objects.filter(ancestor=user).values_list('descendant_id', flat=True))
+
+    def test_closure_covers_multiple_levels(self):
+        self.assertEqual(self.subtree(self.director), {self.director.id, self.manager.id, self.consultant.id})
+        self.assertEqual(
+            UserHierarchy.objects.get(ancestor=self.director, descendant=self.consultant).depth, 2
+        )
+        scope = DataScope(self.director)
+        self.assertEqual(scope.filter_sales(Sale.objects.all()).count(), 1)
+        self.assertTrue(scope.can_view_client(self.cliente))
+
+    def test_moving_and_deleting_users_updates_closure(self):
+        self.consultant.manager = None
+        self.consultant.save()
+        self.assertEqual(self.subtree(self.director), {self.director.id, self.manager.id})
+
+        self.consultant.manager = self.manager
+        self.consultant.save()
+        self.manager.delete()
+        self.assertEqual(self.subtree(self.director), {self.director.id})
+        self.assertEqual(self.subtree(self.consultant), {self.consultant.id})
+
+    def test_manager_cannot_be_moved_under_own_team(self):
+        self.director.manager = self.manager
+        with self.assertRaises(ValidationError):
+            self.director.full_clean()
+
+    def test_team_ids_are_cached_in_session(self):
+        session = {}
+        DataScope(self.director, session=session).member_ids
+        with self.assertNumQueries(1):  # apenas a leitura da geração da hierarquia
+            ids = DataScope(self.director, session=session).member_ids
+        self.assertIn(self.consultant.id, ids)
+
+    def test_multi_level_manager_views(self):
+        self.client.force_login(self.director)
+        response = self.client.get(reverse('client_detail', args=[self.cliente.cnpj]))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('minha_carteira'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['kpi_total_sales'], 1)
+
+        outsider = User.objects.create_user(
+            username='outro', email='outro@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.client.force_login(outsider)
+        response = self.client.get(reverse('client_detail', args=[self.cliente.cnpj]))
+        self.assertEqual(response.status_code, 403)
+
+
+class CommissionEngineTests(TestCase):
+    """Compara o motor SQL de comissões com um cálculo de referência em Python."""
+    YEAR, MONTH = 2026, 3
+
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor_com', email='gestor_com@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultants = User.objects.bulk_create([
+            User(username=f'com_{n}', email=f'com_{n}@teste.com', role=User.Role.CONSULTANT,
+                 manager=self.manager if n % 2 == 0 else None)
+            for n in range(60)
+        ])
+        reconstruir_hierarquia()
+
+        # ELIQ muda de percentagem a meio do mês; Bionio tem escalões; Rovema Pay é fixa
+        self.rules = [
+            CommissionRule.objects.create(rule_name='ELIQ antiga', source='ELIQ', percentage=Decimal('5'),
+                                          valid_to=date(2026, 3, 15)),
+            CommissionRule.objects.create(rule_name='ELIQ nova', source='ELIQ', percentage=Decimal('6'),
+                                          valid_from=date(2026, 3, 16)),
+            CommissionRule.objects.create(rule_name='Bionio base', source='Bionio', percentage=Decimal('2'),
+                                          max_revenue=Decimal('10000')),
+            CommissionRule.objects.create(rule_name='Bionio topo', source='Bionio', percentage=Decimal('3'),
+                                          min_revenue=Decimal('10000')),
+            CommissionRule.objects.create(rule_name='Rovema', source='Rovema Pay', percentage=Decimal('4')),
+        ]
+
+        tz = timezone.get_current_timezone()
+        sources = ['ELIQ', 'Bionio', 'Rovema Pay', 'Sem Regra']
+        sales = []
+        for i, consultant in enumerate(self.consultants):
+            for day in range(1, 32, 3):
+                for s, source in enumerate(sources):
+                    sales.append(Sale(
+                        source=source, raw_id=f'{consultant.id}-{day}-{s}',
+                        date=datetime(self.YEAR, self.MONTH, day, 12, tzinfo=tz),
+                        consultant=consultant, manager=consultant.manager,
+                        revenue_net=Decimal(100 + (i * 37 + day * 11 + s * 5) % 900) * (i % 3 + 1),
+                    ))
+        # Venda fora do mês não entra no relatório
+        sales.append(Sale(source='ELIQ', raw_id='fora', date=datetime(2026, 4, 1, 12, tzinfo=tz),
+                          consultant=self.consultants[0], revenue_net=Decimal('99999')))
+        Sale.objects.bulk_create(sales)
+        self.sales = sales[:-1]
+
+    def referencia(self, consultant_ids):
+        """Mesmas regras aplicadas venda a venda, em Python."""
+        monthly = defaultdict(Decimal)
+        for sale in self.sales:
+            monthly[(sale.consultant_id, sale.source)] += sale.revenue_net
+
+        rows = defaultdict(lambda: {'revenue': Decimal('0'), 'commission': Decimal('0')})
+        for sale in self.sales:
+            if sale.consultant_id not in consultant_ids:
+                continue
+            day = timezone.localtime(sale.date).date()
+            total = monthly[(sale.consultant_id, sale.source)]
+            candidates = [
+                r for r in self.rules
+                if r.source == sale.source
+                and (r.valid_from is None or r.valid_from <= day)
+                and (r.valid_to is None or r.valid_to >= day)
+                and total >= r.min_revenue
+                and (r.max_revenue is None or total < r.max_revenue)
+            ]
+            percentage = candidates[0].percentage if candidates else Decimal('0')
+            rows[sale.consultant_id]['revenue'] += sale.revenue_net
+            rows[sale.consultant_id]['commission'] += sale.revenue_net * percentage / 100
+        return rows
+
+    def assertReportMatches(self, report, consultant_ids):
+        expected = self.referencia(consultant_ids)
+        self.assertEqual(set(report['rows']), set(expected))
+        for consultant_id, values in expected.items():
+            self.assertEqual(report['rows'][consultant_id]['revenue'], values['revenue'])
+            self.assertEqual(report['rows'][consultant_id]['commission'],
+                             values['commission'].quantize(Decimal('0.01')))
+        self.assertEqual(report['total']['revenue'], sum(v['revenue'] for v in expected.values()))
+        self.assertEqual(report['total']['commission'],
+                         sum(v['commission'] for v in expected.values()).quantize(Decimal('0.01')))
+
+    def test_company_report_matches_reference(self):
+        with self.assertNumQueries(1):
+            report = relatorio_comissoes(self.YEAR, self.MONTH)
+        self.assertReportMatches(report, {c.id for c in self.consultants})
+
+    def test_team_report_is_limited_to_scope(self):
+        report = relatorio_comissoes(self.YEAR, self.MONTH, DataScope(self.manager))
+        self.assertReportMatches(report, {c.id for c in self.consultants if c.manager_id == self.manager.id})
+
+    def test_overlapping_rules_are_rejected(self):
+        rule = CommissionRule(rule_name='Duplicada', source='ELIQ', percentage=Decimal('7'),
+                              valid_from=date(2026, 3, 10), valid_to=date(2026, 3, 20))
+        with self.assertRaises(ValidationError):
+            rule.full_clean()
+
+    def test_report_view_access(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('relatorio_comissoes'), {'year': self.YEAR, 'month': self.MONTH})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['linhas']), 30)
+
+        # Ano fora do que o datetime aceita: mensagem e mês atual, não um 500
+        for year in ('0', '9999', '10000'):
+            response = self.client.get(reverse('relatorio_comissoes'), {'year': year, 'month': 12})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['selected_year_str'], str(timezone.now().year))
+
+        self.client.force_login(self.consultants[1])
+        response = self.client.get(reverse('relatorio_comissoes'))
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class PerformanceFactTests(TestCase):
+    YEAR, MONTH = 2026, 5
+
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor_fac', email='gestor_fac@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant_a = User.objects.create_user(
+            username='fac_a', email='fac_a@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        self.consultant_b = User.objects.create_user(
+            username='fac_b', email='fac_b@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        CommissionRule.objects.create(rule_name='ELIQ', source='ELIQ', percentage=Decimal('10'))
+        self.cliente = ClientRecord.objects.create(
+            cnpj='55555555000155', client_name='Cliente',
+            consultant=self.consultant_a, manager=self.manager
+        )
+        tz = timezone.get_current_timezone()
+        for n in range(3):
+            Sale.objects.create(
+                source='ELIQ', raw_id=f'F{n}', date=datetime(self.YEAR, self.MONTH, 10 + n, 12, tzinfo=tz),
+                client=self.cliente, consultant=self.consultant_a, manager=self.manager,
+                raw_client_cnpj=self.cliente.cnpj, revenue_net=Decimal('100')
+            )
+        Goal.objects.create(user=self.consultant_a, year=self.YEAR, month=self.MONTH, target_value=Decimal('600'))
+        Goal.objects.create(user=self.consultant_b, year=self.YEAR, month=self.MONTH, target_value=Decimal('200'))
+        atualizar_factos([(self.YEAR, self.MONTH)])
+
+    def fact(self, consultant):
+        return ConsultantMonthFact.objects.get(consultant=consultant, year=self.YEAR, month=self.MONTH)
+
+    def test_facts_do_not_double_count_goals(self):
+        fact = self.fact(self.consultant_a)
+        self.assertEqual(fact.revenue_net, Decimal('300'))
+        self.assertEqual(fact.goal, Decimal('600'))  # uma meta, apesar das três vendas
+        self.assertEqual(fact.commission, Decimal('30'))
+        self.assertEqual(fact.attainment, Decimal('50'))
+        self.assertEqual(self.fact(self.consultant_b).revenue_net, Decimal('0'))
+
+    def test_goal_edit_refreshes_fact(self):
+        self.client.force_login(self.manager)
+        self.client.post(reverse('gestao_metas'), {
+            'year': self.YEAR, 'month': self.MONTH,
+            f'meta_{self.consultant_a.id}': '300', f'meta_{self.consultant_b.id}': '',
+        })
+        self.assertEqual(self.fact(self.consultant_a).attainment, Decimal('100'))
+        self.assertFalse(ConsultantMonthFact.objects.filter(consultant=self.consultant_b).exists())
+
+    def test_manager_portfolio_reads_facts(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('minha_carteira'), {'start_date': f'{self.YEAR}-05-01', 'end_date': f'{self.YEAR}-05-31'})
+        self.assertEqual(response.context['kpi_revenue_mes'], Decimal('300'))
+        self.assertEqual(response.context['kpi_meta_mes'], Decimal('800'))
+        self.assertEqual(response.context['kpi_commission_mes'], Decimal('30'))
+        equipa = response.context['performance_equipa']
+        self.assertEqual(equipa[0]['id'], self.consultant_a.id)
+        self.assertEqual(equipa[0]['goal_month'], Decimal('600'))
+
+    def test_client_move_refreshes_both_consultants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente.consultant = self.consultant_b
+            self.cliente.save()
+        self.assertEqual(self.fact(self.consultant_a).revenue_net, Decimal('0'))
+        self.assertEqual(self.fact(self.consultant_b).revenue_net, Decimal('300'))
+        self.assertEqual(self.fact(self.consultant_b).attainment, Decimal('150'))
+
+    def test_command_rebuilds_month(self):
+        ConsultantMonthFact.objects.all().delete()
+        call_command('atualizar_factos_desempenho', year=self.YEAR, month=self.MONTH, stdout=io.StringIO())
+        self.assertEqual(self.fact(self.consultant_a).revenue_net, Decimal('300'))
+
+
+class BulkGoalTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor_meta', email='gestor_meta@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultants = [
+            User.objects.create_user(
+                username=f'meta_{n}', email=f'meta_{n}@teste.com', password='x',
+                role=User.Role.CONSULTANT, manager=self.manager
+            )
+            for n in range(3)
+        ]
+        self.outsider = User.objects.create_user(
+            username='meta_fora', email='meta_fora@teste.com', password='x', role=User.Role.CONSULTANT
+        )
+        Goal.objects.create(user=self.consultants[0], year=2026, month=1, target_value=Decimal('50'))
+        self.client.force_login(self.manager)
+
+    def test_month_save_is_one_bulk_write_scoped_to_team(self):
+        data = {'year': '2026', 'month': '1', 'vista': 'mes', f'meta_{self.outsider.id}': '999'}
+        data.update({f'meta_{c.id}': '1.500,50' for c in self.consultants[1:]})
+        data[f'meta_{self.consultants[0].id}'] = ''
+        self.client.post(reverse('gestao_metas'), data)
+
+        goals = dict(Goal.objects.filter(year=2026, month=1).values_list('user_id', 'target_value'))
+        self.assertEqual(goals, {c.id: Decimal('1500.50') for c in self.consultants[1:]})
+
+    def test_year_grid_round_trip(self):
+        data = {'year': '2026', 'month': '1', 'vista': 'ano'}
+        for month in range(1, 13):
+            data[f'meta_{self.consultants[1].id}_{month}'] = str(month * 100)
+        self.client.post(reverse('gestao_metas'), data)
+        self.assertEqual(Goal.objects.filter(user=self.consultants[1], year=2026).count(), 12)
+
+        with self.assertNumQueries(4):  # sessão, utilizador, pivot das metas e consultores
+            response = self.client.get(reverse('gestao_metas'), {'year': 2026, 'month': 1, 'vista': 'ano'})
+        linhas = {l['consultant'].id: l['metas'] for l in response.context['grelha']}
+        self.assertEqual(linhas[self.consultants[1].id][11], (12, Decimal('1200')))
+        self.assertEqual(linhas[self.consultants[0].id][0], (1, Decimal('50')))
+
+    def test_csv_import_uses_bulk_path(self):
+        csv_file = SimpleUploadedFile('metas.csv', (
+            "consultor;ano;mes;meta\n"
+            f"{self.consultants[2].email};2026;3;2000\n"
+            f"{self.consultants[2].id};2026;4;2500,00\n"
+            f"{self.outsider.email};2026;3;100\n"
+            f"{self.consultants[1].id};2026;13;100\n"
+        ).encode('utf-8'))
+        self.client.post(reverse('gestao_metas'), {'year': '2026', 'month': '3', 'csv_file': csv_file})
+        goals = dict(Goal.objects.filter(user=self.consultants[2]).values_list('month', 'target_value'))
+        self.assertEqual(goals, {3: Decimal('2000'), 4: Decimal('2500')})
+        self.assertFalse(Goal.objects.filter(user=self.outsider).exists())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor_etag', email='gestor_etag@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor_etag', email='consultor_etag@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        self.cliente = ClientRecord.objects.create(
+            cnpj='66666666000166', client_name='Cliente', consultant=self.consultant, manager=self.manager
+        )
+        Sale.objects.create(
+            source='ELIQ', raw_id='ET1', date=timezone.now(), client=self.cliente,
+            consultant=self.consultant, manager=self.manager, raw_client_cnpj=self.cliente.cnpj,
+            revenue_net=Decimal('10'), revenue_gross=Decimal('100')
+        )
+        self.client.force_login(self.manager)
+
+    def test_api_answers_304_without_aggregates(self):
+        url = reverse('api_dashboard_geral_data')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(3):  # sessão, utilizador e contadores de geração
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Filtros equivalentes (ordem diferente) dão a mesma ETag
+        a = self.client.get(url, {'products[]': ['ELIQ', 'Bionio']})['ETag']
+        b = self.client.get(url, {'products[]': ['Bionio', 'ELIQ']})['ETag']
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, etag)
+
+    def test_import_only_invalidates_its_source(self):
+        url = reverse('api_dashboard_geral_data')
+        todas = self.client.get(url)['ETag']
+        bionio = self.client.get(url, {'products[]': ['Bionio']})['ETag']
+
+        registar_importacao('ELIQ')
+        self.assertNotEqual(self.client.get(url)['ETag'], todas)
+        self.assertEqual(self.client.get(url, {'products[]': ['Bionio']})['ETag'], bionio)
+        self.assertIsNotNone(DataGeneration.objects.get(scope=DataGeneration.GLOBAL).last_import_at)
+
+    def test_goal_change_invalidates_portfolio(self):
+        url = reverse('minha_carteira')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        today = timezone.localdate()
+        gravar_metas_em_lote(self.manager, [
+            {'consultor': self.consultant.id, 'ano': today.year, 'mes': today.month, 'meta': '500'}
+        ])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_page_etag_changes_with_a_new_login(self):
+        # A página leva o token CSRF do formulário de saída, que o login renova
+        url = reverse('minha_carteira')
+        self.client.post(reverse('login'), {'username': 'gestor_etag@teste.com', 'password': 'x'})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse('logout'))
+        self.client.post(reverse('login'), {'username': 'gestor_etag@teste.com', 'password': 'x'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_page_with_queued_messages_is_never_304(self):
+        url = reverse('minha_carteira')
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('eliminar_meta', args=[0]))  # Deixa "Meta não encontrada." em fila
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Meta não encontrada.')
+
+    def test_client_detail_never_304_without_permission(self):
+        url = reverse('client_detail', args=[self.cliente.cnpj])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        outsider = User.objects.create_user(
+            username='fora_etag', email='fora_etag@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 403)
+
+
+class ColumnarPayloadTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin_col', email='admin_col@teste.com', password='x', role=User.Role.ADMIN
+        )
+        for i, (source, gross) in enumerate([('ELIQ', '100.50'), ('Bionio', '40'), ('ELIQ', '9.25')]):
+            Sale.objects.create(
+                source=source, raw_id=f'COL{i}', date=timezone.now(), raw_client_cnpj=f'{i:014d}',
+                raw_client_name=f'Cliente {i}', revenue_net=Decimal(gross) / 10, revenue_gross=Decimal(gross)
+            )
+        self.client.force_login(self.admin)
+
+    def test_serializer_handles_decimal_and_dates(self):
+        payload = json.loads(dumps({'valor': Decimal('1.50'), 'dia': date(2024, 5, 1)}))
+        self.assertEqual(payload, {'valor': 1.5, 'dia': '2024-05-01'})
+
+        vazio = colunar([], [('date', 'date'), ('volume', 'number')])
+        self.assertEqual(vazio['length'], 0)
+        self.assertEqual(vazio['columns'], {'date': [], 'volume': []})
+
+    def test_columnar_matches_row_format(self):
+        url = reverse('api_dashboard_geral_data')
+        rows = self.client.get(url).json()
+        response = self.client.get(url, {'format': 'columnar'})
+        cols = response.json()
+        self.assertNotEqual(response['ETag'], self.client.get(url)['ETag'])
+        self.assertEqual(cols['kpis'], rows['kpis'])
+
+        def reconstruir(payload):
+            names = [field['name'] for field in payload['schema']]
+            return [dict(zip(names, values)) for values in zip(*(payload['columns'][n] for n in names))]
+
+        pie = cols['charts']['pie_chart_data']
+        self.assertEqual(pie['schema'], [{'name': 'source', 'type': 'string'}, {'name': 'revenue', 'type': 'number'}])
+        self.assertEqual(pie['columns']['source'], ['ELIQ', 'Bionio'])
+        for key in ('pie_chart_data', 'line_chart_data'):
+            self.assertEqual(reconstruir(cols['charts'][key]), rows['charts'][key])
+        for key in ('top_5_clients', 'bottom_5_clients'):
+            self.assertEqual(reconstruir(cols['tables'][key]), rows['tables'][key])
+        self.assertEqual(rows['tables']['top_5_clients'][0], {'raw_client_name': 'Cliente 0', 'total_tpv': 100.5})
+
+    def test_portfolio_chart_is_columnar(self):
+        manager = User.objects.create_user(
+            username='gestor_col', email='gestor_col@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.client.force_login(manager)
+        chart = json.loads(self.client.get(reverse('minha_carteira')).context['line_chart_json'])
+        self.assertEqual([field['name'] for field in chart['schema']], ['date', 'revenue'])
+        self.assertEqual(chart['length'], len(chart['columns']['date']))
+
+
+class AsyncDashboardApiTests(TransactionTestCase):
+    # As secções correm noutras threads/ligações: os dados têm de estar gravados (commit)
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor_async', email='gestor_async@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor_async', email='consultor_async@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        reconstruir_hierarquia()
+        for i, consultant in enumerate([self.consultant, None]):
+            Sale.objects.create(
+                source='ELIQ', raw_id=f'AS{i}', date=timezone.now(), consultant=consultant,
+                raw_client_cnpj=f'{i:014d}', raw_client_name=f'Cliente {i}',
+                revenue_net=Decimal('5'), revenue_gross=Decimal('50')
+            )
+        self.client.force_login(self.manager)
+
+    def test_async_variant_returns_same_payload(self):
+        for params in ({}, {'format': 'columnar'}):
+            sync = self.client.get(reverse('api_dashboard_geral_data'), params).json()
+            response = self.client.get(reverse('api_dashboard_geral_data_async'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), sync)
+        # Apenas a venda da equipa do gestor
+        self.assertEqual(sync['kpis']['kpi_total_sales'], 1)
+
+    def test_async_variant_answers_304(self):
+        url = reverse('api_dashboard_geral_data_async')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_async_variant_product_filter_with_cold_cache(self):
+        # Resolver os produtos carrega a cache das fontes (query): não pode ser no event loop
+        for products in (['ELIQ'], ['Inexistente']):
+            limpar_caches()
+            params = {'products[]': products}
+            response = self.client.get(reverse('api_dashboard_geral_data_async'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), self.client.get(reverse('api_dashboard_geral_data'), params).json())
+
+    @override_settings(DASHBOARD_CUBE=True, DASHBOARD_SNAPSHOT_CACHE=None)
+    def test_async_variant_with_cube_and_cold_cache(self):
+        # As secções do cubo leem os nomes das fontes da cache (query): não podem correr no event loop
+        limpar_cubo()
+        self.addCleanup(limpar_cubo)
+        limpar_caches()
+        response = self.client.get(reverse('api_dashboard_geral_data_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.client.get(reverse('api_dashboard_geral_data')).json())
+        self.assertIsNotNone(obter_cubo(timezone.localdate()))
+
+
+@override_settings(DASHBOARD_SNAPSHOT_CACHE='default', BACKGROUND_JOBS_INLINE=True)
+class DashboardWarmupTests(TransactionTestCase):
+    # O aquecimento usa threads (ligações próprias): os dados têm de estar gravados
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username='admin_warm', email='admin_warm@teste.com', password='x', role=User.Role.ADMIN
+        )
+        self.manager = User.objects.create_user(
+            username='gestor_warm', email='gestor_warm@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor_warm', email='consultor_warm@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        Sale.objects.create(
+            source='ELIQ', raw_id='WARM1', date=timezone.now(), consultant=self.consultant,
+            raw_client_cnpj='1', raw_client_name='Cliente', revenue_net=Decimal('5'), revenue_gross=Decimal('50')
+        )
+
+    def test_warmed_views_need_no_aggregates(self):
+        call_command('warm_dashboard_cache', '--workers', '2', stdout=io.StringIO())
+
+        self.client.force_login(self.admin)
+        flush_auditoria()  # o registo do login pertence ao login, não a este pedido
+        # sessão, utilizador e contadores de geração; nenhum agregado de vendas
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api_dashboard_geral_data'), {'format': 'columnar'})
+        self.assertEqual(response.json()['kpis']['kpi_total_sales'], 1)
+
+        self.client.force_login(self.consultant)
+        flush_auditoria()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('minha_carteira'))
+        self.assertEqual(response.context['kpi_total_sales'], 1)
+
+    def test_warmed_portfolio_serves_any_session(self):
+        call_command('warm_dashboard_cache', stdout=io.StringIO())
+        # Dois browsers com login pelo formulário (cada um com o seu token CSRF)
+        for browser in (Client(), Client()):
+            browser.post(reverse('login'), {'username': 'gestor_warm@teste.com', 'password': 'x'})
+            flush_auditoria()
+            with self.assertNumQueries(3):
+                response = browser.get(reverse('minha_carteira'))
+            self.assertContains(response, 'csrfmiddlewaretoken')
+            self.assertEqual(response.context['performance_equipa'][0]['id'], self.consultant.id)
+
+    def test_import_enqueues_warmup_and_new_data_changes_key(self):
+        self.client.force_login(self.admin)
+        url = reverse('api_dashboard_geral_data')
+        self.assertEqual(self.client.get(url).json()['kpis']['kpi_total_sales'], 1)
+
+        Sale.objects.create(
+            source='ELIQ', raw_id='WARM2', date=timezone.now(), consultant=self.consultant,
+            raw_client_cnpj='1', raw_client_name='Cliente', revenue_net=Decimal('5'), revenue_gross=Decimal('50')
+        )
+        registar_importacao('ELIQ')
+        self.assertEqual(agendar_aquecimento().status, BackgroundJob.Status.DONE)
+        self.assertEqual(self.client.get(url).json()['kpis']['kpi_total_sales'], 2)
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username='gestor_exp', email='gestor_exp@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor_exp', email='consultor_exp@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        self.cliente = ClientRecord.objects.create(
+            cnpj='77777777000177', client_name='Cliente <Exp>', consultant=self.consultant, manager=self.manager
+        )
+        Sale.objects.bulk_create([
+            Sale(
+                source='Rovema Pay', raw_id=f'EXP{i}', date=timezone.now(), client=self.cliente,
+                consultant=self.consultant if i % 4 else None, raw_client_cnpj=self.cliente.cnpj,
+                raw_client_name='Cliente <Exp>', revenue_net=Decimal('1.50'), revenue_gross=Decimal('10')
+            )
+            for i in range(1200)
+        ])
+
+    def _conteudo(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_sales_csv_is_scoped(self):
+        self.client.force_login(self.consultant)
+        response = self.client.get(reverse('exportar_vendas'))
+        self.assertIn('attachment', response['Content-Disposition'])
+        linhas = self._conteudo(response).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(linhas), 1 + 900)  # cabeçalho + vendas do consultor (não as órfãs)
+        self.assertTrue(linhas[1].endswith(';10,00;1,50;'))
+
+    def test_xlsx_is_a_valid_workbook(self):
+        import xml.etree.ElementTree as ET
+        import zipfile
+
+        self.client.force_login(self.manager)
+        content = self._conteudo(self.client.get(reverse('exportar_vendas'), {'format': 'xlsx'}))
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            self.assertIsNone(zf.testzip())
+            sheet = ET.fromstring(zf.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        self.assertEqual(len(sheet.findall('.//s:row', ns)), 1 + 900)
+
+    def test_client_and_orphan_exports(self):
+        self.client.force_login(self.manager)
+        clientes = self._conteudo(self.client.get(reverse('exportar_desempenho_clientes'))).decode('utf-8-sig')
+        self.assertIn('77.777.777/0001-77;Cliente <Exp>;consultor_exp@teste.com;1800,00;', clientes)
+
+        orfaos = self._conteudo(self.client.get(reverse('exportar_orfaos'))).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(orfaos), 2)
+        self.assertTrue(orfaos[1].startswith('77.777.777/0001-77;Cliente <Exp>;450,00;'))
+
+        self.client.force_login(self.consultant)
+        self.assertEqual(self.client.get(reverse('exportar_orfaos')).status_code, 403)
+
+
+@override_settings(DASHBOARD_REPLICA_DB='replica')
+class ReplicaRoutingTests(TransactionTestCase):
+    # Dois aliases locais: 'replica' é um espelho de teste ('TEST': {'MIRROR': 'default'})
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        if 'replica' not in settings.DATABASES or 'dashboard.db_router.ReplicaRouter' not in settings.DATABASE_ROUTERS:
+            self.skipTest("Requer o alias 'replica' e o ReplicaRouter nas settings de teste.")
+        self.manager = User.objects.create_user(
+            username='gestor_rep', email='gestor_rep@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor_rep', email='consultor_rep@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+        Sale.objects.create(
+            source='ELIQ', raw_id='REP1', date=timezone.now(), consultant=self.consultant,
+            raw_client_cnpj='1', raw_client_name='Cliente', revenue_net=Decimal('5'), revenue_gross=Decimal('50')
+        )
+        self.client.force_login(self.manager)
+
+    def _queries(self, alias, func):
+        with CaptureQueriesContext(connections[alias]) as ctx:
+            response = func()
+        return response, len(ctx.captured_queries)
+
+    def test_read_views_use_replica(self):
+        response, on_replica = self._queries('replica', lambda: self.client.get(reverse('api_dashboard_geral_data')))
+        self.assertEqual(response.json()['kpis']['kpi_total_sales'], 1)
+        self.assertGreater(on_replica, 0)
+
+        # O conteúdo em streaming é lido depois de a view devolver a resposta
+        content, on_replica = self._queries(
+            'replica', lambda: b''.join(self.client.get(reverse('exportar_vendas')).streaming_content)
+        )
+        self.assertEqual(len(content.splitlines()), 2)
+        self.assertGreater(on_replica, 0)
+
+        # Views fora da lista ficam no primário
+        _, on_replica = self._queries('replica', lambda: self.client.get(reverse('atribuir_clientes')))
+        self.assertEqual(on_replica, 0)
+
+    def test_writes_and_read_your_writes_stay_on_primary(self):
+        self.assertEqual(router.db_for_write(Sale), 'default')
+        response = self.client.post(reverse('gestao_metas'), {})
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        # O pedido seguinte do mesmo browser ainda lê do primário
+        _, on_replica = self._queries('replica', lambda: self.client.get(reverse('minha_carteira')))
+        self.assertEqual(on_replica, 0)
+
+
+class ServingProfileTests(TestCase):
+    def test_database_pooling_modes(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from config.serving import database_pooling, workers_threads
+
+        self.assertEqual(database_pooling({}), {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True})
+        self.assertEqual(database_pooling({'DB_POOL_MODE': 'off'})['CONN_MAX_AGE'], 0)
+        with self.assertRaises(ImproperlyConfigured):
+            database_pooling({'DB_POOL_MODE': 'pgbouncer'})
+
+        workers, threads = workers_threads({'GUNICORN_WORKER_CLASS': 'sync', 'WEB_CONCURRENCY': '3'})
+        self.assertEqual((workers, threads), (3, 1))
+        self.assertEqual(workers_threads({})[1], 4)
+
+    def test_asgi_pool_fits_the_async_sections(self):
+        from config.serving import SECOES_ASYNC, ligacoes_por_worker
+        from .services import _secoes
+
+        self.assertEqual(SECOES_ASYNC, len(_secoes(None, None, 'rows')))
+        self.assertEqual(ligacoes_por_worker({}), 4 + 2)
+        # Sob ASGI há uma só thread, mas cada pedido à API async usa uma ligação por secção
+        asgi = {'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker'}
+        self.assertEqual(ligacoes_por_worker(asgi), 4 * SECOES_ASYNC + 2)
+        self.assertEqual(ligacoes_por_worker({**asgi, 'DB_ASGI_REQUESTS': '1'}), SECOES_ASYNC + 2)
+
+
+class AuditBufferTests(TransactionTestCase):
+    # Sem a transação do TestCase: as entradas entram no buffer no momento
+    def setUp(self):
+        flush_auditoria()
+        self.user = User.objects.create_user(username='audit', email='audit@teste.com', password='x')
+
+    def test_entries_are_batched_until_flush(self):
+        before = timezone.now()
+        for i in range(3):
+            registar_auditoria(self.user, 'teste', {'i': i})
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(flush_auditoria(), 3)
+        self.assertEqual(sum('INSERT' in q['sql'] for q in queries.captured_queries), 1)
+        logs = list(AuditLog.objects.order_by('id'))
+        self.assertEqual([log.details['i'] for log in logs], [0, 1, 2])
+        # Timestamp do registo, não da gravação
+        self.assertTrue(before <= logs[0].timestamp <= logs[2].timestamp < timezone.now())
+
+    @override_settings(AUDIT_LOG_BUFFER_SIZE=2)
+    def test_size_threshold_flushes(self):
+        registar_auditoria(self.user, 'teste')
+        self.assertEqual(AuditLog.objects.count(), 0)
+        registar_auditoria(self.user, 'teste')
+        self.assertEqual(AuditLog.objects.count(), 2)
+
+    def test_login_is_written_at_request_end(self):
+        response = self.client.post(reverse('login'), {'username': 'audit@teste.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(AuditLog.objects.filter(user=self.user, action='login_success').exists())
+
+    def test_request_end_flush_does_not_hold_a_connection(self):
+        registar_auditoria(self.user, 'teste')
+        connections['default'].close()  # Como o close_old_connections, que corre antes do flush
+        request_finished.send(sender=self.__class__)
+        self.assertIsNone(connections['default'].connection)
+        self.assertEqual(AuditLog.objects.filter(action='teste').count(), 1)
+
+    def test_rolled_back_entries_are_discarded(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                registar_auditoria(self.user, 'teste')
+                raise RuntimeError
+        self.assertEqual(flush_auditoria(), 0)
+
+    @override_settings(AUDIT_LOG_SYNC=True)
+    def test_sync_mode_writes_immediately(self):
+        registar_auditoria(self.user, 'teste', {'a': 1})
+        self.assertEqual(AuditLog.objects.get().details, {'a': 1})
+
+
+class AuditViewerTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin_audit', email='admin_audit@teste.com', password='x', role=User.Role.ADMIN
+        )
+        now = timezone.now()
+        # Dois registos com o mesmo timestamp: o id desempata a ordem
+        self.logs = [
+            AuditLog.objects.create(user=self.admin, action='fim_carga_csv', timestamp=now - timedelta(minutes=m),
+                                    details={'file_type': 'bionio', 'status': status})
+            for m, status in [(0, 'Sucesso'), (1, 'Falha'), (1, 'Sucesso'), (2, 'Sucesso'), (400 * 24 * 60, 'Sucesso')]
+        ]
+
+    def test_keyset_pages_cover_every_entry_once(self):
+        vistos, cursor = [], None
+        while True:
+            entries, cursor = pagina_auditoria(AuditLog.objects.all(), cursor, page_size=2)
+            vistos.extend(entry.pk for entry in entries)
+            if cursor is None:
+                break
+        esperado = [log.pk for log in sorted(self.logs, key=lambda log: (log.timestamp, log.pk), reverse=True)]
+        self.assertEqual(vistos, esperado)
+
+    def test_view_filters_by_details(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('auditoria'), {'status': 'Falha', 'file_type': 'bionio'})
+        self.assertEqual([log.pk for log in response.context['logs']], [self.logs[1].pk])
+
+        consultant = User.objects.create_user(username='c_audit', email='c_audit@teste.com', password='x')
+        self.client.force_login(consultant)
+        self.assertEqual(self.client.get(reverse('auditoria')).status_code, 403)
+
+    def test_archive_moves_old_entries_to_monthly_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            total = arquivar_auditoria(timezone.now() - timedelta(days=365), directory)
+            self.assertEqual(total, 1)
+            self.assertFalse(AuditLog.objects.filter(pk=self.logs[4].pk).exists())
+            self.assertEqual(AuditLog.objects.count(), 4)
+
+            (nome,) = os.listdir(directory)
+            with gzip.open(os.path.join(directory, nome), 'rt', encoding='utf-8') as f:
+                linha = json.loads(f.readline())
+            self.assertEqual((linha['id'], linha['user']), (self.logs[4].pk, 'admin_audit@teste.com'))
+
+
+@override_settings(
+    DASHBOARD_METRICS=True,
+    MIDDLEWARE=[settings.MIDDLEWARE[0], 'dashboard.metrics.MetricasMiddleware', *settings.MIDDLEWARE[1:]],
+)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin_metrics', email='admin_metrics@teste.com', password='x', role=User.Role.ADMIN
+        )
+
+    def _pedidos(self, view):
+        return registo.histogramas.get(('dashboard_request_db_queries', view), [0])[:-1]
+
+    def test_records_queries_and_exposes_prometheus_text(self):
+        self.client.force_login(self.admin)
+        antes = sum(self._pedidos('dashboard_geral'))
+        self.client.get(reverse('dashboard_geral'))
+        self.assertEqual(sum(self._pedidos('dashboard_geral')), antes + 1)
+        # Houve queries (sessão, utilizador...): a soma do histograma cresceu
+        self.assertGreater(registo.histogramas[('dashboard_request_db_queries', 'dashboard_geral')][-1], 0)
+
+        response = self.client.get(reverse('metricas'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE dashboard_request_duration_seconds histogram', text)
+        self.assertIn('dashboard_request_duration_seconds_bucket{view="dashboard_geral",le="+Inf"}', text)
+        self.assertIn('dashboard_requests_total{view="dashboard_geral",method="GET",status="200"}', text)
+
+    def test_endpoint_is_restricted(self):
+        consultant = User.objects.create_user(username='c_metrics', email='c_metrics@teste.com', password='x')
+        self.client.force_login(consultant)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 302)
+        with override_settings(DASHBOARD_METRICS_TOKEN='segredo'):
+            response = self.client.get(reverse('metricas'), headers={'Authorization': 'Bearer segredo'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(DASHBOARD_SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_sql(self):
+        self.client.force_login(self.admin)
+        with self.assertLogs('dashboard.metrics', 'WARNING') as logs:
+            self.client.get(reverse('dashboard_geral'))
+        self.assertTrue(any('SELECT' in line and 'dashboard_geral' in line for line in logs.output))
+
+    def test_disabled_middleware_removes_itself(self):
+        with override_settings(DASHBOARD_METRICS=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                MetricasMiddleware(lambda request: None)
+
+    def test_buckets_are_cumulative(self):
+        dados = RegistoMetricas()
+        for value in (0.001, 0.3, 20):
+            dados.observar('dashboard_request_duration_seconds', 'v', value)
+        text = texto_prometheus(dados)
+        self.assertIn('dashboard_request_duration_seconds_bucket{view="v",le="0.005"} 1', text)
+        self.assertIn('dashboard_request_duration_seconds_bucket{view="v",le="0.5"} 2', text)
+        self.assertIn('dashboard_request_duration_seconds_bucket{view="v",le="+Inf"} 3', text)
+        self.assertIn('dashboard_request_duration_seconds_count{view="v"} 3', text)
+
+    def test_worker_files_are_summed(self):
+        outro = RegistoMetricas()
+        outro.contar_pedido('v_outro', 'GET', 200)
+        with tempfile.TemporaryDirectory() as directory, override_settings(DASHBOARD_METRICS_DIR=directory):
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+                json.dump(outro.exportar(), f)
+            self.assertEqual(registo_agregado().pedidos[('v_outro', 'GET', '200')], 1)
+
+            # Worker reciclado: passa para o arquivo e continua a contar
+            arquivar_processo(1)
+            self.assertEqual(os.listdir(directory), ['metrics-arquivo.json'])
+            self.assertEqual(registo_agregado().pedidos[('v_outro', 'GET', '200')], 1)
+
+
+class ImportTelemetryTests(TestCase):
+    def test_rovema_import_records_phase_telemetry(self):
+        consultant = User.objects.create_user(username='c_tel', email='c_tel@teste.com', password='x')
+        ClientRecord.objects.create(cnpj='00000000000191', client_name='Cliente', consultant=consultant)
+        linhas = [
+            'ID Venda;ID Parcela;Venda;CNPJ;EC;Tipo;Bandeira;Status;Bruto;Spread',
+            '1;1;05/03/2026 10:00:00;191;Cliente;Crédito;Visa;Pago;100,00;2,50',
+            '2;1;06/03/2026 11:00:00;999;Outro;Débito;Master;Pago;50,00;1,00',
+            '3;1;06/03/2026 11:00:00;191;Cliente;Débito;Master;Cancelado;50,00;1,00',
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='latin-1', delete=False) as f:
+            f.write("\n".join(linhas))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_rovema', f.name, stdout=io.StringIO())
+        flush_auditoria()
+
+        log = AuditLog.objects.get(action='fim_carga_csv')
+        telemetria = log.details['telemetry']
+        self.assertEqual([fase['name'] for fase in telemetria['phases']], list(FASES))
+        self.assertEqual((log.details['rows_saved'], log.details['orphans_found']), (2, 1))
+        self.assertGreater(telemetria['peak_rss_mb'], 0)
+
+        self.assertIn('dashboard_import_phase_seconds{source="rovema",phase="leitura"}', texto_importacoes())
+
+        admin = User.objects.create_user(username='a_tel', email='a_tel@teste.com', password='x', role=User.Role.ADMIN)
+        self.client.force_login(admin)
+        self.assertContains(self.client.get(reverse('carga_dados')), 'linhas/s')
+
+
+class SyntheticDataBenchmarkTests(TestCase):
+    def test_generator_and_view_benchmark(self):
+        call_command(
+            'generate_synthetic_data', '--sales', '500', '--clients', '40',
+            '--consultants', '6', '--managers', '2', '--months', '3', stdout=io.StringIO(),
+        )
+        self.assertEqual(Sale.objects.filter(raw_id__startswith=SYNTHETIC_RAW_ID_PREFIX).count(), 500)
+        self.assertEqual(ClientRecord.objects.exclude(consultant=None).count(), 40)
+        self.assertTrue(Sale.objects.filter(consultant=None).exists())  # CNPJs órfãos
+        self.assertTrue(ConsultantMonthFact.objects.exists())
+
+        out = io.StringIO()
+        call_command('benchmark_views', '--no-generate', '--runs', '1', stdout=out, stderr=io.StringIO())
+        relatorio = json.loads(out.getvalue())
+        views = relatorio['results'][0]['views']
+        self.assertEqual(set(views), {
+            'api_dashboard_geral_data', 'api_dashboard_geral_data_12m', 'minha_carteira_consultant',
+            'minha_carteira_manager', 'client_detail', 'atribuir_clientes',
+        })
+        self.assertTrue(all('median_ms' in dados for dados in views.values()), views)
+
+        self.assertEqual(apagar_dados_sinteticos(), 500)
+        self.assertFalse(User.objects.filter(email__endswith=SYNTHETIC_DOMAIN).exists())
+
+
+@override_settings(AUDIT_LOG_SYNC=True)
+class ImportBenchmarkTests(TestCase):
+    def test_fixture_formats(self):
+        self.assertEqual(brl(1234.5, simbolo=True), 'R$ 1.234,50')
+        self.assertEqual(cnpj_exportado('00123456000191', 0), '123456000191')
+        self.assertEqual(cnpj_exportado('12345678000191', 2), '1,23457E+13')
+
+    def test_harness_reports_all_importers(self):
+        consultant = User.objects.create_user(username='c_bench', email='c_bench@teste.com', password='x')
+        ClientRecord.objects.create(cnpj='12345678000191', client_name='Cliente', consultant=consultant)
+
+        out = io.StringIO()
+        call_command('benchmark_imports', '--rows', '200', '--in-process', '--latency-ms', '0', stdout=out, stderr=io.StringIO())
+        resultados = {r['source']: r for r in json.loads(out.getvalue())['results']}
+
+        self.assertEqual(set(resultados), {'bionio', 'rovema', 'eliq'})
+        for resultado in resultados.values():
+            self.assertNotIn('error', resultado)
+            self.assertGreater(resultado['rows_per_second'], 0)
+            self.assertEqual([fase['name'] for fase in resultado['phases']], list(FASES))
+            # Metade dos CNPJs é do cliente registado (os em notação científica perdem-se)
+            self.assertLess(resultado['orphans_found'], resultado['rows_saved'])
+        # As vendas do benchmark não ficam na base de dados
+        self.assertFalse(Sale.objects.exists())
+
+
+# ---
+# Orçamento de queries por view e perfil
+# ---
+# Cada URL de dashboard/urls.py tem, para cada perfil, um máximo de queries
+# e de linhas lidas da base de dados, medidos com um conjunto de dados
+# sintético médio. Um N+1 (p.ex. um queryset percorrido no template) faz
+# o teste falhar com as queries que mais se repetem. Ao acrescentar uma URL
+# é preciso acrescentar o orçamento; se uma alteração reduzir o custo,
+# baixe-o.
+# As linhas lidas com cursores do lado do servidor (exportações em
+# streaming) não entram na contagem, só as queries.
+NEGADO = (2, 2)  # sessão + utilizador, e o 403/405 sai antes de qualquer outra query
+# (queries, linhas) por perfil
+ORCAMENTO_QUERIES = {
+    'dashboard_geral': {'admin': (6, 40), 'manager': (6, 40), 'consultant': (5, 20)},
+    'minha_carteira': {'admin': (5, 30), 'manager': (15, 600), 'consultant': (13, 200)},
+    'client_detail': {'admin': (11, 80), 'manager': (16, 100), 'consultant': (11, 80)},
+    'atribuir_clientes': {'admin': (6, 60), 'manager': (6, 60), 'consultant': NEGADO},
+    'api_atribuir_clientes_lote': {'admin': NEGADO, 'manager': NEGADO, 'consultant': NEGADO},
+    'api_estado_tarefa': {'admin': (3, 3), 'manager': (3, 3), 'consultant': (3, 3)},
+    'api_dashboard_geral_data': {'admin': (10, 60), 'manager': (10, 60), 'consultant': (10, 60)},
+    'exportar_vendas': {'admin': (4, 10), 'manager': (4, 10), 'consultant': (4, 10)},
+    'exportar_desempenho_clientes': {'admin': (4, 10), 'manager': (4, 10), 'consultant': (4, 10)},
+    'exportar_orfaos': {'admin': (4, 10), 'manager': (4, 10), 'consultant': NEGADO},
+    'user_list': {'admin': (4, 40), 'manager': NEGADO, 'consultant': NEGADO},
+    'user_create': {'admin': (4, 5), 'manager': NEGADO, 'consultant': NEGADO},
+    'user_update': {'admin': (5, 10), 'manager': NEGADO, 'consultant': NEGADO},
+    'user_delete': {'admin': (4, 10), 'manager': NEGADO, 'consultant': NEGADO},
+    'gestao_metas': {'admin': (7, 60), 'manager': (7, 60), 'consultant': NEGADO},
+    'eliminar_meta': {'admin': (13, 10), 'manager': (18, 40), 'consultant': NEGADO},
+    'commission_list': {'admin': (4, 20), 'manager': NEGADO, 'consultant': NEGADO},
+    'commission_create': {'admin': (3, 5), 'manager': NEGADO, 'consultant': NEGADO},
+    'commission_update': {'admin': (4, 5), 'manager': NEGADO, 'consultant': NEGADO},
+    'commission_delete': {'admin': (4, 5), 'manager': NEGADO, 'consultant': NEGADO},
+    'relatorio_comissoes': {'admin': (6, 50), 'manager': (6, 50), 'consultant': NEGADO},
+    'carga_dados': {'admin': (5, 20), 'manager': (5, 20), 'consultant': NEGADO},
+    'auditoria': {'admin': (5, 60), 'manager': NEGADO, 'consultant': NEGADO},
+    'metricas': {'admin': (6, 10), 'manager': NEGADO, 'consultant': NEGADO},
+    'perfis': {'admin': (4, 40), 'manager': NEGADO, 'consultant': NEGADO},
+    'perfil_detalhe': {'admin': (3, 3), 'manager': NEGADO, 'consultant': NEGADO},
+    'perfil_download': {'admin': (3, 3), 'manager': NEGADO, 'consultant': NEGADO},
+    'api_analise_tendencia': {'admin': (2, 2), 'manager': (2, 2), 'consultant': (2, 2)},
+    'api_analise_decomposicao': {'admin': (2, 2), 'manager': (2, 2), 'consultant': (2, 2)},
+}
+# URLs medidas noutro sítio (e porquê)
+SEM_ORCAMENTO = {
+    'api_dashboard_geral_data_async': 'as secções correm noutras ligações (ver AsyncDashboardApiTests)',
+}
+
+
+class _ContadorQueries:
+    """execute_wrapper que conta queries e linhas devolvidas, por SQL (sem parâmetros)."""
+
+    def __init__(self):
+        self.queries = 0
+        self.linhas = 0
+        self.por_sql = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        resultado = execute(sql, params, many, context)
+        self.queries += 1
+        self.por_sql[sql] += 1
+        if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.linhas += max(context['cursor'].rowcount, 0)
+        return resultado
+
+    def repetidas(self, limite=3):
+        """As queries que mais se repetem (a assinatura de um N+1)."""
+        top = sorted(self.por_sql.items(), key=lambda item: -item[1])[:limite]
+        # Sem a lista de colunas, para se ver o FROM/WHERE
+        return "\n".join(
+            f"    {n}x {re.sub(r'^SELECT .*? FROM ', 'SELECT ... FROM ', sql)[:300]}" for sql, n in top if n > 1
+        )
+
+
+@override_settings(DASHBOARD_SNAPSHOT_CACHE=None)
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        gerar_dados_sinteticos(sales=3000, clients=300, consultants=12, managers=3, months=6, seed=7)
+        tipicos = utilizadores_tipicos()
+        cls.users = {
+            'admin': tipicos['admin'], 'manager': tipicos['manager'], 'consultant': tipicos['consultant'],
+        }
+        cls.alvo = tipicos['consultant']
+        cls.cliente = ClientRecord.objects.filter(consultant=cls.alvo).order_by('cnpj').first()
+        cls.regra = CommissionRule.objects.first()
+        cls.perfil = ProfileArtifact.objects.create(
+            mode='cprofile', method='GET', path='/', status_code=200, duration_ms=1, pstats=b'{}',
+            sql_timeline=[{'start_ms': 0, 'duration_ms': 1, 'alias': 'default', 'sql': 'SELECT 1'}],
+        )
+        cls.jobs = {
+            role: BackgroundJob.objects.create(kind='atribuicao_clientes', user=user)
+            for role, user in cls.users.items()
+        }
+
+    def _args(self, name, role):
+        if name == 'eliminar_meta':
+            # O GET elimina a meta: cada medição precisa da sua
+            meta = Goal.objects.create(user=self.alvo, year=2000 + Goal.objects.count(), month=1, target_value=1)
+            return [meta.id]
+        return {
+            'client_detail': [self.cliente.cnpj],
+            'api_estado_tarefa': [self.jobs[role].id],
+            'user_update': [self.alvo.id], 'user_delete': [self.alvo.id],
+            'perfil_detalhe': [self.perfil.id], 'perfil_download': [self.perfil.id, 'pstats'],
+            'commission_update': [self.regra.id], 'commission_delete': [self.regra.id],
+        }.get(name, [])
+
+    def _medir(self, name, role):
+        self.client.force_login(self.users[role])
+        url = reverse(name, args=self._args(name, role))
+        contador = _ContadorQueries()
+        with connections['default'].execute_wrapper(contador):
+            response = self.client.get(url)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        return response.status_code, contador
+
+    def test_every_url_has_a_budget(self):
+        from .urls import urlpatterns
+        nomes = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(nomes - set(SEM_ORCAMENTO), set(ORCAMENTO_QUERIES))
+
+    def test_views_stay_within_budget(self):
+        for name, orcamentos in ORCAMENTO_QUERIES.items():
+            for role, orcamento in orcamentos.items():
+                max_queries, max_linhas = orcamento
+                with self.subTest(url=name, role=role):
+                    status, contador = self._medir(name, role)
+                    excedido = []
+                    if contador.queries > max_queries:
+                        excedido.append(f"queries: {contador.queries} (orçamento {max_queries}, +{contador.queries - max_queries})")
+                    if contador.linhas > max_linhas:
+                        excedido.append(f"linhas: {contador.linhas} (orçamento {max_linhas}, +{contador.linhas - max_linhas})")
+                    if excedido:
+                        self.fail(
+                            f"{name} [{role}, HTTP {status}] acima do orçamento — " + "; ".join(excedido)
+                            + "\n  Queries mais repetidas:\n" + contador.repetidas()
+                        )
+
+
+def _com_profiler(middleware):
+    i = middleware.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1
+    return [*middleware[:i], 'dashboard.profiler.ProfilerMiddleware', *middleware[i:]]
+
+
+@override_settings(DASHBOARD_PROFILER=True, MIDDLEWARE=_com_profiler(settings.MIDDLEWARE))
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin_prof', email='admin_prof@teste.com', password='x', role=User.Role.ADMIN
+        )
+        self.manager = User.objects.create_user(
+            username='gestor_prof', email='gestor_prof@teste.com', password='x', role=User.Role.MANAGER
+        )
+        self.consultant = User.objects.create_user(
+            username='consultor_prof', email='consultor_prof@teste.com', password='x',
+            role=User.Role.CONSULTANT, manager=self.manager
+        )
+
+    def test_admin_cprofile_stores_pstats_and_sql_timeline(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard_geral'), {'_profile': 'cprofile'})
+        perfil = ProfileArtifact.objects.get(pk=response['X-Dashboard-Profile-Id'])
+        self.assertEqual((perfil.mode, perfil.user, perfil.view_name), ('cprofile', self.admin, 'dashboard_geral'))
+        self.assertGreater(perfil.query_count, 0)
+        self.assertIn('sql', perfil.sql_timeline[0])
+
+        download = self.client.get(reverse('perfil_download', args=[perfil.pk, 'pstats']))
+        with tempfile.NamedTemporaryFile(suffix='.pstats') as f:
+            f.write(download.content)
+            f.flush()
+            self.assertTrue(pstats.Stats(f.name).total_calls > 0)
+        self.assertContains(self.client.get(reverse('perfil_detalhe', args=[perfil.pk])), 'Linha temporal')
+
+    def test_sampler_collects_stacks(self):
+        def funcao_lenta():
+            fim = time.perf_counter() + 0.05
+            while time.perf_counter() < fim:
+                pass
+
+        with AmostradorPilhas(threading.get_ident(), interval=0.001) as amostrador:
+            funcao_lenta()
+        self.assertIn('funcao_lenta', amostrador.collapsed())
+
+    def test_ignored_for_other_users(self):
+        self.client.force_login(self.consultant)
+        response = self.client.get(reverse('minha_carteira'), {'_profile': 'cprofile'}, HTTP_X_DASHBOARD_PROFILE='sampling')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Dashboard-Profile-Id', response)
+        self.assertFalse(ProfileArtifact.objects.exists())
+
+    def test_signed_link_profiles_the_target_user_once(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('perfis'), {'path': '/minha-carteira/', 'mode': 'sampling', 'user': self.manager.id})
+        link = response.context['link']
+        self.assertIn('_profile=', link)
+
+        # Outro utilizador: nada
+        self.client.force_login(self.consultant)
+        self.client.get(link)
+        self.assertFalse(ProfileArtifact.objects.exists())
+
+        self.client.force_login(self.manager)
+        self.client.get(link)
+        perfil = ProfileArtifact.objects.get()
+        self.assertEqual((perfil.user, perfil.requested_by, perfil.mode), (self.manager, self.admin, 'sampling'))
+        # O link só serve uma vez
+        self.client.get(link)
+        self.assertEqual(ProfileArtifact.objects.count(), 1)
+
+
+class SaleCategoryTests(TestCase):
+    def test_names_are_stored_as_small_integer_ids(self):
+        sale = Sale.objects.create(
+            source='ELIQ', raw_id='CAT1', date=timezone.now(), product_name='Diesel', status='confirmada',
+        )
+        sale = Sale.objects.get(pk=sale.pk)
+        self.assertEqual(
+            (sale.source, sale.product_name, sale.status, sale.product_detail, sale.payment_type),
+            ('ELIQ', 'Diesel', 'confirmada', '', ''),
+        )
+        self.assertIsNone(sale.payment_type_ref_id)
+        self.assertEqual(SaleSource.objects.get(pk=sale.source_ref_id).name, 'ELIQ')
+        self.assertEqual(SaleSource._meta.pk.get_internal_type(), 'SmallAutoField')
+
+    def test_known_names_resolve_without_queries(self):
+        cache_de(SaleSource).id('ELIQ')
+        cache_de(SaleStatus).id('Pago')
+        with self.assertNumQueries(0):
+            sales = [Sale(source='ELIQ', raw_id=f'CAT{i}', status='Pago', date=timezone.now()) for i in range(100)]
+            self.assertEqual({s.source for s in sales}, {'ELIQ'})
+        Sale.objects.bulk_create(sales)
+        self.assertEqual(Sale.objects.filter(source_ref__name='ELIQ', status_ref__name='Pago').count(), 100)
+
+    def test_rolled_back_import_leaves_no_categories(self):
+        # O nome novo é inserido na transação da importação e revertido com ela
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Sale.objects.create(source='Fonte Nova', raw_id='CAT2', date=timezone.now(), status='Estado Novo')
+            self.assertEqual(len(cache_de(SaleSource).existentes(['Fonte Nova'])), 1)
+            raise RuntimeError
+        self.assertFalse(SaleSource.objects.filter(name='Fonte Nova').exists())
+        self.assertFalse(SaleStatus.objects.filter(name='Estado Novo').exists())
+        self.assertEqual(cache_de(SaleSource).existentes(['Fonte Nova']), [])
+
+        # Criado de novo, com um id que existe
+        sale = Sale.objects.create(source='Fonte Nova', raw_id='CAT3', date=timezone.now())
+        self.assertTrue(SaleSource.objects.filter(pk=sale.source_ref_id, name='Fonte Nova').exists())
+        self.assertEqual(Sale.objects.get(pk=sale.pk).source, 'Fonte Nova')
+
+
+class SaleCategoryCommitTests(TransactionTestCase):
+    def tearDown(self):
+        limpar_caches()
+
+    def test_new_names_reach_the_shared_cache_only_on_commit(self):
+        resultado = {}
+
+        def noutra_thread():
+            try:
+                resultado['ids'] = cache_de(SaleSource).existentes(['Fonte Commit'])
+            finally:
+                connections['default'].close()
+
+        with transaction.atomic():
+            novo = cache_de(SaleSource).id('Fonte Commit')
+            # Outra thread (outra ligação) ainda não vê a linha: não pode receber o id
+            thread = threading.Thread(target=noutra_thread)
+            thread.start()
+            thread.join()
+        self.assertEqual(resultado['ids'], [])
+        with self.assertNumQueries(0):
+            self.assertEqual(cache_de(SaleSource).id('Fonte Commit'), novo)
+
+
+class CnpjKeyTests(TestCase):
+    def test_clean_cnpj_returns_integer_keys(self):
+        for raw in ('12.345.678/0001-90', '12345678000190', 12345678000190, ' 12345678000190 '):
+            self.assertEqual(clean_cnpj(raw), 12345678000190)
+        self.assertEqual(clean_cnpj('1234567000189'), 1234567000189)  # zero à esquerda perdido pelo Excel
+        self.assertEqual(clean_cnpj('3,3333333000133E+13'), 33333333000133)
+        for invalido in (None, '', float('nan'), '000', '123456789012345', 'sem cnpj'):
+            self.assertIsNone(clean_cnpj(invalido))
+
+    def test_cnpj_is_formatted_only_for_display(self):
+        self.assertEqual(formatar_cnpj(1234567000189), '01.234.567/0001-89')
+        self.assertEqual(formatar_cnpj(None), '')
+        self.assertEqual(ClientRecord._meta.pk.get_internal_type(), 'BigIntegerField')
+        self.assertEqual(Sale._meta.get_field('raw_client_cnpj').get_internal_type(), 'BigIntegerField')
+
+        admin = User.objects.create_user(username='admin', email='admin@teste.com', password='x', role=User.Role.ADMIN)
+        cliente = ClientRecord.objects.create(cnpj=clean_cnpj('01.234.567/0001-89'), client_name='Cliente')
+        Sale.objects.create(
+            source='ELIQ', raw_id='CNPJ1', date=timezone.now(), client=cliente,
+            raw_client_cnpj=cliente.cnpj, revenue_net=Decimal('1'),
+        )
+        self.client.force_login(admin)
+        # O URL antigo, com os zeros à esquerda, continua a funcionar
+        response = self.client.get('/cliente/01234567000189/')
+        self.assertContains(response, 'CNPJ: 01.234.567/0001-89')
+        self.assertEqual(reverse('client_detail', args=[cliente.cnpj]), reverse('client_detail', args=[1234567000189]))
+
+
+@skipUnless(duckdb is not None and pq is not None, "Requer o duckdb e o pyarrow (opcionais).")
+class ParquetAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        gerar_dados_sinteticos(sales=800, clients=80, consultants=4, managers=1, months=14, seed=11)
+        tipicos = utilizadores_tipicos()
+        cls.admin, cls.consultor = tipicos['admin'], tipicos['consultant']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.pasta = directory.name
+        settings_pasta = override_settings(ANALYTICS_PARQUET_DIR=self.pasta)
+        settings_pasta.enable()
+        self.addCleanup(settings_pasta.disable)
+
+    def test_export_rewrites_only_changed_months(self):
+        primeiro = exportar_vendas_parquet()
+        self.assertEqual(sum(primeiro['exported'].values()), Sale.objects.count())
+        self.assertEqual(exportar_vendas_parquet()['exported'], {})
+
+        # Cada bloco atomic é uma subtransação: as linhas alteradas ganham um xmin novo
+        venda = Sale.objects.order_by('date').first()
+        mes = f"{timezone.localtime(venda.date):%Y-%m}"
+        with transaction.atomic():
+            Sale.objects.filter(pk=venda.pk).update(consultant=None)
+        self.assertEqual(list(exportar_vendas_parquet()['exported']), [mes])
+
+        with transaction.atomic():
+            inicio, fim = _intervalo_mes(mes)
+            Sale.objects.filter(date__gte=inicio, date__lt=fim).delete()
+        resultado = exportar_vendas_parquet()
+        self.assertEqual((resultado['exported'], resultado['removed']), ({}, [mes]))
+        self.assertNotIn(mes, ler_manifesto()['months'])
+        self.assertFalse(os.path.exists(_pasta_mes(self.pasta, mes)))
+
+    def test_trend_is_served_from_parquet_within_scope(self):
+        exportar_vendas_parquet()
+        self.client.force_login(self.consultor)
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse('api_analise_tendencia'), {'granularity': 'year'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries.captured_queries if 'dashboard_sale' in q['sql']])
+        total = sum(Decimal(str(linha['revenue_net'])) for linha in response.json()['data'])
+        self.assertEqual(total, Sale.objects.filter(consultant=self.consultor).aggregate(t=Sum('revenue_net'))['t'])
+
+    def test_breakdown_by_dimension(self):
+        exportar_vendas_parquet()
+        self.client.force_login(self.admin)
+        url = reverse('api_analise_decomposicao')
+        response = self.client.get(url, {'by': 'payment_type', 'format': 'columnar'})
+        colunas = response.json()['data']['columns']
+        # Vendas sem tipo de pagamento ficam em ''
+        esperado = {
+            nome or '': n for nome, n in Sale.objects.values('payment_type_ref__name').annotate(n=Count('id'))
+            .values_list('payment_type_ref__name', 'n')
+        }
+        self.assertEqual(dict(zip(colunas['payment_type'], colunas['sales'])), esperado)
+        self.assertEqual(self.client.get(url, {'by': 'raw_client_name'}).status_code, 400)
+
+        with override_settings(ANALYTICS_PARQUET_DIR=os.path.join(self.pasta, 'vazia')):
+            self.assertEqual(self.client.get(url).status_code, 503)
+
+
+@override_settings(DASHBOARD_CUBE=True, DASHBOARD_SNAPSHOT_CACHE=None)
+class SalesCubeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        gerar_dados_sinteticos(sales=1500, clients=100, consultants=6, managers=2, months=14, seed=5)
+        cls.users = utilizadores_tipicos()
+
+    def setUp(self):
+        limpar_cubo()
+        self.addCleanup(limpar_cubo)
+        self.today = timezone.localdate()
+
+    def _payload(self, user, start, products=(), consultants=(), com_cubo=True):
+        scope = DataScope(user)
+        filtros = {'products': list(products), 'consultants': list(consultants), 'today': self.today}
+        periodo, tendencia = vendas_dashboard(scope, start, self.today, **filtros)
+        fatia = fatia_do_cubo(scope, start, self.today, **filtros) if com_cubo else None
+        return fatia, json.loads(dumps(dados_dashboard_geral(periodo, tendencia, start, self.today, 'columnar', fatia)))
+
+    def test_cube_sections_match_sql(self):
+        consultor = self.users['consultant']
+        casos = [
+            (self.today.replace(day=1), (), ()),
+            (self.today - timedelta(days=200), ('ELIQ', 'Bionio'), ()),
+            (self.today - timedelta(days=90), (), (str(consultor.id),)),
+        ]
+        for role in ('admin', 'manager', 'consultant'):
+            for start, products, consultants in casos:
+                with self.subTest(role=role, start=start, products=products, consultants=consultants):
+                    fatia, cubo = self._payload(self.users[role], start, products, consultants)
+                    self.assertIsNotNone(fatia)
+                    _, sql = self._payload(self.users[role], start, products, consultants, com_cubo=False)
+                    self.assertEqual(cubo, sql)
+
+    def test_reload_on_new_generation_and_sql_fallback(self):
+        cubo = obter_cubo(self.today)
+        self.assertIs(obter_cubo(self.today), cubo)
+        registar_importacao('ELIQ')
+        self.assertIsNot(obter_cubo(self.today), cubo)
+
+        # Antes do início do cubo, ou acima do limite de memória: tudo em SQL
+        self.assertIsNone(self._payload(self.users['admin'], self.today - timedelta(days=CUBE_DAYS + 1))[0])
+        limpar_cubo()
+        with override_settings(DASHBOARD_CUBE_MAX_MB=0):
+            self.assertIsNone(obter_cubo(self.today))
+
+    def test_api_skips_the_cube_sections_queries(self):
+        self.client.force_login(self.users['admin'])
+        url = reverse('api_dashboard_geral_data')
+        self.client.get(url)  # Carrega o cubo
+        with CaptureQueriesContext(connections['default']) as com_cubo:
+            response = self.client.get(url, {'format': 'columnar'})
+        with override_settings(DASHBOARD_CUBE=False), CaptureQueriesContext(connections['default']) as sem_cubo:
+            esperado = self.client.get(url, {'format': 'columnar'})
+        self.assertEqual(response.json(), esperado.json())
+        self.assertEqual(len(sem_cubo) - len(com_cubo), len(SECOES_DO_CUBO))
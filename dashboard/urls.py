@@ -7,11 +7,20 @@ urlpatterns = [
     # URLs do Dashboard
     path('', views.dashboard_geral, name='dashboard_geral'),
     path('minha-carteira/', views.minha_carteira, name='minha_carteira'),
-    path('cliente/<str:cnpj>/', views.client_detail, name='client_detail'),
+    path('cliente/<int:cnpj>/', views.client_detail, name='client_detail'),
     path('atribuir-clientes/', views.atribuir_clientes, name='atribuir_clientes'),
+    path('api/atribuir-clientes/lote/', views.api_atribuir_clientes_lote, name='api_atribuir_clientes_lote'),
+    path('api/tarefas/<int:job_id>/', views.api_estado_tarefa, name='api_estado_tarefa'),
     
     # (NOVO) URL da API para o Dashboard Geral
     path('api/dashboard-geral/', views.api_dashboard_geral_data, name='api_dashboard_geral_data'),
+    # Variante async (secções em simultâneo; para servir sob ASGI/uvicorn)
+    path('api/dashboard-geral/async/', views.api_dashboard_geral_data_async, name='api_dashboard_geral_data_async'),
+    
+    # Exportações no servidor (?format=csv|xlsx, em streaming)
+    path('exportar/vendas/', views.exportar_vendas, name='exportar_vendas'),
+    path('exportar/clientes/', views.exportar_desempenho_clientes, name='exportar_desempenho_clientes'),
+    path('exportar/orfaos/', views.exportar_orfaos, name='exportar_orfaos'),
     
     # URLs de Gestão de Utilizadores
     path('gestao-utilizadores/', 
@@ -54,6 +63,21 @@ urlpatterns = [
          commission_views.CommissionRuleDeleteView.as_view(), 
          name='commission_delete'),
 
+    path('gestao-comissoes/relatorio/', 
+         views.relatorio_comissoes_view, 
+         name='relatorio_comissoes'),
+
     # URLs de Carga de Dados
     path('carga-dados/', views.carga_dados, name='carga_dados'),
+    # Auditoria (admin, paginação keyset)
+    path('auditoria/', views.auditoria, name='auditoria'),
+    # Métricas no formato do Prometheus (admin ou DASHBOARD_METRICS_TOKEN)
+    path('metricas/', views.metricas, name='metricas'),
+    # Profiler a pedido (admin): perfis gravados e links assinados
+    path('perfis/', views.perfis, name='perfis'),
+    path('perfis/<int:pk>/', views.perfil_detalhe, name='perfil_detalhe'),
+    path('perfis/<int:pk>/<str:kind>/', views.perfil_download, name='perfil_download'),
+    # Análise histórica (Parquet + DuckDB, sem tocar no PostgreSQL)
+    path('api/analise/tendencia/', views.api_analise_tendencia, name='api_analise_tendencia'),
+    path('api/analise/decomposicao/', views.api_analise_decomposicao, name='api_analise_decomposicao'),
 ]
\ No newline at end of file
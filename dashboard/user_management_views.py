@@ -32,6 +32,7 @@ class RoleRequiredMixin:
 class UserListView(LoginRequiredMixin, RoleRequiredMixin, ListView):
     """(Read) - Lista todos os utilizadores."""
     model = User
+    queryset = User.objects.select_related('manager') # O template mostra o gestor de cada utilizador
     template_name = 'dashboard/user_list.html'
     context_object_name = 'users'
     allowed_roles = [User.Role.ADMIN] # Apenas Admins podem ver
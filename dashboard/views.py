@@ -1,15 +1,35 @@
-from .services import calcular_kpis_gerais
+from .services import dados_dashboard_geral_async, secoes_do_cubo, vendas_dashboard
+from .cube import fatia_do_cubo
+from .snapshots import snapshot_dashboard_geral, snapshot_minha_carteira
+from .exports import (
+    FORMATO_CSV, exportacao_desempenho_clientes, exportacao_orfaos, exportacao_vendas, resposta_exportacao,
+)
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count, Q, Value, Max
+from django.db.models import Sum, Count, Q, Value, Max, Exists, OuterRef
 from django.db.models.functions import Coalesce, TruncMonth
 # (CORREÇÃO DEFINITIVA) Importa o StringAgg do módulo específico do PostgreSQL
 from django.contrib.postgres.aggregates import StringAgg 
 from django.db import transaction 
+from asgiref.sync import sync_to_async
 from .decorators import role_required
+from .db_router import leitura_replica
+from .metrics import registo_agregado, texto_importacoes, texto_prometheus
+from .profiler import MODOS, PARAMETRO, PROFILER_TOKEN_MAX_AGE, gerar_link_perfil
+from .audit import ACOES, ACOES_CARGA, FILTROS_DETALHES, filtrar_auditoria, pagina_auditoria, registar_auditoria
 # Importações dos models
-from .models import Sale, Client, User, Goal, CommissionRule, AuditLog
+from .models import Sale, SaleSource, Client, User, Goal, AuditLog, BackgroundJob, ConsultantMonthFact, ProfileArtifact
+from .assignment import atribuir_clientes_em_lote, ler_csv_atribuicoes, AssignmentError
+from .jobs import job_status_payload
+from .scope import DataScope, get_data_scope
+from .commissions import relatorio_comissoes
+from .facts import atualizar_factos
+from .goals import GoalError, gravar_metas_em_lote, grelha_anual, ler_csv_metas
+from .payloads import FastJsonResponse, colunar, dumps, formato_pedido, tabela
+from .analytics import (
+    CAMPOS_METRICAS, DIMENSOES, AnaliseIndisponivel, decomposicao_historica, periodo_historico, tendencia_historica,
+)
 # Imports de utilitários
 import json
 from decimal import Decimal, InvalidOperation
@@ -21,23 +41,26 @@ import sys
 import os
 import subprocess
 import uuid
+from urllib.parse import urlencode
 from django.conf import settings
 from django.contrib import messages
 from django.core.files.storage import default_storage
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse 
+from django.utils.crypto import constant_time_compare
+from django.http import Http404, HttpResponse, JsonResponse 
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from .etags import (
+    condicional_async, geracoes_do_pedido, periodo_normalizado, etag_client_detail, etag_dashboard_geral, etag_minha_carteira,
+    last_modified_dashboard_geral,
+)
 
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, Decimal):
-            return "{:.2f}".format(o)
-        return super(DecimalEncoder, self).default(o)
-
 # ---
 # View 1: Dashboard Geral
 # ---
 @login_required
+@leitura_replica
 def dashboard_geral(request):
     """
     (MODIFICADO) View do Dashboard Geral. 
@@ -49,8 +72,14 @@ def dashboard_geral(request):
     start_date = today.replace(day=1)
     end_date = today
 
-    all_consultants = User.objects.filter(role=User.Role.CONSULTANT).order_by('first_name')
-    all_products = Sale.objects.values_list('source', flat=True).distinct()
+    # Cada perfil só pode filtrar pelos consultores do seu âmbito
+    all_consultants = get_data_scope(request).filter_users(
+        User.objects.filter(role=User.Role.CONSULTANT)
+    ).order_by('first_name')
+    # Fontes com vendas (uma procura no índice por fonte, sem ler as vendas)
+    all_products = SaleSource.objects.filter(
+        Exists(Sale.objects.filter(source_ref=OuterRef('pk')))
+    ).order_by('name').values_list('name', flat=True)
 
     context = {
         'current_start_date': start_date.isoformat(),
@@ -66,282 +95,69 @@ def dashboard_geral(request):
 # View 1.A: API de Dados do Dashboard Geral
 # ---
 @login_required
+@leitura_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dashboard_geral, last_modified_func=last_modified_dashboard_geral)
 def api_dashboard_geral_data(request):
     """
     (NOVA VIEW)
     Fornece os dados para o Dashboard Geral via JSON.
     Esta view é chamada pelo JavaScript sempre que um filtro é alterado.
+    Com ?format=columnar, gráficos e tabelas vêm em formato colunar
+    (esquema + um array por coluna; ver dashboard/payloads.py).
+    As secções estão em dashboard/services.py (partilhadas com a variante async);
+    o JSON pode vir do cache de snapshots (ver dashboard/snapshots.py).
     """
-    
-    today = timezone.now().date()
-    start_date_str = request.GET.get('start_date', today.replace(day=1).isoformat())
-    end_date_str = request.GET.get('end_date', today.isoformat())
-    selected_products = request.GET.getlist('products[]') 
-    selected_consultants = request.GET.getlist('consultants[]') 
+    return HttpResponse(snapshot_dashboard_geral(request), content_type='application/json')
 
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except ValueError:
-        start_date = today.replace(day=1)
-        end_date = today
-    
-    queryset_periodo = Sale.objects.filter(
-        date__date__gte=start_date,
-        date__date__lte=end_date
-    )
-    if selected_products:
-        queryset_periodo = queryset_periodo.filter(source__in=selected_products)
-    if selected_consultants:
-        queryset_periodo = queryset_periodo.filter(consultant_id__in=selected_consultants)
 
-    kpis = queryset_periodo.aggregate(
-        total_revenue_net=Coalesce(Sum('revenue_net'), Decimal(0)),
-        total_revenue_gross=Coalesce(Sum('revenue_gross'), Decimal(0)),
-        total_sales=Coalesce(Count('id'), 0)
-    )
-    
-    kpi_tpv = kpis['total_revenue_gross']
-    kpi_net = kpis['total_revenue_net']
-    
-    if kpi_tpv > 0:
-        kpi_margin = (kpi_net / kpi_tpv) * 100
-    else:
-        kpi_margin = Decimal(0)
-
-    sales_by_source = (
-        queryset_periodo
-        .values('source')
-        .annotate(revenue=Sum('revenue_net'))
-        .order_by('-revenue')
-    )
-    pie_chart_data = [{"source": item['source'], "revenue": float(item['revenue'])} for item in sales_by_source]
-    
-    clients_performance = (
-        queryset_periodo
-        .values('raw_client_cnpj', 'raw_client_name') 
-        .annotate(total_tpv=Sum('revenue_gross'))
-        .order_by('-total_tpv')
-    )
-    
-    top_5_clients = [
-        {"raw_client_name": c['raw_client_name'], "total_tpv": float(c['total_tpv'])} 
-        for c in clients_performance[:5]
-    ]
-    bottom_5_clients = [
-        {"raw_client_name": c['raw_client_name'], "total_tpv": float(c['total_tpv'])} 
-        for c in clients_performance.filter(total_tpv__gt=0).order_by('total_tpv')[:5]
-    ]
-
-    twelve_months_ago = today - timedelta(days=365)
-    line_chart_qs = Sale.objects.filter(date__date__gte=twelve_months_ago)
-    
-    if selected_products:
-        line_chart_qs = line_chart_qs.filter(source__in=selected_products)
-    if selected_consultants:
-        line_chart_qs = line_chart_qs.filter(consultant_id__in=selected_consultants)
-    
-    trend_data = (
-        line_chart_qs
-        .annotate(month=TruncMonth('date'))
-        .values('month')
-        .annotate(tpv=Sum('revenue_gross'))
-        .order_by('month')
-    )
-    line_chart_data = [{"date": item['month'].isoformat(), "volume": float(item['tpv'])} for item in trend_data]
-
-    data = {
-        'kpis': {
-            'kpi_tpv': float(kpi_tpv),
-            'kpi_net': float(kpi_net),
-            'kpi_margin': float(kpi_margin),
-            'kpi_total_sales': kpis['total_sales'],
-        },
-        'charts': {
-            'pie_chart_data': pie_chart_data,
-            'line_chart_data': line_chart_data,
-        },
-        'tables': {
-            'top_5_clients': top_5_clients,
-            'bottom_5_clients': bottom_5_clients,
-        },
-        'filters_display': {
-            'start_date_display': start_date.strftime('%d/%m/%Y'),
-            'end_date_display': end_date.strftime('%d/%m/%Y'),
-        }
+@login_required
+@leitura_replica
+@cache_control(private=True, no_cache=True)
+@condicional_async(etag_func=etag_dashboard_geral, last_modified_func=last_modified_dashboard_geral)
+async def api_dashboard_geral_data_async(request):
+    """
+    Variante async da API do Dashboard Geral (para servir sob ASGI).
+    Mesmo payload, mas as secções independentes (KPIs, pizza, top/bottom
+    clientes, tendência) correm em simultâneo, cada uma com a sua ligação
+    à base de dados.
+    """
+    user = await request.auser()
+    start_date, end_date = periodo_normalizado(request)
+    scope = DataScope(user, session=request.session)
+    filtros = {
+        'products': request.GET.getlist('products[]'),
+        'consultants': request.GET.getlist('consultants[]'),
+        'today': timezone.now().date(),
     }
-    
-    return JsonResponse(data)
+    # O filtro de produtos passa os nomes a ids pela cache das fontes, que pode ir à base de dados
+    periodo, tendencia = await sync_to_async(vendas_dashboard)(scope, start_date, end_date, **filtros)
+    # KPIs, pizza e tendência do cubo em memória (se ativo); só o resto vai ao SQL
+    formato = formato_pedido(request)
+    cubo = await sync_to_async(lambda: secoes_do_cubo(
+        fatia_do_cubo(scope, start_date, end_date, generations=geracoes_do_pedido(request), **filtros), formato
+    ))()
+    data = await dados_dashboard_geral_async(periodo, tendencia, start_date, end_date, formato, cubo)
+    return FastJsonResponse(data)
 
 
 # ---
 # View 2: Minha Carteira
 # ---
 @login_required
+@leitura_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_minha_carteira)
 def minha_carteira(request):
-    
-    user = request.user
-    today = timezone.now().date()
-    
-    start_date_str = request.GET.get('start_date', today.replace(day=1).isoformat())
-    end_date_str = request.GET.get('end_date', today.isoformat())
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except ValueError:
-        start_date = today.replace(day=1)
-        end_date = today
-        
-    meta_year = start_date.year
-    meta_month = start_date.month
-
-    rule_map = {r.source: r.percentage for r in CommissionRule.objects.all()}
-
-    clientes_qs = Client.objects.none()
-    vendas_periodo_qs = Sale.objects.none()
-    vendas_mes_meta_qs = Sale.objects.none()
-    meta_qs = Goal.objects.none()
-    performance_equipa = []
-    
-    kpi_commission_mes = Decimal('0.0')
-    
-    twelve_months_ago = today - timedelta(days=365)
-    line_chart_qs_base = Sale.objects.filter(date__date__gte=twelve_months_ago)
-    
-    if user.role == User.Role.CONSULTANT:
-        clientes_qs = Client.objects.filter(consultant=user)
-        vendas_periodo_qs = Sale.objects.filter(
-            consultant=user, date__date__gte=start_date, date__date__lte=end_date
-        )
-        vendas_mes_meta_qs = Sale.objects.filter(
-            consultant=user, date__year=meta_year, date__month=meta_month
-        )
-        meta_qs = Goal.objects.filter(
-            user=user, year=meta_year, month=meta_month
-        )
-        line_chart_qs = line_chart_qs_base.filter(consultant=user)
-        
-        sales_by_source = vendas_mes_meta_qs.values('source').annotate(total_net=Sum('revenue_net'))
-        for sale_group in sales_by_source:
-            percentage = rule_map.get(sale_group['source'], Decimal('0.0'))
-            kpi_commission_mes += sale_group['total_net'] * (percentage / 100)
-
-    elif user.role == User.Role.MANAGER:
-        team_ids = User.objects.filter(manager=user).values_list('id', flat=True)
-        
-        clientes_qs = Client.objects.filter(consultant_id__in=team_ids)
-        vendas_periodo_qs = Sale.objects.filter(
-            consultant_id__in=team_ids, date__date__gte=start_date, date__date__lte=end_date
-        )
-        vendas_mes_meta_qs = Sale.objects.filter(
-            consultant_id__in=team_ids, date__year=meta_year, date__month=meta_month
-        )
-        meta_qs = Goal.objects.filter(
-            user_id__in=team_ids, year=meta_year, month=meta_month
-        )
-        
-        performance_equipa = (
-            User.objects.filter(id__in=team_ids)
-            .annotate(
-                revenue_month=Coalesce(Sum('sales__revenue_net', 
-                    filter=Q(sales__date__year=meta_year, sales__date__month=meta_month)
-                ), Decimal(0)),
-                goal_month=Coalesce(Sum('goals__target_value',
-                    filter=Q(goals__year=meta_year, goals__month=meta_month)
-                ), Decimal(0))
-            )
-            .order_by('-revenue_month')
-        )
-        
-        sales_by_source_team = (
-            vendas_mes_meta_qs
-            .values('consultant_id', 'source')
-            .annotate(total_net=Sum('revenue_net'))
-            .order_by('consultant_id')
-        )
-        
-        commission_map = {}
-        for sale_group in sales_by_source_team:
-            consultant_id = sale_group['consultant_id']
-            percentage = rule_map.get(sale_group['source'], Decimal('0.0'))
-            commission = sale_group['total_net'] * (percentage / 100)
-            
-            if consultant_id not in commission_map:
-                commission_map[consultant_id] = Decimal('0.0')
-            commission_map[consultant_id] += commission
-
-        for consultor in performance_equipa:
-            if consultor.goal_month > 0:
-                consultor.percent_atingido = (consultor.revenue_month / consultor.goal_month) * 100
-            else:
-                consultor.percent_atingido = Decimal(0)
-            
-            consultor.commission_total = commission_map.get(consultor.id, Decimal('0.0'))
-            kpi_commission_mes += consultor.commission_total 
-        
-        line_chart_qs = line_chart_qs_base.filter(consultant_id__in=team_ids)
-
-    kpi_revenue_periodo = vendas_periodo_qs.aggregate(
-        total=Coalesce(Sum('revenue_net'), Decimal(0))
-    )['total']
-    kpi_sales_periodo = vendas_periodo_qs.count()
-    kpi_clients_activated = vendas_periodo_qs.values('client_id').distinct().count()
-    kpi_total_clients = clientes_qs.count()
-    
-    kpi_revenue_mes = vendas_mes_meta_qs.aggregate(
-        total=Coalesce(Sum('revenue_net'), Decimal(0))
-    )['total']
-    kpi_meta_mes = meta_qs.aggregate(
-        total=Coalesce(Sum('target_value'), Decimal(0))
-    )['total']
-    if kpi_meta_mes > 0:
-        kpi_percentual_meta = (kpi_revenue_mes / kpi_meta_mes) * 100
-    else:
-        kpi_percentual_meta = Decimal(0)
-
-    clientes_com_performance = clientes_qs.annotate(
-        revenue_periodo=Coalesce(
-            Sum(
-                'sales__revenue_net',
-                filter=Q(sales__date__date__gte=start_date, sales__date__date__lte=end_date)
-            ),
-            Decimal(0)
-        )
-    ).order_by('-revenue_periodo')
-    
-    inactive_days = 60
-    inactive_threshold = today - timedelta(days=inactive_days)
-    
-    clientes_inativos = clientes_qs.annotate(
-        last_sale_date=Max('sales__date')
-    ).filter(
-        Q(last_sale_date__lt=inactive_threshold) | Q(last_sale_date__isnull=True)
-    ).order_by('last_sale_date')
-    
-    trend_data = (
-        line_chart_qs
-        .annotate(month=TruncMonth('date'))
-        .values('month')
-        .annotate(revenue=Sum('revenue_net'))
-        .order_by('month')
-    )
-    line_chart_data = [{"date": item['month'].isoformat(), "revenue": float(item['revenue'])} for item in trend_data]
+    """
+    Carteira do consultor / equipa do gestor. Os agregados vêm de
+    dashboard/services.py (dados_minha_carteira), guardados em cache por
+    ETag quando o cache de snapshots está ativo (ver dashboard/snapshots.py).
+    """
+    start_date, end_date = periodo_normalizado(request)
 
     context = {
-        'kpi_revenue_net': kpi_revenue_periodo,
-        'kpi_total_sales': kpi_sales_periodo,
-        'kpi_clients_activated': kpi_clients_activated,
-        'kpi_total_clients': kpi_total_clients,
-        'kpi_revenue_mes': kpi_revenue_mes,
-        'kpi_meta_mes': kpi_meta_mes,
-        'kpi_percentual_meta': kpi_percentual_meta,
-        'kpi_commission_mes': kpi_commission_mes, 
-        'clientes_performance': clientes_com_performance,
-        'performance_equipa': performance_equipa,
-        'line_chart_json': json.dumps(line_chart_data, cls=DecimalEncoder),
-        
-        'clientes_inativos': clientes_inativos,
-        'inactive_days': inactive_days,
+        **snapshot_minha_carteira(request),
         
         'meta_date_object': start_date, 
         
@@ -368,28 +184,26 @@ def atribuir_clientes(request):
 
         if cnpj and consultor_id:
             try:
-                consultor = User.objects.get(id=consultor_id, role=User.Role.CONSULTANT)
-                manager = consultor.manager
-                
-                client_obj, created = Client.objects.update_or_create(
-                    cnpj=cnpj,
-                    defaults={'client_name': client_name, 'consultant': consultor, 'manager': manager}
-                )
-                
-                Sale.objects.filter(raw_client_cnpj=cnpj, consultant__isnull=True).update(
-                    consultant=consultor, manager=manager, client=client_obj
+                # Uma atribuição individual é apenas um lote com uma linha
+                resultado = atribuir_clientes_em_lote(
+                    request.user,
+                    [{'cnpj': cnpj, 'consultor': consultor_id, 'client_name': client_name}]
                 )
-                
-                messages.success(request, f"Cliente {client_name} atribuído a {consultor.first_name}.")
-                
-            except User.DoesNotExist:
-                messages.error(request, "Erro: Consultor não encontrado.")
+                if resultado['errors']:
+                    messages.error(request, f"Erro: {' '.join(resultado['errors'])}")
+                elif resultado['job']:
+                    messages.success(request, f"A atribuição do cliente {client_name} foi iniciada em segundo plano.")
+                else:
+                    messages.success(request, f"Cliente {client_name} atribuído com sucesso.")
+
             except Exception as e:
                 messages.error(request, f"Erro ao salvar: {e}")
         
         return redirect('atribuir_clientes')
 
-    consultores_list = User.objects.filter(role=User.Role.CONSULTANT).order_by('first_name')
+    consultores_list = get_data_scope(request).filter_users(
+        User.objects.filter(role=User.Role.CONSULTANT)
+    ).order_by('first_name')
     vendas_orfas = Sale.objects.filter(consultant__isnull=True)
     
     # Esta query agora usa o StringAgg (importado corretamente)
@@ -399,7 +213,7 @@ def atribuir_clientes(request):
         .annotate(
             total_revenue=Sum('revenue_net'), 
             last_sale=Max('date'),
-            sources=StringAgg('source', ', ', distinct=True) 
+            sources=StringAgg('source_ref__name', ', ', distinct=True) 
         )
         .order_by('-last_sale')
     )
@@ -408,6 +222,50 @@ def atribuir_clientes(request):
     return render(request, 'dashboard/atribuir_clientes.html', context)
 
 
+# ---
+# View 3.A: API de Atribuição de Clientes em Lote
+# ---
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN, User.Role.MANAGER])
+@require_POST
+def api_atribuir_clientes_lote(request):
+    """
+    Atribui vários clientes de uma só vez.
+    Aceita um JSON {"atribuicoes": [{"cnpj": ..., "consultor": <id ou e-mail>, "client_name": ...}]}
+    ou um ficheiro CSV de mapeamento no campo 'csv_file'.
+    Lotes grandes são processados em segundo plano (devolve a tarefa para acompanhar).
+    """
+    if 'csv_file' in request.FILES:
+        try:
+            atribuicoes = ler_csv_atribuicoes(request.FILES['csv_file'])
+        except AssignmentError as e:
+            return JsonResponse({'errors': [str(e)]}, status=400)
+    else:
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'errors': ['JSON inválido.']}, status=400)
+        atribuicoes = payload.get('atribuicoes') if isinstance(payload, dict) else None
+
+    if not atribuicoes or not isinstance(atribuicoes, list):
+        return JsonResponse({'errors': ['Nenhuma atribuição recebida.']}, status=400)
+
+    try:
+        resultado = atribuir_clientes_em_lote(request.user, atribuicoes)
+    except Exception as e:
+        return JsonResponse({'errors': [f"Erro ao salvar: {e}"]}, status=500)
+
+    job = resultado['job']
+    data = {
+        'errors': resultado['errors'],
+        'result': resultado['result'],
+        'job': job_status_payload(job) if job else None,
+    }
+    if job:
+        return JsonResponse(data, status=202)
+    return JsonResponse(data, status=200 if resultado['result'] else 400)
+
+
 # ---
 # View 4: Gestão de Metas (Corrigido)
 # ---
@@ -416,53 +274,42 @@ def atribuir_clientes(request):
 def gestao_metas(request):
     
     today = timezone.now().date()
+    scope = get_data_scope(request)
     
     if request.method == 'POST':
-        year = int(request.POST.get('year'))
-        month = int(request.POST.get('month'))
+        year = request.POST.get('year', str(today.year))
+        month = request.POST.get('month', str(today.month))
+        vista = request.POST.get('vista', 'mes')
         
         try:
-            with transaction.atomic(): 
+            if 'csv_file' in request.FILES:
+                metas = ler_csv_metas(request.FILES['csv_file'])
+            else:
+                # 'meta_<id>' (vista mensal) ou 'meta_<id>_<mês>' (grelha anual)
+                metas = []
                 for key, value in request.POST.items():
                     if key.startswith('meta_'):
-                        user_id = key.split('_')[1]
-                        
-                        try:
-                            if not value:
-                                value_str = '0.0'
-                            else:
-                                # Remove . (milhar) e troca , (decimal) por .
-                                value_str = value.strip().replace('.', '').replace(',', '.')
-                            
-                            target_value = Decimal(value_str)
-                            
-                        except InvalidOperation:
-                            messages.error(request, f"Valor inválido '{value}' para o utilizador ID {user_id}. Meta não foi salva.")
-                            continue 
-                        
-                        if request.user.role == User.Role.ADMIN:
-                            consultor_check = User.objects.filter(id=user_id).exists()
-                        else:
-                            consultor_check = User.objects.filter(id=user_id, manager=request.user).exists()
-
-                        if consultor_check:
-                            if target_value > 0:
-                                Goal.objects.update_or_create(
-                                    user_id=user_id,
-                                    year=year,
-                                    month=month,
-                                    defaults={'target_value': target_value}
-                                )
-                            else:
-                                # Apaga a meta se o valor for 0 ou vazio
-                                Goal.objects.filter(user_id=user_id, year=year, month=month).delete()
+                        partes = key.split('_')
+                        metas.append({
+                            'consultor': partes[1],
+                            'ano': year,
+                            'mes': partes[2] if len(partes) > 2 else month,
+                            'meta': value,
+                        })
             
-            messages.success(request, 'Metas salvas com sucesso!')
+            # Um único upsert/delete em lote, filtrado pelo âmbito do utilizador
+            resultado = gravar_metas_em_lote(request.user, metas)
+            for erro in resultado['errors'][:10]:
+                messages.error(request, erro)
+            if resultado['saved'] or resultado['deleted']:
+                messages.success(request, f"Metas salvas com sucesso! ({resultado['saved']} gravadas, {resultado['deleted']} eliminadas)")
         
+        except GoalError as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f"Erro ao salvar metas: {e}")
         
-        return redirect(f"{reverse_lazy('gestao_metas')}?year={year}&month={month}")
+        return redirect(f"{reverse_lazy('gestao_metas')}?year={year}&month={month}&vista={vista}")
 
     try:
         selected_year_str = request.GET.get('year', str(today.year))
@@ -476,31 +323,49 @@ def gestao_metas(request):
         selected_month = today.month
         messages.error(request, f"Ano inválido recebido ('{selected_year_str}'). A carregar dados do mês atual.")
 
-    if request.user.role == User.Role.ADMIN:
-        consultants_list = User.objects.filter(role=User.Role.CONSULTANT).order_by('first_name')
-    else:
-        consultants_list = User.objects.filter(role=User.Role.CONSULTANT, manager=request.user).order_by('first_name')
-    
-    existing_goals = Goal.objects.filter(
-        year=selected_year,
-        month=selected_month,
-        user__in=consultants_list
-    )
-    
-    meta_map = {goal.user_id: goal.target_value for goal in existing_goals}
+    consultants_list = scope.filter_users(
+        User.objects.filter(role=User.Role.CONSULTANT)
+    ).order_by('first_name')
     
+    vista = 'ano' if request.GET.get('vista') == 'ano' else 'mes'
     consultant_data = []
-    for consultant in consultants_list:
-        goal = next((g for g in existing_goals if g.user_id == consultant.id), None)
+    grelha = []
+    
+    if vista == 'ano':
+        # Grelha consultor x 12 meses carregada com uma única query (pivot)
+        metas_ano = grelha_anual(consultants_list, selected_year)
+        vazio = [Decimal('0.0')] * 12
+        grelha = [
+            {'consultant': consultant, 'metas': list(zip(range(1, 13), metas_ano.get(consultant.id, vazio)))}
+            for consultant in consultants_list
+        ]
+    else:
+        goal_map = {
+            goal.user_id: goal
+            for goal in Goal.objects.filter(year=selected_year, month=selected_month, user__in=consultants_list)
+        }
+        facts_map = {
+            f.consultant_id: f
+            for f in scope.filter_facts(ConsultantMonthFact.objects.filter(year=selected_year, month=selected_month))
+        }
         
-        consultant_data.append({
-            'consultant': consultant,
-            'meta': meta_map.get(consultant.id, Decimal('0.0')),
-            'goal_id': goal.id if goal else None,
-        })
+        for consultant in consultants_list:
+            goal = goal_map.get(consultant.id)
+            fact = facts_map.get(consultant.id)
+            
+            consultant_data.append({
+                'consultant': consultant,
+                'meta': goal.target_value if goal else Decimal('0.0'),
+                'goal_id': goal.id if goal else None,
+                'realizado': fact.revenue_net if fact else Decimal('0.0'),
+                'atingido': fact.attainment if fact else Decimal('0.0'),
+            })
         
     context = {
         'consultant_data': consultant_data,
+        'grelha': grelha,
+        'vista': vista,
+        'meses_abrev': [calendar.month_abbr[i] for i in range(1, 13)],
         'selected_year_int': selected_year,
         'selected_month_int': selected_month,
         'selected_year_str': selected_year_str,
@@ -525,15 +390,16 @@ def eliminar_meta(request, goal_id):
     try:
         meta = Goal.objects.get(id=goal_id)
         
-        if request.user.role == User.Role.MANAGER:
-            if meta.user.manager != request.user:
-                messages.error(request, "Permissão negada.")
-                return redirect('gestao_metas')
+        if not get_data_scope(request).can_manage_user(meta.user_id):
+            messages.error(request, "Permissão negada.")
+            return redirect('gestao_metas')
         
         year = meta.year
         month = meta.month
         
-        meta.delete()
+        with transaction.atomic():
+            meta.delete()
+            atualizar_factos([(year, month)], consultant_ids=[meta.user_id])
         messages.success(request, "Meta eliminada com sucesso.")
         
         return redirect(f"{reverse_lazy('gestao_metas')}?year={year}&month={month}")
@@ -584,7 +450,7 @@ def carga_dados(request):
             messages.success(request, f'Sucesso! A importação do {file_type.capitalize()} foi iniciada. Os dados estarão disponíveis em alguns minutos.')
             
             try:
-                AuditLog.objects.create(
+                registar_auditoria(
                     user=request.user,
                     action="inicio_carga_csv",
                     details={"file_type": file_type, "filename": csv_file.name}
@@ -613,7 +479,7 @@ def carga_dados(request):
             messages.success(request, f'Sucesso! A sincronização da API {api_type.upper()} foi iniciada.')
 
             try:
-                AuditLog.objects.create(
+                registar_auditoria(
                     user=request.user,
                     action="inicio_carga_api",
                     details={"api_type": api_type, "start_date": start_date, "end_date": end_date}
@@ -624,13 +490,16 @@ def carga_dados(request):
         return redirect('carga_dados')
 
     try:
-        logs = AuditLog.objects.filter(
-            action__in=["inicio_carga_api", "fim_carga_api", "inicio_carga_csv", "fim_carga_csv", "falha_carga_api", "falha_carga_csv"]
-        ).order_by('-timestamp')[:5]
+        logs = AuditLog.objects.filter(action__in=ACOES_CARGA).select_related('user').order_by('-timestamp')[:5]
     except Exception as e:
         logs = []
         messages.warning(request, f"Não foi possível carregar o histórico de logs: {e}")
 
+    # Tarefas em segundo plano (atribuições em lote, reatribuição de vendas...)
+    jobs = BackgroundJob.objects.select_related('user').order_by('-created_at')
+    if request.user.role != User.Role.ADMIN:
+        jobs = jobs.filter(user=request.user)
+
     today = timezone.now().date()
     default_start = today.replace(day=1)
     
@@ -638,6 +507,7 @@ def carga_dados(request):
         'default_start_date': default_start.isoformat(),
         'default_end_date': today.isoformat(),
         'logs': logs, 
+        'jobs': jobs[:5],
     }
     
     return render(request, 'dashboard/carga_dados.html', context)
@@ -647,6 +517,9 @@ def carga_dados(request):
 # View 8: Detalhe do Cliente
 # ---
 @login_required
+@leitura_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_client_detail)
 def client_detail(request, cnpj):
     """
     Mostra um perfil detalhado de um cliente específico (Visão 360).
@@ -654,10 +527,10 @@ def client_detail(request, cnpj):
     client = get_object_or_404(Client, cnpj=cnpj)
     user = request.user
     
-    if user.role == User.Role.CONSULTANT and client.consultant != user:
+    if not get_data_scope(request).can_view_client(client):
+        if user.role == User.Role.MANAGER:
+            raise PermissionDenied("Este cliente não pertence à sua equipa.")
         raise PermissionDenied("Você não tem permissão para ver este cliente.")
-    if user.role == User.Role.MANAGER and client.manager != user:
-        raise PermissionDenied("Este cliente não pertence à sua equipa.")
     
     today = timezone.now().date()
     start_date_str = request.GET.get('start_date', today.replace(day=1).isoformat())
@@ -695,12 +568,10 @@ def client_detail(request, cnpj):
             net=Sum('revenue_net')
         )
         .order_by('month')
+        .values_list('month', 'tpv', 'net')
     )
     
-    line_chart_data = [
-        {"date": item['month'].isoformat(), "tpv": float(item['tpv']), "net": float(item['net'])} 
-        for item in trend_data
-    ]
+    line_chart_data = colunar(trend_data, [('date', 'date'), ('tpv', 'number'), ('net', 'number')])
     
     transactions = sales_qs.order_by('-date')[:100]
     
@@ -711,7 +582,7 @@ def client_detail(request, cnpj):
         'kpi_margin': kpi_margin,
         'kpi_total_sales': kpi_total_sales,
         'transactions': transactions,
-        'line_chart_json': json.dumps(line_chart_data, cls=DecimalEncoder),
+        'line_chart_json': dumps(line_chart_data).decode('utf-8'),
         
         'current_start_date': start_date.isoformat(),
         'current_end_date': end_date.isoformat(),
@@ -719,4 +590,326 @@ def client_detail(request, cnpj):
         'end_date_display': end_date.strftime('%d/%m/%Y'),
     }
     
-    return render(request, 'dashboard/client_detail.html', context)
\ No newline at end of file
+    return render(request, 'dashboard/client_detail.html', context)
+
+
+# ---
+# View 9: Estado de uma Tarefa em Segundo Plano
+# ---
+@login_required
+def api_estado_tarefa(request, job_id):
+    """
+    Devolve o progresso de uma tarefa em segundo plano (polling da interface).
+    Apenas o utilizador que a iniciou ou um admin a podem consultar.
+    """
+    job = get_object_or_404(BackgroundJob, id=job_id)
+    if request.user.role != User.Role.ADMIN and job.user_id != request.user.id:
+        raise PermissionDenied
+
+    return JsonResponse(job_status_payload(job))
+
+
+# ---
+# View 10: Relatório de Comissões (Equipa / Empresa)
+# ---
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN, User.Role.MANAGER])
+def relatorio_comissoes_view(request):
+    """
+    Receita e comissão por consultor num mês, com o total do âmbito.
+    Admins veem a empresa inteira; gestores veem a sua subárvore.
+    """
+    today = timezone.now().date()
+    scope = get_data_scope(request)
+
+    try:
+        selected_year = int(request.GET.get('year', today.year))
+        selected_month = int(request.GET.get('month', today.month))
+        # Dezembro usa datetime(ano + 1, 1, 1) como fim do mês (ver limites_do_mes)
+        if not 1 <= selected_month <= 12 or not 1 <= selected_year <= 9998:
+            raise ValueError
+    except ValueError:
+        selected_year, selected_month = today.year, today.month
+        messages.error(request, "Período inválido. A carregar dados do mês atual.")
+
+    report = relatorio_comissoes(selected_year, selected_month, scope)
+    consultores = User.objects.in_bulk(list(report['rows']))
+
+    linhas = sorted(
+        (
+            {
+                'consultant': consultores.get(consultant_id),
+                'revenue': values['revenue'],
+                'commission': values['commission'],
+            }
+            for consultant_id, values in report['rows'].items()
+        ),
+        key=lambda linha: linha['commission'],
+        reverse=True,
+    )
+
+    context = {
+        'linhas': linhas,
+        'total': report['total'],
+        'selected_year_str': str(selected_year),
+        'selected_month_str': str(selected_month),
+        'selected_month_name': calendar.month_name[selected_month],
+        'year_range': [str(y) for y in range(today.year - 2, today.year + 1)],
+        'month_range': [(str(i), calendar.month_name[i]) for i in range(1, 13)],
+    }
+    return render(request, 'dashboard/relatorio_comissoes.html', context)
+
+
+# ---
+# View 11: Exportações no Servidor (CSV / XLSX em streaming)
+# ---
+def _exportar(request, nome, header, rows, details=None):
+    """Resposta de download no formato de ?format= (csv por defeito), com registo no log."""
+    formato = request.GET.get('format', FORMATO_CSV)
+    registar_auditoria(user=request.user, action="exportacao", details={"export": nome, "format": formato, **(details or {})})
+    return resposta_exportacao(formato, nome, header, rows)
+
+
+@login_required
+@leitura_replica
+def exportar_vendas(request):
+    """Vendas do âmbito do utilizador com os filtros do Dashboard Geral."""
+    start_date, end_date = periodo_normalizado(request)
+    vendas, _ = vendas_dashboard(
+        get_data_scope(request), start_date, end_date,
+        products=request.GET.getlist('products[]'),
+        consultants=request.GET.getlist('consultants[]'),
+        today=timezone.now().date(),
+    )
+    header, rows = exportacao_vendas(vendas)
+    periodo = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+    return _exportar(request, f"vendas_{start_date:%Y%m%d}_{end_date:%Y%m%d}", header, rows, periodo)
+
+
+@login_required
+@leitura_replica
+def exportar_desempenho_clientes(request):
+    """Clientes da carteira/equipa com a receita no período (Minha Carteira)."""
+    start_date, end_date = periodo_normalizado(request)
+    clientes = get_data_scope(request).filter_clients(Client.objects.all())
+    header, rows = exportacao_desempenho_clientes(clientes, start_date, end_date)
+    periodo = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+    return _exportar(request, f"clientes_{start_date:%Y%m%d}_{end_date:%Y%m%d}", header, rows, periodo)
+
+
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN, User.Role.MANAGER])
+@leitura_replica
+def exportar_orfaos(request):
+    """Clientes órfãos (vendas sem consultor), como em Atribuir Clientes."""
+    header, rows = exportacao_orfaos()
+    return _exportar(request, "clientes_orfaos", header, rows)
+
+
+# ---
+# View 12: Auditoria (Admin)
+# ---
+def _data_ou_none(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN])
+@leitura_replica
+def auditoria(request):
+    """Registos de auditoria com filtros e paginação keyset (?cursor=)."""
+    filtros = {
+        'action': request.GET.get('action', ''),
+        'user': request.GET.get('user', ''),
+        'start_date': request.GET.get('start_date', ''),
+        'end_date': request.GET.get('end_date', ''),
+        **{key: request.GET.get(key, '') for key in FILTROS_DETALHES},
+    }
+    logs = filtrar_auditoria(
+        AuditLog.objects.select_related('user'),
+        action=filtros['action'],
+        user_id=filtros['user'] if filtros['user'].isdigit() else None,
+        start=_data_ou_none(filtros['start_date']),
+        end=_data_ou_none(filtros['end_date']),
+        details={key: filtros[key] for key in FILTROS_DETALHES},
+    )
+    entries, next_cursor = pagina_auditoria(logs, request.GET.get('cursor'))
+
+    context = {
+        'logs': entries,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'filtros': filtros,
+        # Parâmetros dos filtros, para os links de paginação
+        'filter_query': urlencode({k: v for k, v in filtros.items() if v}),
+        'acoes': ACOES,
+        'users': User.objects.order_by('email').only('id', 'email'),
+    }
+    return render(request, 'dashboard/auditoria.html', context)
+
+
+# ---
+# View 13: Métricas (Prometheus)
+# ---
+def _token_metricas_valido(request):
+    token = getattr(settings, 'DASHBOARD_METRICS_TOKEN', None)
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")
+
+
+def _resposta_metricas():
+    return HttpResponse(
+        texto_prometheus(registo_agregado()) + texto_importacoes(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN])
+def _metricas_admin(request):
+    return _resposta_metricas()
+
+
+def metricas(request):
+    """Métricas dos pedidos (ver dashboard/metrics.py): administradores ou scraper com token."""
+    if _token_metricas_valido(request):
+        return _resposta_metricas()
+    return _metricas_admin(request)
+
+
+# ---
+# View 14: Perfis de Pedidos (Admin)
+# ---
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN])
+def perfis(request):
+    """Perfis gravados e geração de links assinados (ver dashboard/profiler.py)."""
+    link = None
+    if request.method == 'POST':
+        path = request.POST.get('path', '').strip() or '/'
+        mode = request.POST.get('mode')
+        alvo = None
+        if request.POST.get('user'):
+            alvo = User.objects.filter(id=request.POST['user']).first()
+        if mode not in MODOS or not path.startswith('/') or path.startswith('//'):
+            messages.error(request, "Indique um caminho (p.ex. /minha-carteira/) e um modo.")
+        else:
+            token = gerar_link_perfil(request.user, mode, alvo)
+            separador = '&' if '?' in path else '?'
+            link = request.build_absolute_uri(f"{path}{separador}{urlencode({PARAMETRO: token})}")
+
+    context = {
+        'perfis': ProfileArtifact.objects.select_related('user', 'requested_by').defer(
+            'pstats', 'collapsed_stacks', 'sql_timeline', 'summary'
+        )[:100],
+        'link': link,
+        'modos': ProfileArtifact.Mode.choices,
+        'users': User.objects.filter(is_active=True).order_by('email').only('id', 'email'),
+        'validade_minutos': PROFILER_TOKEN_MAX_AGE // 60,
+        'ativo': getattr(settings, 'DASHBOARD_PROFILER', False),
+    }
+    return render(request, 'dashboard/perfis.html', context)
+
+
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN])
+def perfil_detalhe(request, pk):
+    perfil = get_object_or_404(ProfileArtifact.objects.select_related('user', 'requested_by'), pk=pk)
+    fim = max((q['start_ms'] + q['duration_ms'] for q in perfil.sql_timeline), default=0)
+    escala = max(perfil.duration_ms, fim) or 1
+    # Posição e largura (% da duração do pedido) de cada query na linha temporal
+    timeline = [
+        {**q, 'left': q['start_ms'] * 100 / escala, 'width': max(q['duration_ms'] * 100 / escala, 0.2)}
+        for q in perfil.sql_timeline
+    ]
+    return render(request, 'dashboard/perfil_detalhe.html', {'perfil': perfil, 'timeline': timeline})
+
+
+@login_required
+@role_required(allowed_roles=[User.Role.ADMIN])
+def perfil_download(request, pk, kind):
+    """pstats (snakeviz, pstats.Stats) ou pilhas 'collapsed' (flamegraph.pl, speedscope)."""
+    perfil = get_object_or_404(ProfileArtifact, pk=pk)
+    if kind == 'pstats' and perfil.pstats:
+        response = HttpResponse(bytes(perfil.pstats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="perfil-{perfil.pk}.pstats"'
+    elif kind == 'flamegraph' and perfil.collapsed_stacks:
+        response = HttpResponse(perfil.collapsed_stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="perfil-{perfil.pk}.collapsed.txt"'
+    else:
+        raise Http404
+    return response
+
+
+# ---
+# View 15: Análise Histórica (Parquet + DuckDB)
+# ---
+# Lê os ficheiros Parquet exportados (ver dashboard/analytics.py): do
+# PostgreSQL só vêm a sessão e o âmbito do utilizador.
+ANALISE_LIMITE_MAXIMO = 500
+
+
+def _resposta_analise(request, consulta, fields):
+    """Executa a consulta com os filtros comuns e devolve a tabela no formato pedido."""
+    start_date, end_date = periodo_historico(request)
+    filtros = {campo: request.GET.getlist(f'{campo}[]') for campo in DIMENSOES}
+    # products[] como no Dashboard Geral (fontes)
+    filtros['source'] = filtros['source'] or request.GET.getlist('products[]')
+    try:
+        rows, manifesto = consulta(
+            get_data_scope(request), start_date, end_date,
+            consultants=request.GET.getlist('consultants[]'), filtros=filtros,
+        )
+    except AnaliseIndisponivel as e:
+        return JsonResponse({'errors': [str(e)]}, status=503)
+    except ValueError as e:
+        return JsonResponse({'errors': [str(e)]}, status=400)
+    return FastJsonResponse({
+        'start_date': start_date, 'end_date': end_date,
+        'exported_at': manifesto['exported_at'],
+        'data': tabela(formato_pedido(request), rows, fields),
+    })
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+def api_analise_tendencia(request):
+    """
+    Tendência de longo prazo (por defeito os últimos 5 anos, por mês).
+    ?granularity=month|quarter|year, ?start_date, ?end_date, products[],
+    consultants[] e <dimensão>[] (p.ex. payment_type[]=Pix).
+    """
+    granularidade = request.GET.get('granularity', 'month')
+    return _resposta_analise(
+        request,
+        lambda *args, **kwargs: tendencia_historica(*args, granularidade=granularidade, **kwargs),
+        [('period', 'date'), *CAMPOS_METRICAS],
+    )
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+def api_analise_decomposicao(request):
+    """
+    Decomposição por ?by=product_name|payment_type|source|status|product_detail
+    (os ?limit= valores com mais receita, 50 por defeito), no total do período
+    ou por período com ?granularity=. Mesmos filtros da tendência.
+    """
+    dimensao = request.GET.get('by', 'product_name')
+    granularidade = request.GET.get('granularity') or None
+    try:
+        limite = min(max(int(request.GET.get('limit', 50)), 1), ANALISE_LIMITE_MAXIMO)
+    except ValueError:
+        return JsonResponse({'errors': ['limit inválido.']}, status=400)
+    fields = [(dimensao, 'string'), *CAMPOS_METRICAS]
+    if granularidade:
+        fields.insert(0, ('period', 'date'))
+    return _resposta_analise(
+        request,
+        lambda *args, **kwargs: decomposicao_historica(
+            *args, dimensao=dimensao, granularidade=granularidade, limite=limite, **kwargs
+        ),
+        fields,
+    )
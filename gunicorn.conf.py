@@ -0,0 +1,42 @@
+# Configuração do gunicorn (carregada automaticamente a partir da raiz do projeto).
+# Variáveis de ambiente: PORT, WEB_CONCURRENCY, GUNICORN_THREADS,
+# GUNICORN_WORKER_CLASS (gthread | sync | uvicorn.workers.UvicornWorker),
+# GUNICORN_TIMEOUT. Ver README, secção 4 (Perfil de produção).
+
+import os
+
+from config.serving import workers_threads
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers, threads = workers_threads()
+
+# Workers ASGI (uvicorn) servem o config.asgi (inclui a API async do dashboard)
+if worker_class.startswith('uvicorn'):
+    wsgi_app = 'config.asgi:application'
+else:
+    wsgi_app = 'config.wsgi:application'
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla os workers periodicamente (limita o crescimento de memória)
+max_requests = 1000
+max_requests_jitter = 100
+
+# Carrega a aplicação antes do fork: arranque mais rápido e memória partilhada.
+# As ligações à base de dados só são abertas depois, em cada worker.
+preload_app = True
+
+
+# Métricas por worker (settings.DASHBOARD_METRICS_DIR): recomeçam a cada
+# arranque e os registos dos workers reciclados são somados num só ficheiro
+def on_starting(server):
+    from dashboard.metrics import limpar_registos
+    limpar_registos()
+
+
+def child_exit(server, worker):
+    from dashboard.metrics import arquivar_processo
+    arquivar_processo(worker.pid)